@@ -2,10 +2,22 @@
 import flet as ft
 import sys
 import os
-import json
-from datetime import datetime
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+import registro_eventos
+from cache_predicciones import CachePredicciones
+from indice_similares import VECINOS, abrir_indice, clave_texto, metadatos_fila
+from modelo_fisuras import ClasificadorFisuras
+from modelo_rapido import CONFIANZA_MINIMA, cargar_cascada
+from servicio_inferencia import ClienteInferencia
+
+# Con FISURAS_PRECALENTAR=0 el modelo propio se carga recién en el primer análisis
+PRECALENTAR = os.environ.get("FISURAS_PRECALENTAR", "1") != "0"
 
 def main(page: ft.Page):
+    inicio_aplicacion = time.perf_counter()
+
     # Recibir el nombre de usuario si fue pasado desde el login
     if len(sys.argv) > 1:
         nombre_usuario = sys.argv[1]
@@ -19,110 +31,202 @@ def main(page: ft.Page):
     page.bgcolor = ft.Colors.WHITE
 
     # Función para registrar búsquedas
-    def registrar_busqueda(descripcion, resultado, probabilidad):
+    def registrar_busqueda(descripcion, resultado, probabilidades):
         """Registra una búsqueda en el sistema de logs"""
         try:
-            archivo_log = "sistema_logs.json"
-            
-            # Leer logs existentes
-            if os.path.exists(archivo_log):
-                with open(archivo_log, 'r', encoding='utf-8') as f:
-                    logs = json.load(f)
-            else:
-                logs = []
-            
-            # Crear detalles de la búsqueda
-            detalles = json.dumps({
-                "descripcion": descripcion,
-                "resultado": resultado,
-                "probabilidad": f"{probabilidad:.2%}" if probabilidad else "N/A"
-            }, ensure_ascii=False)
-            
-            # Crear nuevo evento
-            evento = {
-                "usuario": nombre_usuario,
-                "tipo": "busqueda",
-                "detalles": detalles,
-                "fecha": datetime.now().strftime("%Y-%m-%d"),
-                "hora": datetime.now().strftime("%H:%M:%S"),
-                "timestamp": datetime.now().isoformat()
-            }
-            
-            logs.append(evento)
-            
-            # Guardar logs actualizados
-            with open(archivo_log, 'w', encoding='utf-8') as f:
-                json.dump(logs, f, indent=2, ensure_ascii=False)
-                
+            registro_eventos.registrar_busqueda(
+                nombre_usuario, descripcion, resultado, probabilidades, version_modelo
+            )
         except Exception as e:
             print(f"Error al registrar búsqueda: {e}")
 
-    # Variables para el modelo (se cargan solo cuando sea necesario)
-    modelo_cargado = False
-    tokenizer = None
-    model = None
+    # Si el servicio local de inferencia está corriendo se usa su modelo; si no,
+    # el modelo se carga y precalienta en segundo plano al abrir la ventana
+    servicio = ClienteInferencia()
+    usar_servicio = False
+    servicio_comprobado = threading.Event()
+    clasificador = ClasificadorFisuras()
+    version_modelo = None
+    # Predicciones ya hechas, en esta sesión o en anteriores, con la misma versión del modelo
+    cache_predicciones = CachePredicciones()
+    # Primera etapa de la cascada: responde sin el transformer las descripciones fáciles
+    modelo_rapido = cargar_cascada()
+    # Casos etiquetados más parecidos al analizado (None si no se construyó el índice)
+    indice_similares = abrir_indice()
+    primer_resultado_medido = False
     
     # Variable para almacenar el historial de descripciones
     historial_descripciones = []
 
+    # Las clasificaciones corren de a una fuera del manejador del clic; solo
+    # se muestra el resultado de la última solicitud
+    ejecutor_clasificacion = ThreadPoolExecutor(max_workers=1, thread_name_prefix="clasificacion")
+    solicitud_actual = {"numero": 0, "futuro": None, "texto": None}
+    # RLock: cancel() ejecuta en el mismo hilo el callback de la solicitud cancelada
+    bloqueo_solicitud = threading.RLock()
+
+    # Estado de carga del modelo, visible debajo del botón de análisis
+    indicador_carga = ft.ProgressRing(width=16, height=16, stroke_width=2)
+    estado_modelo = ft.Text(
+        "⏳ Preparando modelo...",
+        size=12,
+        color=ft.Colors.GREY_600
+    )
+
     def cargar_modelo():
         """Carga el modelo solo cuando sea necesario"""
-        nonlocal modelo_cargado, tokenizer, model
-        try:
-            # Importar aquí para evitar cargarlos al inicio
-            from transformers import AutoTokenizer, AutoModelForSequenceClassification
-            import torch
-
-            modelo_path = "./fisuras_classifier"
-            if os.path.exists(modelo_path):
-                tokenizer = AutoTokenizer.from_pretrained(modelo_path)
-                model = AutoModelForSequenceClassification.from_pretrained(modelo_path)
-                modelo_cargado = True
-                return True
-            else:
-                print(f"Modelo no encontrado en: {modelo_path}")
-                return False
-        except Exception as e:
-            print(f"Error cargando modelo: {e}")
+        nonlocal version_modelo
+        if not clasificador.cargar():
             return False
+        version_modelo = clasificador.version
+        return True
+
+    def modelo_precalentado(ok):
+        """Muestra el resultado del precalentamiento"""
+        nonlocal version_modelo
+        indicador_carga.visible = False
+        if ok:
+            version_modelo = clasificador.version
+            segundos = sum(clasificador.tiempos.values())
+            estado_modelo.value = f"✅ Modelo listo ({segundos:.1f} s)"
+            estado_modelo.color = ft.Colors.GREEN_700
+        else:
+            estado_modelo.value = "❌ Modelo no disponible"
+            estado_modelo.color = ft.Colors.RED_700
+        page.update()
+
+    def preparar_modelo():
+        """Busca el servicio de inferencia y, si no está, precalienta el modelo propio"""
+        nonlocal usar_servicio, version_modelo
+        estado = servicio.estado()
+        usar_servicio = estado is not None and not estado.get("error")
+        servicio_comprobado.set()
+        if usar_servicio:
+            version_modelo = estado.get("version")
+            indicador_carga.visible = False
+            estado_modelo.value = "✅ Usando el servicio de inferencia local"
+            estado_modelo.color = ft.Colors.GREEN_700
+            page.update()
+        elif PRECALENTAR:
+            modelo_precalentado(clasificador.calentar())
+        else:
+            indicador_carga.visible = False
+            estado_modelo.value = "El modelo se cargará en el primer análisis"
+            page.update()
+
+    def clasificar_con_servicio(texto):
+        """Clasifica con el servicio; None si dejó de responder y hay que usar el modelo propio"""
+        nonlocal usar_servicio, version_modelo
+        try:
+            resultado = servicio.clasificar(texto)
+        except (OSError, ValueError, KeyError) as e:
+            print(f"Servicio de inferencia no disponible, se usa el modelo local: {e}")
+            usar_servicio = False
+            return None
+        version_modelo = servicio.version
+        return resultado
+
+    def medir_primer_resultado(inicio_clic):
+        """Informa por consola el tiempo hasta el primer resultado de la sesión"""
+        nonlocal primer_resultado_medido
+        if primer_resultado_medido:
+            return
+        primer_resultado_medido = True
+        ahora = time.perf_counter()
+        if usar_servicio:
+            origen = "servicio local"
+        else:
+            origen = f"carga {clasificador.tiempos.get('carga', 0):.2f} s"
+        print(
+            f"Primer resultado: {ahora - inicio_clic:.2f} s desde el clic, "
+            f"{ahora - inicio_aplicacion:.2f} s desde el inicio "
+            f"(precalentamiento {'activado' if PRECALENTAR else 'desactivado'}, {origen})"
+        )
 
     # Función para clasificar fisura
     def clasificar_fisura(texto):
+        nonlocal version_modelo
         if not texto or not texto.strip():
             return None, None, None
+        inicio_clic = time.perf_counter()
 
-        # Cargar modelo si no está cargado
-        if not modelo_cargado:
-            if not cargar_modelo():
-                return None, None, None
+        # Si el modelo rápido está suficientemente seguro no se escala al transformer
+        if modelo_rapido is not None:
+            resultado = modelo_rapido.clasificar_confiado(texto)
+            if resultado is not None:
+                version_modelo = modelo_rapido.version
+                medir_primer_resultado(inicio_clic)
+                return resultado
 
-        try:
-            import torch
+        # Un clic muy temprano espera a saber si hay servicio antes de cargar otra copia del modelo
+        servicio_comprobado.wait(timeout=2)
 
-            # Tokenizar el texto
-            inputs = tokenizer(texto, return_tensors="pt", truncation=True, padding=True, max_length=128)
+        # Un texto ya clasificado con esta versión no necesita el modelo
+        version = servicio.version if usar_servicio else clasificador.version_en_disco()
+        if version:
+            en_cache = cache_predicciones.obtener(texto, version)
+            if en_cache is not None:
+                version_modelo = version
+                medir_primer_resultado(inicio_clic)
+                return en_cache
 
-            # Realizar predicción
-            with torch.no_grad():
-                outputs = model(**inputs)
-                predictions = torch.nn.functional.softmax(outputs.logits, dim=-1)
+        if usar_servicio:
+            resultado = clasificar_con_servicio(texto)
+            if resultado is not None:
+                cache_predicciones.guardar(texto, servicio.version, resultado)
+                medir_primer_resultado(inicio_clic)
+                return resultado
 
-            # Obtener probabilidades (ajusta índices según tu modelo)
-            prob_arrufo = float(predictions[0][0].item())
-            prob_puntual = float(predictions[0][1].item())
+        # Cargar modelo si no está cargado; si se está precalentando, se espera a que termine
+        if not clasificador.cargado:
+            indicador_carga.visible = True
+            estado_modelo.value = "⏳ Esperando a que termine de cargar el modelo..."
+            page.update()
+            cargado = cargar_modelo()
+            indicador_carga.visible = False
+            if not cargado:
+                estado_modelo.value = "❌ Modelo no disponible"
+                estado_modelo.color = ft.Colors.RED_700
+                return None, None, None
+            estado_modelo.value = "✅ Modelo listo"
+            estado_modelo.color = ft.Colors.GREEN_700
 
-            # Determinar clase
-            if prob_arrufo > prob_puntual:
-                clase = "arrufo"
-                probabilidad = prob_arrufo
-            else:
-                clase = "puntual"
-                probabilidad = prob_puntual
+        resultado = clasificador.clasificar(texto)
+        # Una respuesta anterior del modelo rápido dejó su versión: se registra la del transformer
+        version_modelo = clasificador.version
+        cache_predicciones.guardar(texto, clasificador.version, resultado)
+        medir_primer_resultado(inicio_clic)
+        return resultado
 
-            return clase, probabilidad, {"arrufo": prob_arrufo, "puntual": prob_puntual}
+    def buscar_similares(texto, clase_registrada=None):
+        """Vecinos de texto en el índice; con clase_registrada, además agrega la búsqueda al índice"""
+        nonlocal indice_similares
+        if indice_similares is None:
+            return None
+        try:
+            if usar_servicio:
+                vector = servicio.embeddings([texto])[0]
+                version = servicio.version
+            else:
+                if not cargar_modelo():
+                    return None
+                vector = clasificador.embeddings([texto])[0]
+                version = clasificador.version
+            # Vectores de otra versión del modelo no son comparables
+            if version != indice_similares.version_modelo:
+                print(f"Índice de casos similares desactualizado ({indice_similares.version_modelo}, "
+                      f"modelo {version}): python indice_similares.py construir")
+                indice_similares = None
+                return None
+            vecinos = indice_similares.buscar(vector, VECINOS, excluir={clave_texto(texto)})
+            if clase_registrada:
+                indice_similares.agregar([vector], [metadatos_fila({clase_registrada: 1}, texto, "busqueda")])
+            return vecinos
         except Exception as e:
-            print(f"Error en clasificación: {e}")
-            return None, None, None
+            # Backend sin embeddings (ONNX) o índice ilegible: no se vuelve a intentar en esta sesión
+            print(f"Error buscando casos similares: {e}")
+            indice_similares = None
+            return None
 
     # Función para crear un gráfico de pastel personalizado
     def crear_pie_chart(probabilidades):
@@ -264,6 +368,9 @@ def main(page: ft.Page):
         import time
         time.sleep(0.5)
         
+        # Los contadores de la caché que todavía no se guardaron
+        cache_predicciones.cerrar()
+
         # Cerrar completamente la ventana actual
         page.window_destroy()
 
@@ -312,6 +419,28 @@ def main(page: ft.Page):
         
         # Variable para la tarjeta del chat (se asignará después)
         chat_card = None
+
+        # Casos similares del índice, debajo de los resultados
+        lista_similares = ft.Column(controls=[], spacing=8)
+        similares_card = ft.Card(
+            content=ft.Container(
+                content=ft.Column(
+                    controls=[
+                        ft.Text(
+                            "📚 Casos similares conocidos",
+                            size=18,
+                            weight=ft.FontWeight.BOLD,
+                            color=ft.Colors.BLACK87
+                        ),
+                        lista_similares,
+                    ],
+                    spacing=10
+                ),
+                padding=20
+            ),
+            margin=ft.margin.only(top=20),
+            visible=False
+        )
         
         # Campo de texto para mejorar la descripción
         texto_mejora = ft.TextField(
@@ -362,8 +491,113 @@ def main(page: ft.Page):
                 chat_card.visible = True
             page.update()
 
+        def mostrar_en_curso(en_curso):
+            """Deshabilita los botones de análisis mientras hay una clasificación en curso"""
+            boton_analizar.disabled = en_curso
+            boton_enviar_mejora.disabled = en_curso
+            indicador_analisis.visible = en_curso
+            page.update()
+
+        def clasificacion_en_curso():
+            futuro = solicitud_actual["futuro"]
+            return futuro is not None and not futuro.done()
+
+        def clasificar_en_segundo_plano(texto, al_terminar):
+            """Clasifica en el ejecutor; al_terminar(resultado) solo se llama si sigue siendo la última solicitud"""
+            with bloqueo_solicitud:
+                # Un doble clic con el mismo texto no encola otra clasificación
+                if clasificacion_en_curso() and solicitud_actual["texto"] == texto:
+                    return
+                solicitud_actual["numero"] += 1
+                numero = solicitud_actual["numero"]
+                # Una solicitud anterior que todavía no empezó ya no hace falta
+                anterior = solicitud_actual["futuro"]
+                if anterior is not None:
+                    anterior.cancel()
+                futuro = ejecutor_clasificacion.submit(clasificar_fisura, texto)
+                solicitud_actual["futuro"] = futuro
+                solicitud_actual["texto"] = texto
+            mostrar_en_curso(True)
+
+            def terminar(futuro):
+                with bloqueo_solicitud:
+                    if futuro.cancelled() or numero != solicitud_actual["numero"]:
+                        # Reemplazada por una solicitud más nueva: se descarta
+                        return
+                try:
+                    resultado = futuro.result()
+                except (CancelledError, Exception) as e:
+                    print(f"Error en clasificación: {e}")
+                    resultado = (None, None, None)
+                try:
+                    al_terminar(resultado)
+                finally:
+                    mostrar_en_curso(False)
+
+            futuro.add_done_callback(terminar)
+
+        def crear_fila_similar(similitud, caso):
+            """Fila de un caso similar con sus etiquetas, su texto y la similitud"""
+            # Índices anteriores solo guardaban una etiqueta por texto
+            etiquetas = caso.get("etiquetas") or {caso["etiqueta"]: 1}
+            texto = caso["texto"] if len(caso["texto"]) <= 160 else caso["texto"][:160] + "..."
+            detalle = f"Similitud: {similitud:.0%}"
+            if caso["origen"] == "busqueda":
+                # Las búsquedas registradas tienen la clase predicha, no una etiqueta revisada
+                detalle += " (predicción)"
+            elif len(etiquetas) > 1:
+                detalle += " · el mismo texto está etiquetado con ambas clases"
+            insignias = [
+                ft.Container(
+                    # Con etiquetas mezcladas se indica cuántas veces aparece con cada una
+                    content=ft.Text(etiqueta.upper() if len(etiquetas) == 1 else f"{etiqueta.upper()} ×{veces}",
+                                    size=11, weight=ft.FontWeight.BOLD, color=ft.Colors.WHITE),
+                    bgcolor=ft.Colors.RED_700 if etiqueta == "arrufo" else ft.Colors.BLUE_700,
+                    border_radius=5,
+                    padding=ft.padding.symmetric(horizontal=8, vertical=4)
+                )
+                for etiqueta, veces in sorted(etiquetas.items(), key=lambda par: -par[1])
+            ]
+            return ft.Container(
+                content=ft.Row([
+                    ft.Column(insignias, spacing=4),
+                    ft.Column([
+                        ft.Text(texto, size=12, color=ft.Colors.BLACK87),
+                        ft.Text(detalle, size=11, color=ft.Colors.GREY_600)
+                    ], spacing=2, expand=True)
+                ], vertical_alignment=ft.CrossAxisAlignment.START),
+                padding=10,
+                bgcolor=ft.Colors.GREY_50,
+                border_radius=8
+            )
+
+        def mostrar_similares(texto, clase_registrada=None):
+            """Busca en el ejecutor los casos similares a texto y los muestra si no hubo otra solicitud"""
+            if indice_similares is None:
+                return
+            numero = solicitud_actual["numero"]
+
+            def buscar():
+                # Un análisis más nuevo ya no necesita estos vecinos
+                if numero != solicitud_actual["numero"]:
+                    return None
+                return buscar_similares(texto, clase_registrada)
+
+            def terminar(futuro):
+                if futuro.cancelled() or numero != solicitud_actual["numero"]:
+                    return
+                vecinos = futuro.result()
+                similares_card.visible = bool(vecinos)
+                lista_similares.controls = [crear_fila_similar(similitud, caso) for similitud, caso in vecinos or []]
+                page.update()
+
+            ejecutor_clasificacion.submit(buscar).add_done_callback(terminar)
+
         def procesar_mejora(e):
             """Procesa la descripción mejorada"""
+            # Cada mejora se suma a la anterior: no se acepta otra hasta tener su resultado
+            if clasificacion_en_curso():
+                return
             mejora = texto_mejora.value.strip()
             
             if not mejora:
@@ -386,11 +620,18 @@ def main(page: ft.Page):
             # Agregar mensaje del usuario al chat
             agregar_mensaje_chat(f"Descripción mejorada: {mejora}", es_sistema=False)
             
-            # Clasificar con la descripción mejorada
-            clase, probabilidad, probabilidades = clasificar_fisura(descripcion_completa)
+            # Clasificar con la descripción mejorada sin bloquear la ventana
+            clasificar_en_segundo_plano(
+                descripcion_completa,
+                lambda resultado: mostrar_mejora(descripcion_completa, resultado)
+            )
+
+        def mostrar_mejora(descripcion_completa, resultado):
+            """Muestra el resultado de la descripción mejorada"""
+            clase, probabilidad, probabilidades = resultado
             
             if clase:
-                if probabilidad < 0.90:
+                if probabilidad < CONFIANZA_MINIMA:
                     # Aún es baja la confianza
                     agregar_mensaje_chat(
                         f"Recibí tu descripción. La confianza es del {probabilidad:.1%}. "
@@ -400,6 +641,7 @@ def main(page: ft.Page):
                         es_sistema=True
                     )
                     texto_mejora.value = ""
+                    mostrar_similares(descripcion_completa)
                 else:
                     # Confianza suficiente
                     agregar_mensaje_chat(
@@ -437,7 +679,8 @@ def main(page: ft.Page):
                         chat_card.visible = False
                     
                     # Registrar búsqueda
-                    registrar_busqueda(descripcion_completa, clase, probabilidad)
+                    registrar_busqueda(descripcion_completa, clase, probabilidades)
+                    mostrar_similares(descripcion_completa, clase)
             
             page.update()
         
@@ -463,13 +706,18 @@ def main(page: ft.Page):
             chat_container.visible = False
             if chat_card:
                 chat_card.visible = False
+            similares_card.visible = False
 
-            # Clasificar
-            clase, probabilidad, probabilidades = clasificar_fisura(descripcion)
+            # Clasificar sin bloquear la ventana
+            clasificar_en_segundo_plano(descripcion, lambda resultado: mostrar_analisis(descripcion, resultado))
+
+        def mostrar_analisis(descripcion, resultado):
+            """Muestra el resultado del análisis"""
+            clase, probabilidad, probabilidades = resultado
 
             if clase:
                 # Verificar si la confianza es menor al 90%
-                if probabilidad < 0.90:
+                if probabilidad < CONFIANZA_MINIMA:
                     # Mostrar mensaje de chatbot
                     agregar_mensaje_chat(
                         f"He analizado tu descripción y la confianza es del {probabilidad:.1%}. "
@@ -491,6 +739,7 @@ def main(page: ft.Page):
                     
                     pie_chart_container.visible = False
                     leyenda_container.visible = False
+                    mostrar_similares(descripcion)
                     
                 else:
                     # Confianza suficiente
@@ -523,7 +772,8 @@ def main(page: ft.Page):
                         chat_card.visible = False
 
                     # **REGISTRAR LA BÚSQUEDA EN EL SISTEMA**
-                    registrar_busqueda(descripcion, clase, probabilidad)
+                    registrar_busqueda(descripcion, clase, probabilidades)
+                    mostrar_similares(descripcion, clase)
 
             else:
                 resultado_texto.value = "Error al clasificar"
@@ -549,6 +799,12 @@ def main(page: ft.Page):
             height=50,
         )
 
+        indicador_analisis = ft.Row(
+            [ft.ProgressRing(width=16, height=16, stroke_width=2), ft.Text("Analizando...", size=12)],
+            spacing=8,
+            visible=False
+        )
+
         return ft.Container(
             content=ft.Column(
                 controls=[
@@ -564,7 +820,8 @@ def main(page: ft.Page):
                                         color=ft.Colors.BLACK87
                                     ),
                                     texto_fisura,
-                                    boton_analizar,
+                                    ft.Row([boton_analizar, indicador_analisis], spacing=15),
+                                    ft.Row([indicador_carga, estado_modelo], spacing=8),
                                 ],
                                 spacing=15
                             ),
@@ -625,6 +882,9 @@ def main(page: ft.Page):
                             padding=20
                         )
                     ),
+
+                    # Casos similares (visible cuando hay índice y vecinos)
+                    similares_card,
                     
                     # Sección de Chat (visible solo cuando se necesita mejorar)
                     chat_card := ft.Card(
@@ -772,5 +1032,7 @@ def main(page: ft.Page):
         )
     )
 
+    threading.Thread(target=preparar_modelo, daemon=True).start()
+
 if __name__ == "__main__":
     ft.app(target=main)
\ No newline at end of file
@@ -0,0 +1,277 @@
+# agregados_logs.py
+# Contadores materializados del log (eventos por tipo, accesos y búsquedas por
+# usuario, resultados y suma de confianza por clase). Se guardan junto al log
+# con la posición que cubren (offset del JSONL o último id de SQLite), así que
+# al abrir el panel o generar un reporte solo se procesan los eventos
+# posteriores.
+#
+# Junto a los contadores se mantienen series de actividad por hora y por día
+# (accesos, accesos fallidos, búsquedas y resultados, en total y por usuario)
+# para los gráficos del panel y del reporte.
+import json
+import os
+from collections import Counter
+from datetime import datetime, timedelta
+
+import registro_eventos
+from modelo_logs import crear_cursor
+
+TIPOS_ACCESO = ('login_admin', 'login_usuario')
+
+METRICAS = ('accesos', 'fallidos', 'busquedas', 'arrufo', 'puntual')
+
+# Horas que se conservan en la serie horaria (la diaria se conserva completa)
+HORAS_RETENIDAS = 24 * 14
+
+# Clave de los totales de cada intervalo dentro de una serie
+TOTAL = "*"
+
+
+def ruta_agregados(archivo=registro_eventos.ARCHIVO_EVENTOS):
+    """Ruta del archivo de agregados que acompaña al log"""
+    return os.path.splitext(archivo)[0] + ".agregados.json"
+
+
+class ContadoresLogs:
+    """Contadores de eventos que se pueden guardar y restar entre sí"""
+
+    CAMPOS = ('por_tipo', 'accesos_por_usuario', 'busquedas_por_usuario',
+              'resultados', 'confianza_por_resultado')
+
+    def __init__(self, datos=None):
+        self.reiniciar()
+        if datos is not None:
+            self.desde_dict(datos)
+
+    def reiniciar(self):
+        self.por_tipo = Counter()
+        self.accesos_por_usuario = Counter()
+        self.busquedas_por_usuario = Counter()
+        self.resultados = Counter()
+        self.confianza_por_resultado = Counter()
+
+    @property
+    def total_accesos(self):
+        return sum(self.por_tipo[tipo] for tipo in TIPOS_ACCESO)
+
+    @property
+    def total_busquedas(self):
+        return self.por_tipo['busqueda']
+
+    @property
+    def usuarios_activos(self):
+        return len(self.accesos_por_usuario)
+
+    def confianza_promedio(self, resultado):
+        """Confianza media de las búsquedas clasificadas como `resultado`"""
+        cantidad = self.resultados[resultado]
+        return self.confianza_por_resultado[resultado] / cantidad if cantidad else None
+
+    def agregar(self, eventos):
+        """Suma eventos a los contadores; devuelve cuántos se sumaron"""
+        cantidad = 0
+        for evento in eventos:
+            cantidad += 1
+            tipo = evento.get('tipo')
+            usuario = evento.get('usuario')
+            self.por_tipo[tipo] += 1
+            if tipo in TIPOS_ACCESO:
+                self.accesos_por_usuario[usuario] += 1
+            elif tipo == 'busqueda':
+                self.busquedas_por_usuario[usuario] += 1
+                resultado = evento.get('resultado', 'desconocido')
+                self.resultados[resultado] += 1
+                probabilidad = registro_eventos.probabilidad_busqueda(evento)
+                if probabilidad is not None:
+                    self.confianza_por_resultado[resultado] += probabilidad
+        return cantidad
+
+    def descontar(self, eventos):
+        """Resta eventos que se eliminaron del historial; devuelve cuántos se restaron"""
+        quitados = ContadoresLogs()
+        cantidad = quitados.agregar(eventos)
+        for campo in self.CAMPOS:
+            restado = getattr(self, campo)
+            restado.subtract(getattr(quitados, campo))
+            # Tolerancia para las sumas de confianza (float)
+            setattr(self, campo, Counter({clave: valor for clave, valor in restado.items() if valor > 1e-9}))
+        return cantidad
+
+    def a_dict(self):
+        return {campo: dict(getattr(self, campo)) for campo in self.CAMPOS}
+
+    def desde_dict(self, datos):
+        for campo in self.CAMPOS:
+            setattr(self, campo, Counter(datos[campo]))
+
+    def __sub__(self, anterior):
+        """Contadores de los eventos agregados después de `anterior`
+
+        Lanza ValueError si algún contador bajó: después de una retención o
+        de un recálculo los contadores no son comparables con `anterior`.
+        """
+        diferencia = ContadoresLogs()
+        for campo in self.CAMPOS:
+            # subtract y no "-": el operador descarta los conteos negativos
+            restado = Counter(getattr(self, campo))
+            restado.subtract(getattr(anterior, campo))
+            # Tolerancia para las sumas de confianza (float)
+            if any(valor < -1e-9 for valor in restado.values()):
+                raise ValueError(f"Los contadores se reiniciaron desde el reporte anterior ({campo})")
+            setattr(diferencia, campo, Counter({clave: valor for clave, valor in restado.items() if valor}))
+        return diferencia
+
+
+class SeriesActividad:
+    """Conteos por intervalo de tiempo: {clave: {usuario o TOTAL: {métrica: n}}}"""
+
+    def __init__(self, datos=None):
+        self.horas = datos["horas"] if datos else {}
+        self.dias = datos["dias"] if datos else {}
+
+    def a_dict(self):
+        return {"horas": self.horas, "dias": self.dias}
+
+    @staticmethod
+    def _metricas(evento):
+        tipo = evento.get('tipo')
+        if tipo in TIPOS_ACCESO:
+            return ('accesos',)
+        if tipo == 'login_fallido':
+            return ('fallidos',)
+        if tipo == 'busqueda':
+            resultado = evento.get('resultado')
+            return ('busquedas', resultado) if resultado in ('arrufo', 'puntual') else ('busquedas',)
+        return ()
+
+    @staticmethod
+    def _sumar(serie, clave, usuario, metricas, cantidad=1):
+        intervalo = serie.get(clave)
+        if intervalo is None:
+            if cantidad < 0:
+                # La hora ya se recortó
+                return
+            intervalo = serie[clave] = {}
+        for destino in (TOTAL, usuario):
+            conteos = intervalo.get(destino)
+            if conteos is None:
+                conteos = intervalo[destino] = {}
+            for metrica in metricas:
+                conteos[metrica] = conteos.get(metrica, 0) + cantidad
+                if conteos[metrica] <= 0:
+                    del conteos[metrica]
+            if not conteos:
+                del intervalo[destino]
+        if not intervalo:
+            del serie[clave]
+
+    def registrar(self, evento, cantidad=1):
+        metricas = self._metricas(evento)
+        timestamp = evento.get('timestamp', '')
+        if not metricas or len(timestamp) < 13:
+            return
+        usuario = evento.get('usuario') or '?'
+        self._sumar(self.horas, timestamp[:13], usuario, metricas, cantidad)
+        self._sumar(self.dias, timestamp[:10], usuario, metricas, cantidad)
+
+    def registrar_todos(self, eventos, cantidad=1):
+        """Registra cada evento y lo devuelve, para sumarlo en la misma pasada
+
+        Con cantidad=-1 lo descuenta (eventos eliminados por la retención).
+        """
+        for evento in eventos:
+            self.registrar(evento, cantidad)
+            yield evento
+
+    def recortar(self):
+        """Descarta las horas más antiguas que HORAS_RETENIDAS"""
+        if len(self.horas) > HORAS_RETENIDAS:
+            for clave in sorted(self.horas)[:len(self.horas) - HORAS_RETENIDAS]:
+                del self.horas[clave]
+
+    def serie(self, granularidad='dia', usuario=None, ultimos=30, desde=None):
+        """Lista [(clave, {métrica: n})] de los últimos intervalos, en orden cronológico
+
+        La ventana termina en la hora o el día actual, aunque no haya habido
+        actividad reciente; se completan con ceros los intervalos sin actividad.
+        """
+        serie = self.horas if granularidad == 'hora' else self.dias
+        if not serie:
+            return []
+        ahora = datetime.now()
+        fin = (ahora.replace(minute=0, second=0, microsecond=0) if granularidad == 'hora'
+               else ahora.replace(hour=0, minute=0, second=0, microsecond=0))
+        paso = timedelta(hours=1) if granularidad == 'hora' else timedelta(days=1)
+        formato = "%Y-%m-%dT%H" if granularidad == 'hora' else "%Y-%m-%d"
+        claves = [(fin - paso * i).strftime(formato) for i in range(ultimos - 1, -1, -1)]
+        if desde:
+            claves = [clave for clave in claves if clave >= desde[:len(clave)]]
+        destino = usuario or TOTAL
+        return [(clave, serie.get(clave, {}).get(destino, {})) for clave in claves]
+
+
+class AgregadosLogs(ContadoresLogs):
+    """Contadores del panel actualizados de forma incremental"""
+
+    def __init__(self, archivo=registro_eventos.ARCHIVO_EVENTOS,
+                 archivo_legado=registro_eventos.ARCHIVO_LEGADO):
+        self.ruta = ruta_agregados(archivo)
+        self.cursor = crear_cursor(archivo, archivo_legado, incluir_archivo=True)
+        ContadoresLogs.__init__(self)
+
+    def reiniciar(self):
+        ContadoresLogs.reiniciar(self)
+        self.series = SeriesActividad()
+
+    def agregar(self, eventos):
+        cantidad = ContadoresLogs.agregar(self, self.series.registrar_todos(eventos))
+        self.series.recortar()
+        return cantidad
+
+    def descontar(self, eventos):
+        return ContadoresLogs.descontar(self, self.series.registrar_todos(eventos, -1))
+
+    def cargar(self):
+        """Restaura los contadores guardados; devuelve False si no hay o son inválidos"""
+        try:
+            with open(self.ruta, 'r', encoding='utf-8') as f:
+                datos = json.load(f)
+            if datos.get('backend', 'jsonl') != registro_eventos.BACKEND:
+                # La posición guardada es de otro backend
+                return False
+            self.desde_dict(datos)
+            self.series = SeriesActividad(datos['series'])
+            self.cursor.restaurar(datos['posicion'])
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            print(f"Agregados inválidos, se recalculan: {e}")
+            self.reiniciar()
+            return False
+
+    def guardar(self):
+        """Escribe los contadores y su posición de forma atómica"""
+        datos = self.a_dict()
+        datos["series"] = self.series.a_dict()
+        datos["backend"] = registro_eventos.BACKEND
+        datos["posicion"] = self.cursor.estado()
+        temporal = f"{self.ruta}.{os.getpid()}.tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(datos, f, ensure_ascii=False)
+        os.replace(temporal, self.ruta)
+
+    def actualizar(self):
+        """Incorpora los eventos nuevos; devuelve cuántos se procesaron"""
+        if not self.cursor.cargado:
+            self.cargar()
+        nuevos, recargado = self.cursor.leer_nuevos()
+        if recargado:
+            self.reiniciar()
+        cantidad = self.agregar(nuevos)
+        if cantidad or recargado:
+            try:
+                self.guardar()
+            except Exception as e:
+                print(f"Error al guardar agregados: {e}")
+        return cantidad
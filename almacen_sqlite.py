@@ -0,0 +1,256 @@
+# almacen_sqlite.py
+# Backend opcional de eventos sobre SQLite con índices por tipo, usuario y
+# timestamp. Se activa con la variable de entorno SISTEMA_LOGS_BACKEND=sqlite.
+#
+# Importar logs existentes:
+#   python almacen_sqlite.py                      (legado + segmentos JSONL)
+#   python almacen_sqlite.py sistema_logs.json    (un archivo concreto)
+import os
+import sqlite3
+import sys
+from contextlib import closing
+
+import registro_eventos
+
+ARCHIVO_BD = "sistema_logs.db"
+
+COLUMNAS = ("usuario", "tipo", "detalles", "fecha", "hora", "timestamp",
+            "descripcion", "resultado", "prob_arrufo", "prob_puntual", "version_modelo")
+
+# Columnas tipadas de las búsquedas agregadas después de la primera versión
+COLUMNAS_BUSQUEDA = {
+    "descripcion": "TEXT",
+    "resultado": "TEXT",
+    "prob_arrufo": "REAL",
+    "prob_puntual": "REAL",
+    "version_modelo": "TEXT",
+}
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS eventos (
+    id INTEGER PRIMARY KEY,
+    usuario TEXT NOT NULL,
+    tipo TEXT NOT NULL,
+    detalles TEXT,
+    fecha TEXT,
+    hora TEXT,
+    timestamp TEXT NOT NULL,
+    descripcion TEXT,
+    resultado TEXT,
+    prob_arrufo REAL,
+    prob_puntual REAL,
+    version_modelo TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_eventos_unico ON eventos(timestamp, usuario, tipo);
+CREATE INDEX IF NOT EXISTS idx_eventos_tipo_timestamp ON eventos(tipo, timestamp);
+CREATE INDEX IF NOT EXISTS idx_eventos_tipo_usuario ON eventos(tipo, usuario);
+CREATE INDEX IF NOT EXISTS idx_eventos_usuario ON eventos(usuario, timestamp);
+CREATE INDEX IF NOT EXISTS idx_eventos_timestamp ON eventos(timestamp);
+"""
+
+
+# Bases a las que ya se les creó y migró el esquema en este proceso
+_preparadas = set()
+
+
+def conectar(ruta=ARCHIVO_BD):
+    """Abre la base de datos; la primera vez en el proceso crea el esquema si no existe"""
+    conexion = sqlite3.connect(ruta, timeout=30)
+    conexion.row_factory = sqlite3.Row
+    # synchronous es de cada conexión; journal_mode y el esquema quedan en el archivo
+    conexion.execute("PRAGMA synchronous=NORMAL")
+    clave = os.path.abspath(ruta)
+    if clave not in _preparadas:
+        # WAL permite que el panel lea mientras otras ventanas escriben
+        conexion.execute("PRAGMA journal_mode=WAL")
+        conexion.executescript(ESQUEMA)
+        migrar_esquema(conexion)
+        _preparadas.add(clave)
+    return conexion
+
+
+def migrar_esquema(conexion):
+    """Agrega las columnas tipadas y convierte las búsquedas con detalles JSON"""
+    existentes = {fila[1] for fila in conexion.execute("PRAGMA table_info(eventos)")}
+    faltantes = [columna for columna in COLUMNAS_BUSQUEDA if columna not in existentes]
+    if not faltantes:
+        return
+    with conexion:
+        for columna in faltantes:
+            conexion.execute(f"ALTER TABLE eventos ADD COLUMN {columna} {COLUMNAS_BUSQUEDA[columna]}")
+        migrar_busquedas(conexion)
+
+
+def migrar_busquedas(conexion, tamano_lote=5000):
+    """Convierte por lotes las búsquedas que aún guardan detalles JSON"""
+    while True:
+        filas = conexion.execute(
+            "SELECT id, tipo, detalles FROM eventos "
+            "WHERE tipo = 'busqueda' AND resultado IS NULL LIMIT ?",
+            (tamano_lote,)
+        ).fetchall()
+        if not filas:
+            return
+        cambios = []
+        for fila in filas:
+            evento = registro_eventos.normalizar_busqueda(
+                {"tipo": fila["tipo"], "detalles": fila["detalles"]}
+            )
+            cambios.append((
+                evento["descripcion"], evento["resultado"], evento["prob_arrufo"],
+                evento["prob_puntual"], fila["id"]
+            ))
+        conexion.executemany(
+            "UPDATE eventos SET detalles = '', descripcion = ?, resultado = ?, "
+            "prob_arrufo = ?, prob_puntual = ? WHERE id = ?",
+            cambios
+        )
+
+
+def _fila_a_evento(fila):
+    return {columna: fila[columna] for columna in COLUMNAS}
+
+
+def _marcadores(valores):
+    return ",".join("?" for _ in valores)
+
+
+def insertar_eventos(eventos, ruta=ARCHIVO_BD):
+    """Inserta eventos en una sola transacción; ignora duplicados"""
+    eventos = [registro_eventos.normalizar_busqueda(evento) for evento in eventos]
+    filas = [tuple(evento.get(columna) for columna in COLUMNAS) for evento in eventos]
+    if not filas:
+        return 0
+    with closing(conectar(ruta)) as conexion:
+        with conexion:
+            cursor = conexion.executemany(
+                f"INSERT OR IGNORE INTO eventos ({','.join(COLUMNAS)}) "
+                f"VALUES ({_marcadores(COLUMNAS)})",
+                filas
+            )
+        return cursor.rowcount
+
+
+def importar_eventos(eventos, ruta=ARCHIVO_BD, tamano_lote=5000):
+    """Importa un iterable de eventos por lotes y devuelve cuántos se insertaron"""
+    insertados = 0
+    lote = []
+    for evento in eventos:
+        lote.append(evento)
+        if len(lote) >= tamano_lote:
+            insertados += insertar_eventos(lote, ruta)
+            lote = []
+    insertados += insertar_eventos(lote, ruta)
+    return insertados
+
+
+def importar_archivo(archivo, ruta=ARCHIVO_BD):
+    """Importa un sistema_logs.json (arreglo) o un segmento JSONL"""
+    if archivo.endswith(".jsonl"):
+        eventos = registro_eventos.leer_segmento(archivo)
+    else:
+        eventos = registro_eventos.leer_legado(archivo)
+    return importar_eventos(eventos, ruta)
+
+
+def ultimo_id(ruta=ARCHIVO_BD):
+    """Id del último evento insertado (0 si la tabla está vacía)"""
+    with closing(conectar(ruta)) as conexion:
+        return conexion.execute("SELECT COALESCE(MAX(id), 0) FROM eventos").fetchone()[0]
+
+
+def eventos_posteriores(desde_id, limite=-1, ruta=ARCHIVO_BD):
+    """Eventos insertados después de desde_id; devuelve (eventos, nuevo_ultimo_id)"""
+    with closing(conectar(ruta)) as conexion:
+        filas = conexion.execute(
+            "SELECT * FROM eventos WHERE id > ? ORDER BY id LIMIT ?", (desde_id, limite)
+        ).fetchall()
+    if not filas:
+        return [], desde_id
+    return [_fila_a_evento(fila) for fila in filas], filas[-1]["id"]
+
+
+def iterar_rango(desde=None, hasta=None, tamano_lote=5000, ruta=ARCHIVO_BD):
+    """Recorre en orden de timestamp los eventos entre desde y hasta, por lotes"""
+    condiciones = []
+    parametros = []
+    if desde:
+        condiciones.append("timestamp >= ?")
+        parametros.append(desde)
+    if hasta:
+        condiciones.append("timestamp < ?")
+        parametros.append(hasta + "\uffff")
+    ultimo = None
+    with closing(conectar(ruta)) as conexion:
+        while True:
+            donde = list(condiciones)
+            valores = list(parametros)
+            if ultimo is not None:
+                # Paginación por (timestamp, id) sin OFFSET
+                donde.append("(timestamp > ? OR (timestamp = ? AND id > ?))")
+                valores.extend((ultimo["timestamp"], ultimo["timestamp"], ultimo["id"]))
+            filas = conexion.execute(
+                f"SELECT * FROM eventos {'WHERE ' + ' AND '.join(donde) if donde else ''} "
+                f"ORDER BY timestamp, id LIMIT ?",
+                (*valores, tamano_lote)
+            ).fetchall()
+            for fila in filas:
+                yield _fila_a_evento(fila)
+            if len(filas) < tamano_lote:
+                return
+            ultimo = filas[-1]
+
+
+def contar_eventos(tipos, ruta=ARCHIVO_BD):
+    """Cuenta los eventos de los tipos indicados"""
+    with closing(conectar(ruta)) as conexion:
+        return conexion.execute(
+            f"SELECT COUNT(*) FROM eventos WHERE tipo IN ({_marcadores(tipos)})",
+            tuple(tipos)
+        ).fetchone()[0]
+
+
+def contar_usuarios(tipos, ruta=ARCHIVO_BD):
+    """Cuenta los usuarios distintos con eventos de los tipos indicados"""
+    with closing(conectar(ruta)) as conexion:
+        return conexion.execute(
+            f"SELECT COUNT(DISTINCT usuario) FROM eventos WHERE tipo IN ({_marcadores(tipos)})",
+            tuple(tipos)
+        ).fetchone()[0]
+
+
+def consultar(tipos=None, usuario=None, desde=None, hasta=None, antes_de=None, limite=50,
+              ruta=ARCHIVO_BD):
+    """Eventos filtrados del más nuevo al más viejo (mismos parámetros que consultas_logs)"""
+    condiciones = []
+    parametros = []
+    if tipos:
+        condiciones.append(f"tipo IN ({_marcadores(tipos)})")
+        parametros.extend(tipos)
+    if usuario:
+        condiciones.append("usuario = ?")
+        parametros.append(usuario)
+    if desde:
+        condiciones.append("timestamp >= ?")
+        parametros.append(desde)
+    if hasta:
+        condiciones.append("timestamp < ?")
+        parametros.append(hasta + "\uffff")
+    if antes_de:
+        condiciones.append("timestamp < ?")
+        parametros.append(antes_de)
+    donde = f"WHERE {' AND '.join(condiciones)}" if condiciones else ""
+    with closing(conectar(ruta)) as conexion:
+        filas = conexion.execute(
+            f"SELECT * FROM eventos {donde} ORDER BY timestamp DESC LIMIT ?",
+            (*parametros, limite)
+        ).fetchall()
+    return [_fila_a_evento(fila) for fila in filas]
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        total = sum(importar_archivo(archivo) for archivo in sys.argv[1:])
+    else:
+        total = importar_eventos(registro_eventos.leer_eventos())
+    print(f"Eventos importados en {ARCHIVO_BD}: {total}")
@@ -0,0 +1,67 @@
+# benchmark_arranque.py
+# Tiempo hasta el primer resultado de clasificación con y sin el
+# precalentamiento del modelo que hace la ventana de análisis.
+#
+# Cada escenario corre en un proceso nuevo para que la importación de
+# transformers y torch sea tan fría como al abrir la aplicación:
+#   - perezoso: el primer clic importa, carga el modelo y hace la primera pasada
+#   - precalentado: al "abrir la ventana" empieza la carga en segundo plano y el
+#     clic llega `demora` segundos después (lo que tarda alguien en escribir)
+#
+# Uso: python benchmark_arranque.py [--demoras 0 2 5] [--repeticiones 3]
+import argparse
+import json
+import subprocess
+import sys
+import time
+
+DESCRIPCION = "Grieta diagonal de 2 mm en la esquina superior de la ventana del segundo piso"
+
+
+def escenario(precalentar, demora):
+    """Se ejecuta en el proceso hijo; imprime los tiempos medidos como JSON"""
+    inicio = time.perf_counter()
+    from modelo_fisuras import ClasificadorFisuras
+
+    clasificador = ClasificadorFisuras()
+    if precalentar:
+        clasificador.calentar_en_segundo_plano()
+    time.sleep(demora)
+
+    clic = time.perf_counter()
+    clase, _, _ = clasificador.clasificar(DESCRIPCION)
+    fin = time.perf_counter()
+    print(json.dumps({"desde_clic": fin - clic, "desde_inicio": fin - inicio, "ok": clase is not None,
+                      "carga": clasificador.tiempos.get("carga", 0.0)}))
+
+
+def medir(precalentar, demora):
+    salida = subprocess.run(
+        [sys.executable, __file__, "--hijo", "1" if precalentar else "0", str(demora)],
+        capture_output=True, text=True, check=True,
+    ).stdout
+    return json.loads(salida.strip().splitlines()[-1])
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--hijo":
+        escenario(sys.argv[2] == "1", float(sys.argv[3]))
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Tiempo hasta el primer resultado, perezoso vs. precalentado")
+    parser.add_argument("--demoras", type=float, nargs="+", default=[0.0, 2.0, 5.0],
+                        help="segundos entre abrir la ventana y el primer clic")
+    parser.add_argument("--repeticiones", type=int, default=3)
+    argumentos = parser.parse_args()
+
+    print(f"{'modo':>13} {'demora s':>9} {'desde clic s':>13} {'desde inicio s':>15} {'carga s':>8}")
+    for demora in argumentos.demoras:
+        for precalentar in (False, True):
+            medidas = [medir(precalentar, demora) for _ in range(argumentos.repeticiones)]
+            if not all(medida["ok"] for medida in medidas):
+                raise SystemExit("No se pudo clasificar: revisar que ./fisuras_classifier exista")
+            promedio = {clave: sum(medida[clave] for medida in medidas) / len(medidas)
+                        for clave in ("desde_clic", "desde_inicio", "carga")}
+            modo = "precalentado" if precalentar else "perezoso"
+            print(f"{modo:>13} {demora:>9.1f} {promedio['desde_clic']:>13.2f} "
+                  f"{promedio['desde_inicio']:>15.2f} {promedio['carga']:>8.2f}")
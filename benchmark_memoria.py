@@ -0,0 +1,135 @@
+# benchmark_memoria.py
+# Tiempo de carga y memoria por proceso con 1, 4 y 8 ventanas de análisis
+# abiertas, con los pesos mapeados desde safetensors (FISURAS_MMAP=1) y
+# copiados por from_pretrained (FISURAS_MMAP=0).
+#
+# Cada ventana es un proceso que carga el modelo y clasifica una descripción
+# (así las páginas de los pesos que usa la inferencia quedan residentes). Se
+# abren una tras otra, como cuando varios inspectores inician sesión: la
+# primera carga puede leer del disco y las siguientes encuentran los pesos
+# en la caché de archivos. Con todas abiertas, cada una lee su memoria de
+# /proc/self/smaps_rollup:
+#   USS  memoria propia (Private_Clean + Private_Dirty): lo que se liberaría al cerrarla
+#   PSS  memoria propia más su parte de la compartida; la suma es el total real
+#   RSS  todo lo residente, compartido o no
+# Con una sola ventana los pesos mapeados cuentan como propios (nadie más
+# los comparte); desde dos pasan a ser compartidos.
+#
+# Con --frio los archivos del modelo se sacan de la caché antes de cada
+# escenario (posix_fadvise), para medir también la primera carga desde disco.
+#
+# Solo Linux. Uso: python benchmark_memoria.py [--ventanas 1 4 8] [--modos mmap copia] [--frio]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+from modelo_fisuras import RUTA_MODELO
+
+DESCRIPCION = "Grieta diagonal de 2 mm en la esquina superior de la ventana del segundo piso"
+
+MODOS = {"mmap": "1", "copia": "0"}
+
+
+def memoria_mb():
+    """USS, PSS y RSS del proceso en MB según /proc/self/smaps_rollup"""
+    valores = {}
+    with open("/proc/self/smaps_rollup", 'r') as f:
+        for linea in f:
+            partes = linea.split()
+            if len(partes) == 3 and partes[2] == "kB":
+                valores[partes[0].rstrip(":")] = int(partes[1]) / 1024
+    return {
+        "uss": valores.get("Private_Clean", 0) + valores.get("Private_Dirty", 0),
+        "pss": valores.get("Pss", 0),
+        "rss": valores.get("Rss", 0),
+    }
+
+
+def ventana():
+    """Se ejecuta en el proceso hijo: carga, clasifica, avisa y mide cuando se lo piden"""
+    from modelo_fisuras import ClasificadorFisuras
+
+    clasificador = ClasificadorFisuras(backend="torch")
+    clase, _, _ = clasificador.clasificar(DESCRIPCION)
+    print(json.dumps({"carga": clasificador.tiempos.get("carga", 0.0), "ok": clase is not None,
+                      "mapeado": clasificador.mapeado}), flush=True)
+    # Espera a que estén todas abiertas: lo compartido depende de cuántas hay
+    sys.stdin.readline()
+    print(json.dumps(memoria_mb()), flush=True)
+
+
+def leer_medida(proceso):
+    """Siguiente línea JSON del hijo; los avisos que imprime la carga se saltean"""
+    for linea in proceso.stdout:
+        if linea.startswith("{"):
+            return json.loads(linea)
+        print(linea, end="")
+    raise SystemExit(f"La ventana terminó sin informar (código {proceso.wait()})")
+
+
+def vaciar_cache(ruta=RUTA_MODELO):
+    """Saca de la caché de archivos los archivos del modelo"""
+    for nombre in os.listdir(ruta):
+        archivo = os.path.join(ruta, nombre)
+        if os.path.isfile(archivo):
+            with open(archivo, 'rb') as f:
+                os.posix_fadvise(f.fileno(), 0, 0, os.POSIX_FADV_DONTNEED)
+
+
+def escenario(modo, cantidad):
+    """Abre cantidad ventanas una tras otra; devuelve sus tiempos de carga y su memoria"""
+    entorno = dict(os.environ, FISURAS_MMAP=MODOS[modo], FISURAS_BACKEND="torch")
+    procesos, cargas, mapeados = [], [], []
+    try:
+        for _ in range(cantidad):
+            proceso = subprocess.Popen([sys.executable, __file__, "--hijo"], env=entorno, text=True,
+                                       stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+            procesos.append(proceso)
+            medida = leer_medida(proceso)
+            if not medida["ok"]:
+                raise SystemExit("No se pudo clasificar: revisar que ./fisuras_classifier exista")
+            cargas.append(medida["carga"])
+            mapeados.append(medida["mapeado"])
+        memorias = []
+        for proceso in procesos:
+            proceso.stdin.write("\n")
+            proceso.stdin.flush()
+            memorias.append(leer_medida(proceso))
+    finally:
+        for proceso in procesos:
+            proceso.stdin.close()
+            proceso.wait()
+    if modo == "mmap" and not all(mapeados):
+        print(f"Aviso: {mapeados.count(False)} de {cantidad} ventanas copiaron los pesos (carga mapeada no disponible)")
+    return cargas, memorias
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 2 and sys.argv[1] == "--hijo":
+        ventana()
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(description="Carga y memoria por proceso, pesos mapeados vs. copiados")
+    parser.add_argument("--ventanas", type=int, nargs="+", default=[1, 4, 8])
+    parser.add_argument("--modos", nargs="+", choices=list(MODOS), default=list(MODOS))
+    parser.add_argument("--frio", action="store_true", help="vacía la caché del modelo antes de cada escenario")
+    argumentos = parser.parse_args()
+    if not os.path.exists("/proc/self/smaps_rollup"):
+        raise SystemExit("Se necesita Linux (/proc/self/smaps_rollup)")
+
+    print(f"{'modo':>6} {'ventanas':>9} {'carga 1ª s':>11} {'carga resto s':>14} "
+          f"{'USS MB':>8} {'PSS MB':>8} {'RSS MB':>8} {'PSS total MB':>13}")
+    for modo in argumentos.modos:
+        for cantidad in argumentos.ventanas:
+            if argumentos.frio:
+                vaciar_cache()
+            cargas, memorias = escenario(modo, cantidad)
+            resto = f"{statistics.fmean(cargas[1:]):.2f}" if len(cargas) > 1 else "-"
+            promedio = {clave: statistics.fmean(memoria[clave] for memoria in memorias)
+                        for clave in ("uss", "pss", "rss")}
+            print(f"{modo:>6} {cantidad:>9} {cargas[0]:>11.2f} {resto:>14} {promedio['uss']:>8.1f} "
+                  f"{promedio['pss']:>8.1f} {promedio['rss']:>8.1f} "
+                  f"{sum(memoria['pss'] for memoria in memorias):>13.1f}")
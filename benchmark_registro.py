@@ -0,0 +1,59 @@
+# benchmark_registro.py
+# Mide eventos por segundo con 1 a 16 procesos escribiendo al mismo log y
+# verifica que no se pierda ningún evento.
+#
+# Uso: python benchmark_registro.py [eventos_por_proceso]
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+
+import registro_eventos
+
+PROCESOS = [1, 2, 4, 8, 16]
+
+
+def escribir(directorio, numero, cantidad, inicio):
+    """Proceso escritor: registra `cantidad` eventos y vacía la cola"""
+    os.chdir(directorio)
+    inicio.wait()
+    for i in range(cantidad):
+        registro_eventos.registrar_evento(f"usuario{numero}", "busqueda", f"evento {i}")
+    registro_eventos.vaciar()
+
+
+def medir(procesos, cantidad):
+    with tempfile.TemporaryDirectory() as directorio:
+        inicio = multiprocessing.Event()
+        trabajadores = [
+            multiprocessing.Process(target=escribir, args=(directorio, n, cantidad, inicio))
+            for n in range(procesos)
+        ]
+        for trabajador in trabajadores:
+            trabajador.start()
+        # Se da tiempo a que todos los procesos importen el módulo
+        time.sleep(0.5)
+        t0 = time.perf_counter()
+        inicio.set()
+        for trabajador in trabajadores:
+            trabajador.join()
+        segundos = time.perf_counter() - t0
+
+        anterior = os.getcwd()
+        os.chdir(directorio)
+        try:
+            escritos = sum(1 for _ in registro_eventos.leer_eventos())
+        finally:
+            os.chdir(anterior)
+    return segundos, escritos
+
+
+if __name__ == "__main__":
+    cantidad = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"{'procesos':>8} {'eventos':>8} {'segundos':>9} {'eventos/s':>10} {'perdidos':>8}")
+    for procesos in PROCESOS:
+        segundos, escritos = medir(procesos, cantidad)
+        esperados = procesos * cantidad
+        print(f"{procesos:>8} {esperados:>8} {segundos:>9.3f} {esperados / segundos:>10.0f} "
+              f"{esperados - escritos:>8}")
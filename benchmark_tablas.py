@@ -0,0 +1,163 @@
+# benchmark_tablas.py
+# Compara el DataTable original (una fila de controles por evento) con la
+# vista virtualizada del panel (vista_virtual.HistorialVirtual) para 1k, 10k
+# y 100k eventos de búsqueda.
+#
+# Mide el tiempo de construcción, la cantidad de controles y una estimación
+# del tamaño de lo que se envía al cliente: el árbol completo al agregarlo a
+# la página y las propiedades que cambian al desplazarse una ventana.
+#
+# Uso: python benchmark_tablas.py [cantidades...]
+import json
+import sys
+import time
+from datetime import datetime, timedelta
+
+import flet as ft
+
+from vista_virtual import Columna, HistorialVirtual
+
+CANTIDADES = [1000, 10000, 100000]
+
+
+def generar_eventos(cantidad):
+    """Búsquedas sintéticas del más nuevo al más viejo"""
+    base = datetime(2025, 1, 1)
+    eventos = []
+    for i in range(cantidad - 1, -1, -1):
+        momento = base + timedelta(seconds=i)
+        eventos.append({
+            "usuario": f"usuario{i % 37}",
+            "tipo": "busqueda",
+            "detalles": "",
+            "fecha": momento.strftime("%Y-%m-%d"),
+            "hora": momento.strftime("%H:%M:%S"),
+            "timestamp": momento.isoformat(),
+            "descripcion": f"Fisura diagonal en muro de carga número {i} cerca de la ventana",
+            "resultado": "arrufo" if i % 3 else "puntual",
+        })
+    return eventos
+
+
+def celdas_busqueda(log):
+    descripcion = log['descripcion']
+    if len(descripcion) > 50:
+        descripcion = descripcion[:50] + "..."
+    color = ft.Colors.RED_400 if log['resultado'] == 'arrufo' else ft.Colors.BLUE_400
+    return (log['usuario'], descripcion, (log['resultado'].upper(), color), log['fecha'], log['hora'])
+
+
+def fila_data_table(log):
+    """Fila como la construía el panel antes de la vista virtualizada"""
+    usuario, descripcion, (resultado, color), fecha, hora = celdas_busqueda(log)
+    return ft.DataRow(
+        cells=[
+            ft.DataCell(ft.Text(usuario)),
+            ft.DataCell(ft.Text(descripcion)),
+            ft.DataCell(ft.Container(
+                content=ft.Text(resultado, color=ft.Colors.WHITE, size=11, weight=ft.FontWeight.BOLD),
+                bgcolor=color,
+                padding=5,
+                border_radius=5
+            )),
+            ft.DataCell(ft.Text(fecha)),
+            ft.DataCell(ft.Text(hora)),
+        ]
+    )
+
+
+def _hijos(control):
+    obtener = getattr(control, "_get_children", None)
+    return obtener() if obtener else []
+
+
+def _propiedades(control):
+    """Propiedades serializables de un control (lo que viaja al cliente)"""
+    internas = getattr(control, "_Control__attrs", None)
+    if internas is not None:
+        return {nombre: valor[0] for nombre, valor in internas.items()}
+    return {nombre: valor for nombre, valor in vars(control).items()
+            if not nombre.startswith("_") and isinstance(valor, (str, int, float, bool))}
+
+
+def instantanea(control):
+    """Lista (control, propiedades) de todo el árbol"""
+    pendientes = [control]
+    resultado = []
+    while pendientes:
+        actual = pendientes.pop()
+        resultado.append((id(actual), _propiedades(actual)))
+        pendientes.extend(_hijos(actual))
+    return resultado
+
+
+def bytes_arbol(foto):
+    return sum(len(json.dumps(propiedades, default=str)) for _, propiedades in foto)
+
+
+def bytes_cambios(antes, despues):
+    """Tamaño de las propiedades que cambiaron entre dos instantáneas"""
+    previas = dict(antes)
+    total = 0
+    for identificador, propiedades in despues:
+        anteriores = previas.get(identificador, {})
+        cambiadas = {nombre: valor for nombre, valor in propiedades.items()
+                     if anteriores.get(nombre) != valor}
+        if cambiadas:
+            total += len(json.dumps(cambiadas, default=str))
+    return total
+
+
+def medir_data_table(eventos):
+    t0 = time.perf_counter()
+    tabla = ft.DataTable(
+        columns=[ft.DataColumn(ft.Text(titulo)) for titulo in
+                 ("Usuario", "Descripción Búsqueda", "Resultado", "Fecha", "Hora")],
+        rows=[fila_data_table(log) for log in eventos],
+    )
+    construccion = time.perf_counter() - t0
+    foto = instantanea(tabla)
+    # Cada "Actualizar" vaciaba y reconstruía todas las filas: se reenvía el árbol
+    return construccion, len(foto), bytes_arbol(foto), bytes_arbol(foto)
+
+
+def medir_virtual(eventos):
+    def cargar(antes_de, limite):
+        # Mismo contrato que consultas_logs.consultar, sobre la lista en memoria
+        inicio = 0
+        if antes_de:
+            inicio = next((i for i, log in enumerate(eventos) if log['timestamp'] < antes_de), len(eventos))
+        return eventos[inicio:inicio + limite]
+
+    t0 = time.perf_counter()
+    vista = HistorialVirtual(
+        columnas=[
+            Columna("Usuario", 140),
+            Columna("Descripción Búsqueda"),
+            Columna("Resultado", 110, insignia=True),
+            Columna("Fecha", 100),
+            Columna("Hora", 80),
+        ],
+        celdas=celdas_busqueda,
+        cargar=cargar,
+    )
+    vista.reiniciar()
+    construccion = time.perf_counter() - t0
+    foto = instantanea(vista.control)
+
+    # Desplazarse una ventana hacia la mitad del historial
+    vista.ir_a(len(eventos) // 2)
+    despues = instantanea(vista.control)
+    return construccion, len(foto), bytes_arbol(foto), bytes_cambios(foto, despues)
+
+
+if __name__ == "__main__":
+    cantidades = [int(valor) for valor in sys.argv[1:]] or CANTIDADES
+    print(f"{'vista':>10} {'eventos':>8} {'construcción s':>15} {'controles':>10} "
+          f"{'árbol KB':>10} {'actualización KB':>17}")
+    for cantidad in cantidades:
+        eventos = generar_eventos(cantidad)
+        for nombre, medir in (("datatable", medir_data_table), ("virtual", medir_virtual)):
+            construccion, controles, arbol, actualizacion = medir(eventos)
+            print(f"{nombre:>10} {cantidad:>8} {construccion:>15.3f} {controles:>10} "
+                  f"{arbol / 1024:>10.1f} {actualizacion / 1024:>17.1f}")
@@ -0,0 +1,288 @@
+# cache_predicciones.py
+# Caché de predicciones del clasificador de fisuras.
+#
+# La clave es un hash del texto normalizado (Unicode NFC, sin distinguir
+# mayúsculas y con los espacios colapsados) y de la versión del modelo, así
+# que un modelo reentrenado nunca reutiliza predicciones viejas. Hay dos
+# niveles: un LRU en memoria de MAX_MEMORIA entradas y una base SQLite
+# compartida entre sesiones que se recorta a MAX_DISCO entradas, descartando
+# las usadas hace más tiempo. Los aciertos y fallos se cuentan por nivel en
+# memoria y se suman a la base cada INTERVALO_CONTADORES consultas y al
+# cerrar: un acierto en memoria no toca SQLite.
+#
+# Precargar desde el historial de búsquedas (solo las de la versión actual,
+# y de ellas las que entran en una ventana de MAX_LONGITUD tokens: las más
+# largas se registraron con el esquema anterior, que las truncaba):
+#   python cache_predicciones.py --precargar
+#   python cache_predicciones.py --estadisticas
+import argparse
+import collections
+import hashlib
+import sqlite3
+import threading
+import time
+import unicodedata
+
+ARCHIVO_CACHE = "predicciones_cache.db"
+
+MAX_MEMORIA = 1000
+MAX_DISCO = 100000
+
+# Inserciones entre recortes del nivel en disco
+INTERVALO_RECORTE = 500
+
+# Consultas entre volcados de los contadores a la base
+INTERVALO_CONTADORES = 100
+
+ESQUEMA = """
+CREATE TABLE IF NOT EXISTS predicciones (
+    clave TEXT PRIMARY KEY,
+    version_modelo TEXT NOT NULL,
+    resultado TEXT NOT NULL,
+    prob_arrufo REAL NOT NULL,
+    prob_puntual REAL NOT NULL,
+    usado REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_predicciones_usado ON predicciones(usado);
+CREATE TABLE IF NOT EXISTS contadores (
+    nombre TEXT PRIMARY KEY,
+    valor INTEGER NOT NULL
+);
+"""
+
+CONTADORES = ("aciertos_memoria", "aciertos_disco", "fallos")
+
+# Forma de calcular una predicción; cambiarla invalida la caché aunque el
+# modelo sea el mismo (2: descripciones largas por ventanas, sin truncar)
+ESQUEMA_PREDICCION = 2
+
+
+def normalizar_texto(texto):
+    """Forma canónica de una descripción: NFC, minúsculas y espacios simples"""
+    return " ".join(unicodedata.normalize("NFC", texto).casefold().split())
+
+
+def clave_prediccion(texto, version_modelo):
+    contenido = f"{ESQUEMA_PREDICCION}\0{version_modelo}\0{normalizar_texto(texto)}"
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+class CachePredicciones:
+    """Caché LRU en memoria delante de una caché persistente en SQLite"""
+
+    def __init__(self, ruta=ARCHIVO_CACHE, max_memoria=MAX_MEMORIA, max_disco=MAX_DISCO):
+        self.ruta = ruta
+        self.max_memoria = max_memoria
+        self.max_disco = max_disco
+        self.memoria = collections.OrderedDict()
+        self.contadores = dict.fromkeys(CONTADORES, 0)
+        # Contados desde el último volcado a la base
+        self.pendientes = dict.fromkeys(CONTADORES, 0)
+        self.insertadas = 0
+        # Los manejadores de Flet llegan desde varios hilos
+        self.bloqueo = threading.Lock()
+        self.conexion = None
+
+    def _conectar(self):
+        if self.conexion is None:
+            self.conexion = sqlite3.connect(self.ruta, timeout=30, check_same_thread=False)
+            self.conexion.execute("PRAGMA journal_mode=WAL")
+            self.conexion.execute("PRAGMA synchronous=NORMAL")
+            self.conexion.executescript(ESQUEMA)
+        return self.conexion
+
+    def _recordar(self, clave, resultado):
+        self.memoria[clave] = resultado
+        self.memoria.move_to_end(clave)
+        while len(self.memoria) > self.max_memoria:
+            self.memoria.popitem(last=False)
+
+    def _contar(self, nombre):
+        # Se llama con self.bloqueo tomado
+        self.contadores[nombre] += 1
+        self.pendientes[nombre] += 1
+        if sum(self.pendientes.values()) >= INTERVALO_CONTADORES:
+            self._volcar_contadores()
+
+    def _volcar_contadores(self):
+        """Suma a la base los contadores pendientes"""
+        if not any(self.pendientes.values()):
+            return
+        try:
+            conexion = self._conectar()
+            with conexion:
+                conexion.executemany(
+                    "INSERT INTO contadores (nombre, valor) VALUES (?, ?) "
+                    "ON CONFLICT(nombre) DO UPDATE SET valor = valor + excluded.valor",
+                    [(nombre, valor) for nombre, valor in self.pendientes.items() if valor],
+                )
+            self.pendientes = dict.fromkeys(CONTADORES, 0)
+        except sqlite3.Error as e:
+            # Se reintenta en el próximo volcado
+            print(f"Error al guardar los contadores de la caché: {e}")
+
+    def obtener(self, texto, version_modelo):
+        """Devuelve (clase, probabilidad, probabilidades) si está en caché, o None"""
+        clave = clave_prediccion(texto, version_modelo)
+        try:
+            with self.bloqueo:
+                resultado = self.memoria.get(clave)
+                if resultado is not None:
+                    # Acierto en memoria: sin tocar SQLite
+                    self.memoria.move_to_end(clave)
+                    self._contar("aciertos_memoria")
+                    return resultado
+
+                conexion = self._conectar()
+                fila = conexion.execute(
+                    "SELECT resultado, prob_arrufo, prob_puntual FROM predicciones WHERE clave = ?",
+                    (clave,),
+                ).fetchone()
+                if fila is None:
+                    self._contar("fallos")
+                    return None
+                with conexion:
+                    conexion.execute("UPDATE predicciones SET usado = ? WHERE clave = ?", (time.time(), clave))
+                self._contar("aciertos_disco")
+                clase, prob_arrufo, prob_puntual = fila
+                resultado = (clase, prob_arrufo if clase == "arrufo" else prob_puntual,
+                             {"arrufo": prob_arrufo, "puntual": prob_puntual})
+                self._recordar(clave, resultado)
+                return resultado
+        except sqlite3.Error as e:
+            print(f"Error al leer la caché de predicciones: {e}")
+            return None
+
+    def guardar(self, texto, version_modelo, resultado):
+        """Guarda una predicción (clase, probabilidad, probabilidades) en ambos niveles"""
+        clase, _, probabilidades = resultado
+        if clase is None or not version_modelo:
+            return
+        clave = clave_prediccion(texto, version_modelo)
+        try:
+            with self.bloqueo:
+                self._recordar(clave, resultado)
+                conexion = self._conectar()
+                with conexion:
+                    conexion.execute(
+                        "INSERT OR REPLACE INTO predicciones VALUES (?, ?, ?, ?, ?, ?)",
+                        (clave, version_modelo, clase, probabilidades["arrufo"],
+                         probabilidades["puntual"], time.time()),
+                    )
+                self.insertadas += 1
+                if self.insertadas % INTERVALO_RECORTE == 0:
+                    self._recortar(conexion)
+        except sqlite3.Error as e:
+            print(f"Error al guardar en la caché de predicciones: {e}")
+
+    def _recortar(self, conexion):
+        """Descarta del disco las entradas usadas hace más tiempo por encima de max_disco"""
+        with conexion:
+            conexion.execute(
+                "DELETE FROM predicciones WHERE clave IN ("
+                "SELECT clave FROM predicciones ORDER BY usado DESC LIMIT -1 OFFSET ?)",
+                (self.max_disco,),
+            )
+
+    def precargar(self, busquedas, version_modelo, admitir=None):
+        """Carga en disco las búsquedas del historial hechas con version_modelo; devuelve cuántas
+
+        admitir(descripcion), si se indica, decide si la predicción registrada
+        sigue valiendo con el esquema actual.
+        """
+        cantidad = 0
+        with self.bloqueo:
+            conexion = self._conectar()
+            with conexion:
+                for evento in busquedas:
+                    if (evento.get('tipo') != 'busqueda' or evento.get('version_modelo') != version_modelo
+                            or evento.get('prob_arrufo') is None or evento.get('prob_puntual') is None
+                            or evento.get('resultado') not in ("arrufo", "puntual")):
+                        continue
+                    if admitir is not None and not admitir(evento.get('descripcion') or ''):
+                        continue
+                    # Las predicciones ya guardadas conservan su última fecha de uso
+                    conexion.execute(
+                        "INSERT OR IGNORE INTO predicciones VALUES (?, ?, ?, ?, ?, ?)",
+                        (clave_prediccion(evento.get('descripcion') or '', version_modelo),
+                         version_modelo, evento['resultado'], evento['prob_arrufo'],
+                         evento['prob_puntual'], time.time()),
+                    )
+                    cantidad += 1
+            self._recortar(conexion)
+        return cantidad
+
+    def estadisticas(self):
+        """Contadores de esta sesión y acumulados, con la tasa de aciertos de cada uno"""
+        with self.bloqueo:
+            self._volcar_contadores()
+            conexion = self._conectar()
+            acumulados = dict.fromkeys(CONTADORES, 0)
+            acumulados.update(conexion.execute("SELECT nombre, valor FROM contadores"))
+            entradas = conexion.execute("SELECT COUNT(*) FROM predicciones").fetchone()[0]
+            sesion = dict(self.contadores)
+
+        def con_tasa(contadores):
+            consultas = sum(contadores.values())
+            aciertos = contadores["aciertos_memoria"] + contadores["aciertos_disco"]
+            return dict(contadores, consultas=consultas, tasa_aciertos=aciertos / consultas if consultas else 0.0)
+
+        return {
+            "sesion": con_tasa(sesion),
+            "acumulado": con_tasa(acumulados),
+            "entradas_memoria": len(self.memoria),
+            "entradas_disco": entradas,
+        }
+
+    def cerrar(self):
+        with self.bloqueo:
+            self._volcar_contadores()
+            if self.conexion is not None:
+                self.conexion.close()
+                self.conexion = None
+
+
+def precargar_desde_historial(cache, version_modelo):
+    """Recorre todo el historial de eventos y precarga las búsquedas de version_modelo
+
+    Las búsquedas registradas no dicen con qué esquema se clasificaron. Una
+    descripción que entra en una sola ventana da lo mismo con el esquema
+    anterior (truncado) y con el actual; las más largas se omiten.
+    """
+    import modelo_logs
+    from transformers import AutoTokenizer
+    from modelo_fisuras import MAX_LONGITUD, RUTA_MODELO
+
+    tokenizer = AutoTokenizer.from_pretrained(RUTA_MODELO)
+
+    def cabe_en_una_ventana(texto):
+        return len(tokenizer(texto)["input_ids"]) <= MAX_LONGITUD
+
+    cursor = modelo_logs.crear_cursor(incluir_archivo=True)
+    return cache.precargar(cursor.leer_todo(), version_modelo, cabe_en_una_ventana)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Caché de predicciones del clasificador")
+    parser.add_argument("--precargar", action="store_true", help="precarga desde el historial de búsquedas")
+    parser.add_argument("--version", help="versión del modelo (por defecto, la de ./fisuras_classifier)")
+    parser.add_argument("--estadisticas", action="store_true")
+    argumentos = parser.parse_args()
+
+    cache = CachePredicciones()
+    try:
+        if argumentos.precargar:
+            from modelo_fisuras import obtener_version_modelo
+            version = argumentos.version or obtener_version_modelo()
+            print(f"Predicciones precargadas para {version}: {precargar_desde_historial(cache, version)}")
+        if argumentos.estadisticas or not argumentos.precargar:
+            estadisticas = cache.estadisticas()
+            print(f"Entradas: {estadisticas['entradas_memoria']} en memoria, {estadisticas['entradas_disco']} en disco")
+            for nombre in ("sesion", "acumulado"):
+                contadores = estadisticas[nombre]
+                print(f"{nombre:>10}: {contadores['consultas']} consultas, "
+                      f"{contadores['aciertos_memoria']} aciertos en memoria, "
+                      f"{contadores['aciertos_disco']} en disco, {contadores['fallos']} fallos "
+                      f"(tasa {contadores['tasa_aciertos']:.1%})")
+    finally:
+        cache.cerrar()
@@ -0,0 +1,192 @@
+# clasificar_csv.py
+# Clasifica sin interfaz gráfica un CSV de descripciones con la forma de
+# fisuras_base_limpia.csv (label,text; el texto entre comillas triples).
+#
+# Las filas se leen en streaming y se reparten por bloques entre PROCESOS
+# trabajadores; cada uno carga el modelo una vez y usa a lo sumo `hilos`
+# hilos de cómputo (torch u ONNX Runtime, según FISURAS_BACKEND), para que
+# los procesos no compitan por los mismos núcleos.
+# Solo hay unos pocos bloques en vuelo a la vez y los resultados se escriben
+# en el orden de entrada apenas llega su bloque, con el punto de control en
+# <salida>.progreso.json. Con --reanudar se recorta lo escrito después del
+# último punto de control y se continúa desde la fila siguiente.
+#
+# Uso: python clasificar_csv.py entrada.csv salida.csv [--procesos N]
+#                               [--hilos N] [--bloque N] [--reanudar]
+import argparse
+import collections
+import csv
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+
+from modelo_fisuras import CLASES, RUTA_MODELO, TAMANO_LOTE, ClasificadorFisuras, leer_csv_fisuras
+
+COLUMNAS = ("label", "text", "prediccion", "probabilidad", "prob_arrufo", "prob_puntual", "version_modelo")
+
+# Filas por tarea enviada a un trabajador
+TAMANO_BLOQUE = 256
+
+# Bloques en vuelo por proceso; acota la memoria sin dejar trabajadores ociosos
+BLOQUES_POR_PROCESO = 2
+
+# Clasificador de cada proceso trabajador
+_clasificador = None
+
+
+def _iniciar_trabajador(ruta, hilos):
+    global _clasificador
+    _clasificador = ClasificadorFisuras(ruta, hilos=hilos)
+    _clasificador.cargar()
+
+
+def _clasificar_bloque(textos, tamano_lote):
+    """Se ejecuta en el trabajador; devuelve (resultados, versión del modelo)"""
+    if not _clasificador.cargado:
+        raise RuntimeError(f"No se pudo cargar el modelo de {_clasificador.ruta}")
+    return _clasificador.clasificar_lote(textos, tamano_lote), _clasificador.version
+
+
+def _bloques(filas, tamano):
+    filas = iter(filas)
+    while True:
+        bloque = list(itertools.islice(filas, tamano))
+        if not bloque:
+            return
+        yield bloque
+
+
+def ruta_progreso(salida):
+    return salida + ".progreso.json"
+
+
+def _leer_progreso(salida):
+    try:
+        with open(ruta_progreso(salida), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _guardar_progreso(salida, progreso):
+    temporal = ruta_progreso(salida) + ".tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(progreso, f, ensure_ascii=False)
+    os.replace(temporal, ruta_progreso(salida))
+
+
+def procesos_por_defecto(hilos):
+    return max(1, (os.cpu_count() or 1) // hilos)
+
+
+def clasificar_csv(entrada, salida, procesos=None, hilos=1, tamano_bloque=TAMANO_BLOQUE,
+                   tamano_lote=TAMANO_LOTE, reanudar=False, ruta_modelo=RUTA_MODELO, al_avanzar=None):
+    """Clasifica las filas de entrada en salida; devuelve el progreso final
+
+    al_avanzar(progreso, filas_por_segundo) se llama después de cada bloque escrito.
+    """
+    procesos = procesos or procesos_por_defecto(hilos)
+    progreso = _leer_progreso(salida) if reanudar else None
+    if progreso and progreso["entrada"] != os.path.abspath(entrada):
+        raise ValueError("El punto de control es de otro archivo de entrada")
+    if progreso and (not os.path.exists(salida)
+                     or os.path.getsize(salida) < (progreso["offset"] or 0)):
+        print(f"{salida} no existe o está incompleto respecto al punto de control; se empieza de cero")
+        progreso = None
+    if progreso is None:
+        progreso = {"entrada": os.path.abspath(entrada), "filas": 0, "offset": None,
+                    "etiquetadas": 0, "aciertos": 0, "completo": False}
+    elif progreso["completo"]:
+        return progreso
+
+    nuevo = not progreso["offset"]
+    archivo = open(salida, 'w' if nuevo else 'r+', encoding='utf-8', newline='')
+    if not nuevo:
+        # Lo escrito después del último punto de control se vuelve a clasificar
+        archivo.seek(progreso["offset"])
+        archivo.truncate()
+    escritor = csv.writer(archivo)
+    if nuevo:
+        escritor.writerow(COLUMNAS)
+
+    filas = itertools.islice(leer_csv_fisuras(entrada), progreso["filas"], None)
+    pendientes = collections.deque()
+    inicio = time.perf_counter()
+    procesadas = 0
+    try:
+        with ProcessPoolExecutor(max_workers=procesos, mp_context=get_context("spawn"),
+                                 initializer=_iniciar_trabajador,
+                                 initargs=(ruta_modelo, hilos)) as ejecutor:
+            bloques = _bloques(filas, tamano_bloque)
+            for bloque in itertools.islice(bloques, procesos * BLOQUES_POR_PROCESO):
+                pendientes.append((bloque, ejecutor.submit(
+                    _clasificar_bloque, [texto for _, texto in bloque], tamano_lote)))
+
+            while pendientes:
+                bloque, futuro = pendientes.popleft()
+                resultados, version = futuro.result()
+                # Se repone el bloque consumido antes de escribir, para no dejar un trabajador sin tarea
+                for siguiente in itertools.islice(bloques, 1):
+                    pendientes.append((siguiente, ejecutor.submit(
+                        _clasificar_bloque, [texto for _, texto in siguiente], tamano_lote)))
+
+                for (etiqueta, texto), (clase, probabilidad, probabilidades) in zip(bloque, resultados):
+                    probabilidades = probabilidades or {}
+                    escritor.writerow([etiqueta, texto, clase, probabilidad,
+                                       probabilidades.get("arrufo"), probabilidades.get("puntual"), version])
+                    if etiqueta in CLASES:
+                        progreso["etiquetadas"] += 1
+                        progreso["aciertos"] += clase == etiqueta
+                archivo.flush()
+                procesadas += len(bloque)
+                progreso.update(filas=progreso["filas"] + len(bloque), offset=archivo.tell())
+                _guardar_progreso(salida, progreso)
+                if al_avanzar:
+                    al_avanzar(progreso, procesadas / (time.perf_counter() - inicio))
+    except BaseException:
+        for _, futuro in pendientes:
+            futuro.cancel()
+        raise
+    finally:
+        archivo.close()
+
+    progreso["completo"] = True
+    progreso["filas_por_segundo"] = procesadas / (time.perf_counter() - inicio) if procesadas else 0.0
+    _guardar_progreso(salida, progreso)
+    return progreso
+
+
+def exactitud(progreso):
+    if not progreso["etiquetadas"]:
+        return None
+    return progreso["aciertos"] / progreso["etiquetadas"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Clasifica un CSV de descripciones de fisuras")
+    parser.add_argument("entrada")
+    parser.add_argument("salida")
+    parser.add_argument("--procesos", type=int, help="por defecto, núcleos / hilos")
+    parser.add_argument("--hilos", type=int, default=1, help="hilos de cómputo por proceso")
+    parser.add_argument("--bloque", type=int, default=TAMANO_BLOQUE)
+    parser.add_argument("--lote", type=int, default=TAMANO_LOTE)
+    parser.add_argument("--modelo", default=RUTA_MODELO)
+    parser.add_argument("--reanudar", action="store_true")
+    argumentos = parser.parse_args()
+
+    def mostrar(progreso, velocidad):
+        texto = f"\rFilas: {progreso['filas']}  ({velocidad:.1f} filas/s)"
+        if exactitud(progreso) is not None:
+            texto += f"  exactitud {exactitud(progreso):.3f}"
+        print(texto, end="", flush=True)
+
+    progreso = clasificar_csv(argumentos.entrada, argumentos.salida, argumentos.procesos, argumentos.hilos,
+                              argumentos.bloque, argumentos.lote, argumentos.reanudar, argumentos.modelo,
+                              al_avanzar=mostrar)
+    print(f"\rFilas clasificadas: {progreso['filas']}  "
+          f"({progreso.get('filas_por_segundo', 0.0):.1f} filas/s en esta ejecución)")
+    if exactitud(progreso) is not None:
+        print(f"Exactitud: {exactitud(progreso):.3f} ({progreso['aciertos']}/{progreso['etiquetadas']})")
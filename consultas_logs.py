@@ -0,0 +1,192 @@
+# consultas_logs.py
+# Consultas paginadas sobre el historial completo (archivo compactado, legado,
+# segmentos rotados y segmento activo) con filtros por rango de tiempo,
+# usuario y tipo.
+#
+# Las fuentes se recorren de la más nueva a la más vieja y cada una de atrás
+# hacia adelante, así que la consulta termina en cuanto junta `limite` eventos:
+# no se ordena ni se carga el historial completo. Dentro de un segmento JSONL
+# el límite superior se ubica con búsqueda binaria sobre los bytes del archivo
+# (los eventos se agregan en orden de timestamp) y dentro de una partición
+# archivada con bisect sobre sus timestamps.
+import bisect
+import json
+import os
+from collections import OrderedDict
+
+import registro_eventos
+import retencion_logs
+
+TAMANO_BLOQUE = 64 * 1024
+
+# Particiones archivadas descomprimidas que se mantienen en memoria
+MAXIMO_PARTICIONES_EN_MEMORIA = 4
+
+_particiones = OrderedDict()
+_legado = {}
+
+
+def _limite_superior(hasta, antes_de):
+    """Combina `hasta` (inclusivo, por prefijo) y `antes_de` (exclusivo) en un límite exclusivo"""
+    limites = []
+    if hasta:
+        # '2025-01-31' debe incluir cualquier timestamp de ese día
+        limites.append(hasta + "\uffff")
+    if antes_de:
+        limites.append(antes_de)
+    return min(limites) if limites else None
+
+
+def _timestamp_linea(linea):
+    try:
+        return json.loads(linea).get("timestamp", "")
+    except (json.JSONDecodeError, AttributeError):
+        return None
+
+
+def _buscar_offset(f, tamano, limite):
+    """Offset del inicio de una línea tal que las posteriores tienen timestamp >= limite"""
+    inicio, fin = 0, tamano
+    while fin - inicio > TAMANO_BLOQUE:
+        medio = (inicio + fin) // 2
+        f.seek(medio)
+        f.readline()
+        timestamp = None
+        while timestamp is None:
+            linea = f.readline()
+            if not linea:
+                break
+            timestamp = _timestamp_linea(linea)
+        if timestamp is not None and timestamp < limite:
+            inicio = medio
+        else:
+            fin = medio
+    # Se avanza hasta el siguiente inicio de línea después de `fin`
+    if fin >= tamano:
+        return tamano
+    f.seek(fin)
+    if fin:
+        f.readline()
+    return f.tell()
+
+
+def _lineas_inversas(f, fin):
+    """Recorre las líneas completas de [0, fin) desde el final hacia el inicio"""
+    posicion = fin
+    resto = b""
+    while posicion > 0:
+        leer = min(TAMANO_BLOQUE, posicion)
+        posicion -= leer
+        f.seek(posicion)
+        lineas = (f.read(leer) + resto).split(b"\n")
+        resto = lineas[0]
+        for linea in reversed(lineas[1:]):
+            if linea.strip():
+                yield linea
+    if resto.strip():
+        yield resto
+
+
+def _eventos_segmento(ruta, superior):
+    """Eventos de un segmento JSONL por debajo del límite, del más nuevo al más viejo"""
+    try:
+        f = open(ruta, 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        tamano = os.fstat(f.fileno()).st_size
+        fin = _buscar_offset(f, tamano, superior) if superior else tamano
+        for linea in _lineas_inversas(f, fin):
+            try:
+                evento = json.loads(linea)
+            except json.JSONDecodeError:
+                # Línea a medio escribir
+                continue
+            yield registro_eventos.normalizar_busqueda(evento)
+
+
+def _cargar_particion(ruta):
+    """Eventos y timestamps de una partición archivada, con caché LRU"""
+    mtime = os.path.getmtime(ruta)
+    guardada = _particiones.get(ruta)
+    if guardada is None or guardada[0] != mtime:
+        eventos = list(retencion_logs.leer_particion(ruta))
+        guardada = (mtime, [evento.get("timestamp", "") for evento in eventos], eventos)
+        _particiones[ruta] = guardada
+    _particiones.move_to_end(ruta)
+    while len(_particiones) > MAXIMO_PARTICIONES_EN_MEMORIA:
+        _particiones.popitem(last=False)
+    return guardada[1], guardada[2]
+
+
+def _eventos_ordenados(timestamps, eventos, superior):
+    fin = bisect.bisect_left(timestamps, superior) if superior else len(eventos)
+    for indice in range(fin - 1, -1, -1):
+        yield eventos[indice]
+
+
+def _eventos_legado(archivo_legado, superior):
+    """Eventos del sistema_logs.json sin migrar, ordenados una sola vez"""
+    if not os.path.exists(archivo_legado):
+        return iter(())
+    mtime = os.path.getmtime(archivo_legado)
+    if _legado.get("mtime") != mtime:
+        eventos = sorted(registro_eventos.leer_legado(archivo_legado),
+                         key=lambda evento: evento.get("timestamp", ""))
+        _legado.update(mtime=mtime, eventos=eventos,
+                       timestamps=[evento.get("timestamp", "") for evento in eventos])
+    return _eventos_ordenados(_legado["timestamps"], _legado["eventos"], superior)
+
+
+def _fuentes(desde, superior, archivo, archivo_legado):
+    """Generadores de eventos por fuente, de la más nueva a la más vieja"""
+    yield _eventos_segmento(archivo, superior)
+    for ruta in reversed(registro_eventos.segmentos_rotados(archivo)):
+        yield _eventos_segmento(ruta, superior)
+    yield _eventos_legado(archivo_legado, superior)
+    for clave, ruta in reversed(retencion_logs.particiones()):
+        # Las particiones fuera del rango ni siquiera se descomprimen
+        if desde and clave < desde[:len(clave)]:
+            break
+        if superior and clave > superior[:len(clave)]:
+            continue
+        timestamps, eventos = _cargar_particion(ruta)
+        yield _eventos_ordenados(timestamps, eventos, superior)
+
+
+def consultar(tipos=None, usuario=None, desde=None, hasta=None, antes_de=None, limite=50,
+              archivo=registro_eventos.ARCHIVO_EVENTOS,
+              archivo_legado=registro_eventos.ARCHIVO_LEGADO):
+    """Eventos que cumplen los filtros, del más nuevo al más viejo
+
+    desde/hasta son prefijos ISO inclusivos ('2025-01-31' incluye todo el día).
+    antes_de es exclusivo: para la página siguiente se pasa el timestamp del
+    último evento de la página actual.
+    """
+    if registro_eventos.BACKEND == "sqlite":
+        import almacen_sqlite
+        return almacen_sqlite.consultar(tipos, usuario, desde, hasta, antes_de, limite)
+
+    superior = _limite_superior(hasta, antes_de)
+    tipos = set(tipos) if tipos else None
+    encontrados = []
+    for fuente in _fuentes(desde, superior, archivo, archivo_legado):
+        for evento in fuente:
+            timestamp = evento.get("timestamp", "")
+            if superior and timestamp >= superior:
+                continue
+            if desde and timestamp < desde:
+                # El resto de esta fuente es más viejo todavía
+                break
+            if tipos and evento.get("tipo") not in tipos:
+                continue
+            if usuario and evento.get("usuario") != usuario:
+                continue
+            encontrados.append(evento)
+            if len(encontrados) == limite:
+                break
+        if len(encontrados) == limite:
+            break
+    # Corrige desórdenes mínimos entre escritores concurrentes
+    encontrados.sort(key=lambda evento: evento.get("timestamp", ""), reverse=True)
+    return encontrados
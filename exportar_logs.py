@@ -0,0 +1,279 @@
+# exportar_logs.py
+# Exporta el historial de eventos a CSV, Parquet o Arrow (IPC) en streaming.
+#
+# Los eventos se leen en orden cronológico y se escriben por lotes de
+# TAMANO_LOTE, así que la memoria usada no depende del tamaño del log. Las
+# búsquedas salen con sus campos tipados como columnas (descripcion,
+# resultado, prob_arrufo, prob_puntual, version_modelo); los eventos con el
+# formato viejo se convierten al leerlos.
+#
+# Cada exportación guarda un punto de control en <destino>.progreso.json
+# (después de cada lote en CSV). Con --reanudar se continúa desde el último
+# evento escrito dentro del mismo rango de tiempo. Parquet y Arrow no admiten
+# agregar datos a un archivo cerrado, así que en esos formatos el destino es
+# un directorio con un archivo por tramo de LOTES_POR_PARTE lotes y el punto
+# de control se guarda al cerrar cada tramo.
+#
+# Uso: python exportar_logs.py destino [--formato csv|parquet|arrow]
+#                              [--desde AAAA-MM-DD] [--hasta AAAA-MM-DD]
+#                              [--lote N] [--reanudar]
+import argparse
+import csv
+import itertools
+import json
+import os
+
+import registro_eventos
+import retencion_logs
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+COLUMNAS = ("timestamp", "fecha", "hora", "usuario", "tipo", "detalles",
+            "descripcion", "resultado", "prob_arrufo", "prob_puntual", "version_modelo")
+
+FORMATOS = ("csv", "parquet", "arrow")
+
+TAMANO_LOTE = 10000
+
+# Lotes por archivo en Parquet/Arrow; cada archivo cerrado es un punto de control
+LOTES_POR_PARTE = 20
+
+
+def _en_rango(evento, desde, hasta):
+    timestamp = evento.get("timestamp", "")
+    if desde and timestamp < desde:
+        return False
+    if hasta and timestamp[:len(hasta)] > hasta:
+        return False
+    return True
+
+
+def iterar_eventos(desde=None, hasta=None):
+    """Recorre en orden cronológico los eventos entre desde y hasta (prefijos ISO inclusivos)"""
+    if registro_eventos.BACKEND == "sqlite":
+        import almacen_sqlite
+        yield from almacen_sqlite.iterar_rango(desde, hasta)
+        return
+
+    # Las particiones archivadas fuera del rango no se descomprimen
+    fuentes = [
+        retencion_logs.leer_archivo(desde, hasta),
+        registro_eventos.leer_legado(),
+    ]
+    fuentes.extend(registro_eventos.leer_segmento(ruta)
+                   for ruta in registro_eventos.segmentos_rotados(registro_eventos.ARCHIVO_EVENTOS))
+    fuentes.append(registro_eventos.leer_segmento(registro_eventos.ARCHIVO_EVENTOS))
+    for evento in itertools.chain.from_iterable(fuentes):
+        if _en_rango(evento, desde, hasta):
+            yield evento
+
+
+def _fila(evento):
+    return [evento.get(columna) for columna in COLUMNAS]
+
+
+def _lotes(eventos, tamano_lote):
+    lote = []
+    for evento in eventos:
+        lote.append(evento)
+        if len(lote) >= tamano_lote:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+class EscritorCSV:
+    """CSV con encabezado; al reanudar se recorta lo escrito después del último punto de control"""
+
+    def __init__(self, destino, offset=None):
+        nuevo = not offset
+        self.archivo = open(destino, 'w' if nuevo else 'r+', encoding='utf-8', newline='')
+        if not nuevo:
+            self.archivo.seek(offset)
+            self.archivo.truncate()
+        self.escritor = csv.writer(self.archivo)
+        if nuevo:
+            self.escritor.writerow(COLUMNAS)
+
+    def escribir(self, lote):
+        self.escritor.writerows(_fila(evento) for evento in lote)
+        self.archivo.flush()
+
+    def posicion(self):
+        return self.archivo.tell()
+
+    def cerrar(self):
+        self.archivo.close()
+
+    def descartar(self):
+        # Lo escrito después del último punto de control se recorta al reanudar
+        self.archivo.close()
+
+
+def _esquema():
+    return pyarrow.schema(
+        [(columna, pyarrow.string()) for columna in COLUMNAS[:8]]
+        + [("prob_arrufo", pyarrow.float64()), ("prob_puntual", pyarrow.float64()),
+           ("version_modelo", pyarrow.string())]
+    )
+
+
+def _tabla(lote, esquema):
+    columnas = {columna: [evento.get(columna) for evento in lote] for columna in COLUMNAS}
+    return pyarrow.Table.from_pydict(columnas, schema=esquema)
+
+
+class EscritorColumnar:
+    """Parquet o Arrow IPC: un archivo por tramo dentro del directorio destino"""
+
+    def __init__(self, destino, formato, parte):
+        os.makedirs(destino, exist_ok=True)
+        self.esquema = _esquema()
+        extension = "parquet" if formato == "parquet" else "arrow"
+        self.ruta = os.path.join(destino, f"parte-{parte:05d}.{extension}")
+        self.temporal = self.ruta + ".tmp"
+        if formato == "parquet":
+            self.escritor = pyarrow.parquet.ParquetWriter(self.temporal, self.esquema, compression="zstd")
+        else:
+            self.escritor = pyarrow.ipc.new_file(self.temporal, self.esquema)
+        self.formato = formato
+
+    def escribir(self, lote):
+        tabla = _tabla(lote, self.esquema)
+        if self.formato == "parquet":
+            # Cada lote queda como un row group
+            self.escritor.write_table(tabla)
+        else:
+            self.escritor.write_table(tabla, max_chunksize=len(lote))
+
+    def cerrar(self):
+        self.escritor.close()
+        os.replace(self.temporal, self.ruta)
+
+    def descartar(self):
+        self.escritor.close()
+        os.remove(self.temporal)
+
+
+def ruta_progreso(destino):
+    return destino.rstrip("/\\") + ".progreso.json"
+
+
+def _leer_progreso(destino):
+    try:
+        with open(ruta_progreso(destino), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def _guardar_progreso(destino, progreso):
+    temporal = ruta_progreso(destino) + ".tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(progreso, f, ensure_ascii=False)
+    os.replace(temporal, ruta_progreso(destino))
+
+
+def _saltear_exportados(eventos, ultimo_timestamp, repetidos):
+    """Descarta lo exportado antes de reanudar: hasta ultimo_timestamp y sus `repetidos` iguales"""
+    for evento in eventos:
+        timestamp = evento.get("timestamp", "")
+        if timestamp < ultimo_timestamp:
+            continue
+        if timestamp == ultimo_timestamp and repetidos > 0:
+            repetidos -= 1
+            continue
+        yield evento
+
+
+def exportar(destino, formato="csv", desde=None, hasta=None, tamano_lote=TAMANO_LOTE,
+             reanudar=False, al_avanzar=None):
+    """Exporta los eventos del rango a destino; devuelve cuántos se escribieron en total
+
+    al_avanzar(total) se llama después de cada lote.
+    """
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconocido: {formato}")
+    if formato != "csv" and pyarrow is None:
+        raise RuntimeError("Se necesita 'pip install pyarrow' para exportar a Parquet o Arrow")
+
+    progreso = _leer_progreso(destino) if reanudar else None
+    if progreso and (progreso["formato"], progreso["desde"], progreso["hasta"]) != (formato, desde, hasta):
+        raise ValueError("El punto de control es de otra exportación (formato o rango distintos)")
+    if progreso is None:
+        progreso = {"formato": formato, "desde": desde, "hasta": hasta, "total": 0,
+                    "ultimo_timestamp": None, "repetidos": 0, "offset": None, "parte": 0,
+                    "completo": False}
+    elif progreso["completo"]:
+        return progreso["total"]
+
+    eventos = iterar_eventos(progreso["ultimo_timestamp"] or desde, hasta)
+    if progreso["ultimo_timestamp"]:
+        eventos = _saltear_exportados(eventos, progreso["ultimo_timestamp"], progreso["repetidos"])
+
+    escritor = None
+    lotes_en_parte = 0
+    try:
+        for lote in _lotes(eventos, tamano_lote):
+            if escritor is None:
+                if formato == "csv":
+                    escritor = EscritorCSV(destino, progreso["offset"])
+                else:
+                    escritor = EscritorColumnar(destino, formato, progreso["parte"] + 1)
+            escritor.escribir(lote)
+            lotes_en_parte += 1
+
+            ultimo = lote[-1].get("timestamp", "")
+            repetidos = sum(1 for evento in lote if evento.get("timestamp", "") == ultimo)
+            if ultimo == progreso["ultimo_timestamp"]:
+                repetidos += progreso["repetidos"]
+            avance = {"total": progreso["total"] + len(lote), "ultimo_timestamp": ultimo,
+                      "repetidos": repetidos}
+
+            if formato == "csv":
+                progreso.update(avance, offset=escritor.posicion())
+                _guardar_progreso(destino, progreso)
+            else:
+                pendiente = dict(avance, parte=progreso["parte"] + 1)
+                # En Parquet/Arrow el punto de control solo vale cuando el tramo se cierra
+                if lotes_en_parte >= LOTES_POR_PARTE:
+                    escritor.cerrar()
+                    escritor = None
+                    lotes_en_parte = 0
+                    progreso.update(pendiente)
+                    _guardar_progreso(destino, progreso)
+            if al_avanzar:
+                al_avanzar(avance["total"])
+    except BaseException:
+        if escritor is not None:
+            escritor.descartar()
+        raise
+
+    if escritor is not None:
+        escritor.cerrar()
+        if formato != "csv":
+            progreso.update(pendiente)
+    progreso["completo"] = True
+    _guardar_progreso(destino, progreso)
+    return progreso["total"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta el historial de eventos")
+    parser.add_argument("destino")
+    parser.add_argument("--formato", choices=FORMATOS, default="csv")
+    parser.add_argument("--desde")
+    parser.add_argument("--hasta")
+    parser.add_argument("--lote", type=int, default=TAMANO_LOTE)
+    parser.add_argument("--reanudar", action="store_true")
+    argumentos = parser.parse_args()
+    total = exportar(argumentos.destino, argumentos.formato, argumentos.desde, argumentos.hasta,
+                     argumentos.lote, argumentos.reanudar,
+                     al_avanzar=lambda total: print(f"\rEventos exportados: {total}", end="", flush=True))
+    print(f"\rEventos exportados: {total}")
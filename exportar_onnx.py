@@ -0,0 +1,107 @@
+# exportar_onnx.py
+# Convierte ./fisuras_classifier a ONNX para los backends "onnx" y
+# "onnx-int8" de modelo_fisuras (FISURAS_BACKEND).
+#
+# Genera en RUTA_ONNX:
+#   modelo.onnx             exportación directa (float32) con ejes dinámicos
+#                           de lote y secuencia, para el relleno por lotes
+#   modelo.optimizado.onnx  el mismo grafo con las optimizaciones de ONNX
+#                           Runtime (fusión de atención, capas, GELU...)
+#   modelo.int8.onnx        pesos cuantizados dinámicamente a int8
+#   origen.json             versión del modelo del que salieron
+#
+# Uso: python exportar_onnx.py [--modelo RUTA] [--destino RUTA] [--opset N]
+#
+# Después, python paridad_onnx.py compara exactitud, deriva de
+# probabilidades, latencia y memoria de los tres backends.
+import argparse
+import json
+import os
+
+from modelo_fisuras import BACKENDS, RUTA_MODELO, RUTA_ONNX, obtener_version_modelo
+
+ARCHIVO_FP32 = "modelo.onnx"
+ARCHIVO_ORIGEN = "origen.json"
+
+OPSET = 17
+
+
+def exportar_fp32(ruta_modelo, destino, opset=OPSET):
+    """Exporta el modelo de transformers a ONNX float32; devuelve la ruta generada"""
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+
+    tokenizer = AutoTokenizer.from_pretrained(ruta_modelo)
+    model = AutoModelForSequenceClassification.from_pretrained(ruta_modelo)
+    model.eval()
+
+    ejemplo = tokenizer(["Fisura diagonal en la esquina de la ventana"], return_tensors="pt")
+    nombres = [nombre for nombre in ("input_ids", "attention_mask", "token_type_ids") if nombre in ejemplo]
+    ejes = {nombre: {0: "lote", 1: "secuencia"} for nombre in nombres}
+    ejes["logits"] = {0: "lote"}
+
+    ruta = os.path.join(destino, ARCHIVO_FP32)
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            # Un diccionario al final de args se pasa como argumentos con nombre
+            ({nombre: ejemplo[nombre] for nombre in nombres},),
+            ruta,
+            input_names=nombres,
+            output_names=["logits"],
+            dynamic_axes=ejes,
+            opset_version=opset,
+            do_constant_folding=True,
+        )
+    return ruta
+
+
+def optimizar(ruta_fp32, destino):
+    """Guarda el grafo optimizado por ONNX Runtime"""
+    import onnxruntime
+
+    ruta = os.path.join(destino, BACKENDS["onnx"])
+    opciones = onnxruntime.SessionOptions()
+    # EXTENDED y no ALL: el archivo guardado debe seguir siendo portable entre CPUs
+    opciones.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED
+    opciones.optimized_model_filepath = ruta
+    onnxruntime.InferenceSession(ruta_fp32, opciones, providers=["CPUExecutionProvider"])
+    return ruta
+
+
+def cuantizar(ruta_fp32, destino):
+    """Cuantización dinámica a int8 de los pesos (MatMul/Gemm)"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    ruta = os.path.join(destino, BACKENDS["onnx-int8"])
+    quantize_dynamic(ruta_fp32, ruta, weight_type=QuantType.QInt8)
+    return ruta
+
+
+def exportar(ruta_modelo=RUTA_MODELO, destino=RUTA_ONNX, opset=OPSET):
+    os.makedirs(destino, exist_ok=True)
+    ruta_fp32 = exportar_fp32(ruta_modelo, destino, opset)
+    rutas = [ruta_fp32, optimizar(ruta_fp32, destino), cuantizar(ruta_fp32, destino)]
+    with open(os.path.join(destino, ARCHIVO_ORIGEN), 'w', encoding='utf-8') as f:
+        json.dump({"modelo": os.path.abspath(ruta_modelo), "version": obtener_version_modelo(ruta_modelo),
+                   "opset": opset}, f, ensure_ascii=False, indent=2)
+    return rutas
+
+
+def exportacion_vigente(ruta_modelo=RUTA_MODELO, destino=RUTA_ONNX):
+    """True si los archivos ONNX salieron de la versión actual del modelo"""
+    try:
+        with open(os.path.join(destino, ARCHIVO_ORIGEN), 'r', encoding='utf-8') as f:
+            return json.load(f)["version"] == obtener_version_modelo(ruta_modelo)
+    except (OSError, ValueError, KeyError):
+        return False
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta el clasificador de fisuras a ONNX (float32 e int8)")
+    parser.add_argument("--modelo", default=RUTA_MODELO)
+    parser.add_argument("--destino", default=RUTA_ONNX)
+    parser.add_argument("--opset", type=int, default=OPSET)
+    argumentos = parser.parse_args()
+    for ruta in exportar(argumentos.modelo, argumentos.destino, argumentos.opset):
+        print(f"{ruta}: {os.path.getsize(ruta) / 1024 / 1024:.1f} MB")
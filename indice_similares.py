@@ -0,0 +1,450 @@
+# indice_similares.py
+# Índice de casos similares: vectores de oración (ClasificadorFisuras.embeddings)
+# de las descripciones etiquetadas de fisuras_base_limpia.csv y de las
+# búsquedas registradas, para mostrar en la interfaz los k casos conocidos
+# más parecidos a la descripción analizada.
+#
+# Archivos en DIRECTORIO_INDICE (variable de entorno FISURAS_INDICE):
+#   vectores.f16     matriz float16 (filas x dimension) sin encabezado; se
+#                    abre con np.memmap y no se carga entera en memoria
+#   metadatos.jsonl  una línea por fila: etiquetas (cuántas veces aparece
+#                    el texto con cada una), etiqueta (la más frecuente),
+#                    texto, origen ("corpus" o "busqueda"), clave y timestamp
+#   indice.json      dimension, filas y bytes de metadatos confirmados,
+#                    versión del modelo de los vectores y estado del IVF
+#   centroides.npy   centroides del índice particionado (IVF), si se construyó
+#   asignacion.i32   lista de cada fila en el IVF (int32)
+#
+# Cada texto se indexa una vez (las filas repetidas del CSV y las búsquedas
+# ya indexadas se omiten, ver clave_texto). Un texto repetido con etiquetas
+# distintas guarda todas, con sus conteos.
+#
+# Agregar filas no reconstruye nada: se escriben al final de los archivos y
+# se confirman reescribiendo indice.json, bajo un bloqueo entre procesos. Lo
+# que quedó después de lo confirmado (una escritura interrumpida) se descarta
+# en el siguiente agregado.
+#
+# La búsqueda es exacta (producto matricial por bloques) hasta UMBRAL_IVF
+# filas; con más, y si se construyó el IVF, solo recorre las SONDAS_IVF
+# listas de centroides más cercanos a la consulta.
+#
+# Uso: python indice_similares.py construir [--csv RUTA] [--sin-busquedas]
+#      python indice_similares.py agregar-busquedas
+#      python indice_similares.py ivf [--listas N]
+#      python indice_similares.py buscar "descripción" [-k 5] [--exacto]
+import argparse
+import collections
+import hashlib
+import json
+import math
+import os
+import shutil
+import time
+import uuid
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+import registro_eventos
+from cache_predicciones import normalizar_texto
+from modelo_fisuras import leer_csv_fisuras
+
+DIRECTORIO_INDICE = os.environ.get("FISURAS_INDICE", "indice_similares")
+ARCHIVO_CSV = "fisuras_base_limpia.csv"
+
+ARCHIVO_VECTORES = "vectores.f16"
+ARCHIVO_METADATOS = "metadatos.jsonl"
+ARCHIVO_INDICE = "indice.json"
+ARCHIVO_CENTROIDES = "centroides.npy"
+ARCHIVO_ASIGNACION = "asignacion.i32"
+
+# Filas desde las que conviene buscar con el IVF en lugar de recorrer todo
+UMBRAL_IVF = 50000
+SONDAS_IVF = 16
+
+# Filas por bloque en la búsqueda exacta y en la asignación del IVF
+FILAS_BLOQUE = 8192
+
+# Descripciones por llamada a embeddings al construir
+TEXTOS_POR_TANDA = 256
+
+VECINOS = 5
+
+
+def clave_texto(texto):
+    """Clave de una descripción para no indexar dos veces el mismo texto"""
+    return hashlib.sha256(normalizar_texto(texto).encode("utf-8")).hexdigest()[:32]
+
+
+def _top_k(puntajes, k):
+    """Posiciones de los k mayores puntajes, de mayor a menor"""
+    if len(puntajes) > k:
+        posiciones = np.argpartition(-puntajes, k - 1)[:k]
+    else:
+        posiciones = np.arange(len(puntajes))
+    return posiciones[np.argsort(-puntajes[posiciones], kind="stable")]
+
+
+class IndiceSimilares:
+    """Vectores en disco (float16, memmap) con sus metadatos y búsqueda top-k"""
+
+    def __init__(self, directorio=DIRECTORIO_INDICE):
+        self.directorio = directorio
+        self.identificador = None
+        self.dimension = 0
+        self.filas = 0
+        self.bytes_metadatos = 0
+        self.version_modelo = None
+        self.metadatos = []
+        self.claves = set()
+        self.vectores = None
+        self.centroides = None
+        self.asignadas = 0
+        self.listas = None
+        self._marca = None
+        self._actualizar()
+
+    def _ruta(self, archivo):
+        return os.path.join(self.directorio, archivo)
+
+    @classmethod
+    def crear(cls, directorio, dimension, version_modelo):
+        """Índice vacío en directorio (que no debe existir)"""
+        os.makedirs(directorio)
+        for archivo in (ARCHIVO_VECTORES, ARCHIVO_METADATOS):
+            open(os.path.join(directorio, archivo), 'wb').close()
+        cls._escribir_estado(directorio, {
+            "identificador": uuid.uuid4().hex,
+            "dimension": int(dimension),
+            "filas": 0,
+            "bytes_metadatos": 0,
+            "version_modelo": version_modelo,
+            "listas": 0,
+            "asignadas": 0,
+        })
+        return cls(directorio)
+
+    @staticmethod
+    def _escribir_estado(directorio, estado):
+        ruta = os.path.join(directorio, ARCHIVO_INDICE)
+        temporal = ruta + ".tmp"
+        with open(temporal, 'w', encoding='utf-8') as f:
+            json.dump(estado, f, ensure_ascii=False, indent=2)
+        os.replace(temporal, ruta)
+
+    def _leer_estado(self):
+        with open(self._ruta(ARCHIVO_INDICE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def _actualizar(self):
+        """Relee lo que otros procesos agregaron desde la última lectura"""
+        ruta = self._ruta(ARCHIVO_INDICE)
+        informacion = os.stat(ruta)
+        marca = (informacion.st_mtime_ns, informacion.st_size)
+        if marca == self._marca:
+            return
+        estado = self._leer_estado()
+        if estado["identificador"] != self.identificador:
+            # Índice reconstruido: se empieza de cero
+            self.identificador = estado["identificador"]
+            self.metadatos, self.claves = [], set()
+            self.filas = self.bytes_metadatos = 0
+        if estado["bytes_metadatos"] > self.bytes_metadatos:
+            with open(self._ruta(ARCHIVO_METADATOS), 'rb') as f:
+                f.seek(self.bytes_metadatos)
+                nuevos = f.read(estado["bytes_metadatos"] - self.bytes_metadatos)
+            for linea in nuevos.decode("utf-8").splitlines():
+                metadatos = json.loads(linea)
+                self.metadatos.append(metadatos)
+                self.claves.add(metadatos["clave"])
+
+        self.dimension = estado["dimension"]
+        self.filas = estado["filas"]
+        self.bytes_metadatos = estado["bytes_metadatos"]
+        self.version_modelo = estado["version_modelo"]
+        # memmap no admite archivos vacíos
+        self.vectores = (np.memmap(self._ruta(ARCHIVO_VECTORES), dtype=np.float16, mode="r",
+                                   shape=(self.filas, self.dimension)) if self.filas else None)
+        self.asignadas = estado.get("asignadas", 0) if estado.get("listas") else 0
+        if self.asignadas:
+            self.centroides = np.load(self._ruta(ARCHIVO_CENTROIDES))
+            asignacion = np.fromfile(self._ruta(ARCHIVO_ASIGNACION), dtype=np.int32, count=self.asignadas)
+            # Listas invertidas: filas ordenadas por lista y dónde empieza cada una
+            orden = np.argsort(asignacion, kind="stable").astype(np.int64)
+            inicios = np.searchsorted(asignacion[orden], np.arange(len(self.centroides) + 1))
+            self.listas = (orden, inicios)
+        else:
+            self.centroides = self.listas = None
+        self._marca = marca
+
+    def agregar(self, vectores, metadatos):
+        """Agrega filas sin reconstruir; omite las de textos ya indexados. Devuelve cuántas agregó"""
+        vectores = np.asarray(vectores, dtype=np.float32).reshape(len(metadatos), -1)
+        with registro_eventos.bloqueo_archivo(self._ruta(ARCHIVO_INDICE)):
+            self._actualizar()
+            if vectores.shape[1] != self.dimension:
+                raise ValueError(f"Dimensión {vectores.shape[1]}, el índice usa {self.dimension}")
+            nuevas, lineas, claves = [], [], set()
+            for posicion, datos in enumerate(metadatos):
+                if datos["clave"] in self.claves or datos["clave"] in claves:
+                    continue
+                claves.add(datos["clave"])
+                nuevas.append(posicion)
+                lineas.append(json.dumps(datos, ensure_ascii=False) + "\n")
+            if not nuevas:
+                return 0
+            vectores = vectores[nuevas]
+            contenido = "".join(lineas).encode("utf-8")
+
+            # Se trunca a lo confirmado por si una escritura anterior quedó a medias
+            for archivo, confirmado, datos in (
+                    (ARCHIVO_VECTORES, self.filas * self.dimension * 2, vectores.astype("<f2").tobytes()),
+                    (ARCHIVO_METADATOS, self.bytes_metadatos, contenido)):
+                with open(self._ruta(archivo), 'r+b') as f:
+                    # Solo si sobra algo: en Windows no se puede truncar un archivo mapeado
+                    if os.fstat(f.fileno()).st_size > confirmado:
+                        f.truncate(confirmado)
+                    f.seek(confirmado)
+                    f.write(datos)
+
+            estado = self._leer_estado()
+            if self.asignadas:
+                # Cada fila nueva va a la lista de su centroide más cercano
+                asignacion = np.argmax(vectores @ self.centroides.T, axis=1).astype("<i4")
+                with open(self._ruta(ARCHIVO_ASIGNACION), 'r+b') as f:
+                    if os.fstat(f.fileno()).st_size > self.asignadas * 4:
+                        f.truncate(self.asignadas * 4)
+                    f.seek(self.asignadas * 4)
+                    f.write(asignacion.tobytes())
+                estado["asignadas"] = self.asignadas + len(nuevas)
+            estado["filas"] = self.filas + len(nuevas)
+            estado["bytes_metadatos"] = self.bytes_metadatos + len(contenido)
+            self._escribir_estado(self.directorio, estado)
+            self._actualizar()
+        return len(nuevas)
+
+    def _candidatos(self, consulta, sondas):
+        """Filas a recorrer con el IVF: las listas más cercanas y las filas sin asignar"""
+        orden, inicios = self.listas
+        cercanas = _top_k(self.centroides @ consulta, sondas)
+        partes = [orden[inicios[lista]:inicios[lista + 1]] for lista in cercanas]
+        partes.append(np.arange(self.asignadas, self.filas))
+        return np.sort(np.concatenate(partes))
+
+    def buscar(self, consulta, k=VECINOS, excluir=(), exacto=False, sondas=SONDAS_IVF):
+        """Los k vecinos más similares (coseno) a consulta: lista de (similitud, metadatos)
+
+        excluir: claves de búsquedas registradas que no se muestran (la misma
+        consulta, si ya se había hecho); las filas del corpus nunca se excluyen.
+        """
+        self._actualizar()
+        if not self.filas:
+            return []
+        consulta = np.asarray(consulta, dtype=np.float32).ravel()
+        consulta = consulta / max(float(np.linalg.norm(consulta)), 1e-12)
+        # Se piden de más para poder descartar las filas excluidas
+        pedidos = k + len(excluir)
+
+        mejores_filas = np.empty(0, dtype=np.int64)
+        mejores_puntajes = np.empty(0, dtype=np.float32)
+        if self.asignadas and not exacto and self.filas >= UMBRAL_IVF:
+            candidatos = self._candidatos(consulta, sondas)
+            bloques = [candidatos[i:i + FILAS_BLOQUE] for i in range(0, len(candidatos), FILAS_BLOQUE)]
+        else:
+            bloques = [slice(i, min(i + FILAS_BLOQUE, self.filas)) for i in range(0, self.filas, FILAS_BLOQUE)]
+        for bloque in bloques:
+            filas = np.arange(bloque.start, bloque.stop) if isinstance(bloque, slice) else bloque
+            puntajes = np.asarray(self.vectores[bloque], dtype=np.float32) @ consulta
+            filas = np.concatenate([mejores_filas, filas])
+            puntajes = np.concatenate([mejores_puntajes, puntajes])
+            seleccion = _top_k(puntajes, pedidos)
+            mejores_filas, mejores_puntajes = filas[seleccion], puntajes[seleccion]
+
+        vecinos = []
+        for fila, puntaje in zip(mejores_filas, mejores_puntajes):
+            metadatos = self.metadatos[fila]
+            if metadatos["origen"] == "busqueda" and metadatos["clave"] in excluir:
+                continue
+            vecinos.append((float(puntaje), metadatos))
+            if len(vecinos) == k:
+                break
+        return vecinos
+
+    def construir_ivf(self, listas=None, iteraciones=10, semilla=13):
+        """k-means esférico sobre una muestra y asignación de todas las filas a su lista"""
+        with registro_eventos.bloqueo_archivo(self._ruta(ARCHIVO_INDICE)):
+            self._actualizar()
+            if not self.filas:
+                return 0
+            listas = min(listas or max(1, int(4 * math.sqrt(self.filas))), self.filas)
+            generador = np.random.default_rng(semilla)
+            muestra = np.sort(generador.choice(self.filas, size=min(self.filas, 256 * listas), replace=False))
+            datos = np.asarray(self.vectores[muestra], dtype=np.float32)
+            centroides = datos[generador.choice(len(datos), size=listas, replace=False)]
+            for _ in range(iteraciones):
+                asignacion = np.argmax(datos @ centroides.T, axis=1)
+                sumas = np.zeros_like(centroides)
+                np.add.at(sumas, asignacion, datos)
+                vacias = np.bincount(asignacion, minlength=listas) == 0
+                # Una lista que quedó vacía se reinicia en un punto al azar
+                sumas[vacias] = datos[generador.choice(len(datos), size=int(vacias.sum()))]
+                centroides = sumas / np.maximum(np.linalg.norm(sumas, axis=1, keepdims=True), 1e-12)
+
+            asignacion = np.concatenate([
+                np.argmax(np.asarray(self.vectores[i:i + FILAS_BLOQUE], dtype=np.float32) @ centroides.T, axis=1)
+                for i in range(0, self.filas, FILAS_BLOQUE)]).astype("<i4")
+            np.save(self._ruta(ARCHIVO_CENTROIDES), centroides.astype(np.float32))
+            asignacion.tofile(self._ruta(ARCHIVO_ASIGNACION))
+            estado = self._leer_estado()
+            estado["listas"] = int(listas)
+            estado["asignadas"] = int(len(asignacion))
+            self._escribir_estado(self.directorio, estado)
+            self._actualizar()
+        return listas
+
+    def exhaustividad_ivf(self, k=VECINOS, consultas=200, sondas=SONDAS_IVF, semilla=13):
+        """Fracción de los k vecinos exactos que también encuentra el IVF, sobre filas al azar"""
+        generador = np.random.default_rng(semilla)
+        filas = generador.choice(self.filas, size=min(consultas, self.filas), replace=False)
+        encontrados = 0
+        for fila in filas:
+            consulta = np.asarray(self.vectores[fila], dtype=np.float32)
+            exactos = {datos["clave"] for _, datos in self.buscar(consulta, k, exacto=True)}
+            # Se fuerza el IVF aunque el índice sea más chico que UMBRAL_IVF
+            candidatos = self._candidatos(consulta / max(float(np.linalg.norm(consulta)), 1e-12), sondas)
+            puntajes = np.asarray(self.vectores[candidatos], dtype=np.float32) @ consulta
+            aproximados = {self.metadatos[candidatos[i]]["clave"] for i in _top_k(puntajes, k)}
+            encontrados += len(exactos & aproximados)
+        return encontrados / (len(filas) * k)
+
+
+def abrir_indice(directorio=DIRECTORIO_INDICE):
+    """Índice de casos similares, o None si falta NumPy o todavía no se construyó"""
+    if np is None or not os.path.exists(os.path.join(directorio, ARCHIVO_INDICE)):
+        return None
+    try:
+        return IndiceSimilares(directorio)
+    except Exception as e:
+        print(f"Error abriendo índice de casos similares: {e}")
+        return None
+
+
+def metadatos_fila(etiquetas, texto, origen):
+    """Metadatos de una fila; etiquetas: {etiqueta: veces que aparece el texto con ella}"""
+    # Empate: la primera en orden alfabético, para que no dependa del orden de lectura
+    etiqueta = min(etiquetas, key=lambda nombre: (-etiquetas[nombre], nombre))
+    return {"etiqueta": etiqueta, "etiquetas": dict(etiquetas), "texto": texto, "origen": origen,
+            "clave": clave_texto(texto), "timestamp": time.time()}
+
+
+def agregar_textos(indice, clasificador, filas, origen):
+    """Calcula los vectores de (etiqueta, texto) nuevos y los agrega por tandas; devuelve cuántos"""
+    # clave -> (primer texto visto, conteo de etiquetas de todas sus apariciones)
+    pendientes = {}
+    for etiqueta, texto in filas:
+        clave = clave_texto(texto)
+        if clave in indice.claves:
+            continue
+        pendientes.setdefault(clave, (texto, collections.Counter()))[1][etiqueta] += 1
+    pendientes = list(pendientes.values())
+    agregadas = 0
+    for inicio in range(0, len(pendientes), TEXTOS_POR_TANDA):
+        tanda = pendientes[inicio:inicio + TEXTOS_POR_TANDA]
+        vectores = clasificador.embeddings([texto for texto, _ in tanda])
+        agregadas += indice.agregar(vectores, [metadatos_fila(etiquetas, texto, origen) for texto, etiquetas in tanda])
+        print(f"\r{origen}: {inicio + len(tanda)}/{len(pendientes)}", end="", flush=True)
+    if pendientes:
+        print()
+    return agregadas
+
+
+def busquedas_registradas():
+    """(resultado, descripción) de todas las búsquedas del historial con una clase"""
+    import modelo_logs
+    for evento in modelo_logs.crear_cursor(incluir_archivo=True).leer_todo():
+        if (evento.get('tipo') == 'busqueda' and evento.get('resultado') in ("arrufo", "puntual")
+                and evento.get('descripcion')):
+            yield evento['resultado'], evento['descripcion']
+
+
+def construir(clasificador, ruta_csv=ARCHIVO_CSV, directorio=DIRECTORIO_INDICE, con_busquedas=True):
+    """Reconstruye el índice en un directorio nuevo y lo pone en lugar del anterior"""
+    filas = [(etiqueta, texto) for etiqueta, texto in leer_csv_fisuras(ruta_csv)
+             if etiqueta in ("arrufo", "puntual") and texto]
+    nuevo = directorio + ".nuevo"
+    shutil.rmtree(nuevo, ignore_errors=True)
+    dimension = clasificador.embeddings([filas[0][1]]).shape[1]
+    indice = IndiceSimilares.crear(nuevo, dimension, clasificador.version)
+    agregar_textos(indice, clasificador, filas, "corpus")
+    if con_busquedas:
+        agregar_textos(indice, clasificador, busquedas_registradas(), "busqueda")
+
+    anterior = directorio + ".anterior"
+    shutil.rmtree(anterior, ignore_errors=True)
+    if os.path.exists(directorio):
+        os.replace(directorio, anterior)
+    os.replace(nuevo, directorio)
+    shutil.rmtree(anterior, ignore_errors=True)
+    return IndiceSimilares(directorio)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Índice de casos similares del clasificador de fisuras")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+    comando_construir = subcomandos.add_parser("construir", help="vectores del CSV y de las búsquedas registradas")
+    comando_construir.add_argument("--csv", default=ARCHIVO_CSV)
+    comando_construir.add_argument("--sin-busquedas", action="store_true")
+    subcomandos.add_parser("agregar-busquedas", help="agrega las búsquedas registradas que faltan")
+    comando_ivf = subcomandos.add_parser("ivf", help="construye el índice particionado (k-means)")
+    comando_ivf.add_argument("--listas", type=int, help="por defecto, 4 * raíz de las filas")
+    comando_ivf.add_argument("--sondas", type=int, default=SONDAS_IVF)
+    comando_buscar = subcomandos.add_parser("buscar", help="casos más similares a una descripción")
+    comando_buscar.add_argument("texto")
+    comando_buscar.add_argument("-k", type=int, default=VECINOS)
+    comando_buscar.add_argument("--exacto", action="store_true", help="sin IVF aunque esté construido")
+    parser.add_argument("--directorio", default=DIRECTORIO_INDICE)
+    argumentos = parser.parse_args()
+    if np is None:
+        raise SystemExit("Se necesita 'pip install numpy'")
+
+    if argumentos.comando == "ivf":
+        indice = abrir_indice(argumentos.directorio)
+        if indice is None:
+            raise SystemExit(f"No hay índice en {argumentos.directorio}; primero: construir")
+        inicio = time.perf_counter()
+        listas = indice.construir_ivf(argumentos.listas)
+        print(f"IVF de {listas} listas para {indice.filas} filas en {time.perf_counter() - inicio:.1f} s")
+        print(f"Exhaustividad@{VECINOS} con {argumentos.sondas} sondas: "
+              f"{indice.exhaustividad_ivf(sondas=argumentos.sondas):.3f}")
+        raise SystemExit(0)
+
+    from modelo_fisuras import ClasificadorFisuras
+    clasificador = ClasificadorFisuras(backend="torch")
+    if argumentos.comando == "construir":
+        inicio = time.perf_counter()
+        indice = construir(clasificador, argumentos.csv, argumentos.directorio, not argumentos.sin_busquedas)
+        print(f"Índice con {indice.filas} filas de dimensión {indice.dimension} "
+              f"en {time.perf_counter() - inicio:.1f} s ({argumentos.directorio})")
+        raise SystemExit(0)
+
+    indice = abrir_indice(argumentos.directorio)
+    if indice is None:
+        raise SystemExit(f"No hay índice en {argumentos.directorio}; primero: construir")
+    if not clasificador.cargar():
+        raise SystemExit(clasificador.error)
+    if indice.version_modelo != clasificador.version:
+        raise SystemExit(f"El índice es de {indice.version_modelo} y el modelo es {clasificador.version}; "
+                         "hay que reconstruirlo")
+    if argumentos.comando == "agregar-busquedas":
+        print(f"Búsquedas agregadas: {agregar_textos(indice, clasificador, busquedas_registradas(), 'busqueda')}")
+    else:
+        inicio = time.perf_counter()
+        vecinos = indice.buscar(clasificador.embeddings([argumentos.texto])[0], argumentos.k,
+                                exacto=argumentos.exacto)
+        print(f"{len(vecinos)} vecinos entre {indice.filas} filas en {(time.perf_counter() - inicio) * 1000:.1f} ms")
+        for similitud, datos in vecinos:
+            conteos = datos.get("etiquetas") or {datos["etiqueta"]: 1}
+            etiquetas = "/".join(f"{nombre} {veces}" for nombre, veces in sorted(conteos.items()))
+            print(f"{similitud:.3f}  {etiquetas:<20} {datos['origen']:<9} {datos['texto'][:90]}")
@@ -2,8 +2,8 @@ import flet as ft
 import subprocess
 import sys
 import os
-import json
-from datetime import datetime
+import registro_eventos
+import servicio_inferencia
 
 def main(page: ft.Page):
     page.title = "Inicio de Sesión - Sistema de Análisis"
@@ -25,33 +25,9 @@ def main(page: ft.Page):
     ADMIN_PASSWORD = "admin123"
     
     def registrar_evento(usuario, tipo_evento, detalles=""):
-        """Registra eventos del sistema en un archivo JSON"""
+        """Registra eventos del sistema en el log de eventos"""
         try:
-            archivo_log = "sistema_logs.json"
-            
-            # Leer logs existentes
-            if os.path.exists(archivo_log):
-                with open(archivo_log, 'r', encoding='utf-8') as f:
-                    logs = json.load(f)
-            else:
-                logs = []
-            
-            # Crear nuevo evento
-            evento = {
-                "usuario": usuario,
-                "tipo": tipo_evento,
-                "detalles": detalles,
-                "fecha": datetime.now().strftime("%Y-%m-%d"),
-                "hora": datetime.now().strftime("%H:%M:%S"),
-                "timestamp": datetime.now().isoformat()
-            }
-            
-            logs.append(evento)
-            
-            # Guardar logs actualizados
-            with open(archivo_log, 'w', encoding='utf-8') as f:
-                json.dump(logs, f, indent=2, ensure_ascii=False)
-                
+            registro_eventos.registrar_evento(usuario, tipo_evento, detalles)
         except Exception as e:
             print(f"Error al registrar evento: {e}")
     
@@ -117,6 +93,8 @@ def main(page: ft.Page):
                 archivo_admin = os.path.join(directorio_actual, "panel_administrador.py")
                 
                 if os.path.exists(archivo_admin):
+                    # Asegurar que el evento de acceso ya esté en el log
+                    registro_eventos.vaciar(2)
                     subprocess.Popen([sys.executable, archivo_admin, usuario])
                     # Esperar un momento antes de cerrar
                     import time
@@ -147,6 +125,14 @@ def main(page: ft.Page):
                 archivo_interfaz = os.path.join(directorio_actual, "Ecuador_interfaz_mejorado.py")
                 
                 if os.path.exists(archivo_interfaz):
+                    # Asegurar que el evento de acceso ya esté en el log
+                    registro_eventos.vaciar(2)
+                    # Con FISURAS_SERVICIO=auto todas las ventanas comparten un solo modelo
+                    if os.environ.get("FISURAS_SERVICIO") == "auto":
+                        try:
+                            servicio_inferencia.iniciar_en_segundo_plano()
+                        except Exception as e:
+                            print(f"Error al iniciar el servicio de inferencia: {e}")
                     # Abrir la interfaz pasando el nombre de usuario
                     subprocess.Popen([sys.executable, archivo_interfaz, usuario])
                     # Esperar un momento antes de cerrar
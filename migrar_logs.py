@@ -0,0 +1,131 @@
+# migrar_logs.py
+# Convierte los logs existentes al esquema de búsquedas con campos tipados
+# (descripcion, resultado, prob_arrufo, prob_puntual, version_modelo).
+#
+# - sistema_logs.json (arreglo) se lee en streaming y se escribe como el
+#   segmento sistema_logs.000000.jsonl; el original queda como .migrado
+# - Cada segmento JSONL se reescribe línea por línea en un archivo temporal
+#   y se reemplaza de forma atómica
+# - Con SISTEMA_LOGS_BACKEND=sqlite también se migra la base de datos
+#
+# Uso: python migrar_logs.py
+import json
+import os
+from contextlib import closing
+
+import registro_eventos
+
+TAMANO_BLOQUE = 1 << 16
+
+
+def iterar_arreglo_json(ruta, tamano_bloque=TAMANO_BLOQUE):
+    """Recorre los elementos de un arreglo JSON sin cargar el archivo completo"""
+    decodificador = json.JSONDecoder()
+    with open(ruta, 'r', encoding='utf-8') as f:
+        buffer = ""
+        posicion = 0
+        inicio_arreglo = False
+        fin_archivo = False
+        while True:
+            # Saltar espacios, comas y corchetes entre elementos
+            while posicion < len(buffer) and buffer[posicion] in " \t\r\n,[]":
+                if buffer[posicion] == "[":
+                    inicio_arreglo = True
+                elif buffer[posicion] == "]" and inicio_arreglo:
+                    return
+                posicion += 1
+            if posicion >= len(buffer):
+                if fin_archivo:
+                    return
+                buffer = f.read(tamano_bloque)
+                posicion = 0
+                fin_archivo = not buffer
+                continue
+            try:
+                elemento, fin = decodificador.raw_decode(buffer, posicion)
+            except json.JSONDecodeError:
+                # Elemento partido entre bloques: leer más
+                bloque = f.read(tamano_bloque)
+                if not bloque:
+                    raise
+                buffer = buffer[posicion:] + bloque
+                posicion = 0
+                continue
+            yield elemento
+            posicion = fin
+
+
+def migrar_lineas(origen, destino, eventos):
+    """Escribe los eventos normalizados en destino; devuelve cuántas búsquedas cambiaron"""
+    convertidas = 0
+    with open(destino, 'w', encoding='utf-8') as salida:
+        for evento in eventos:
+            normalizado = registro_eventos.normalizar_busqueda(evento)
+            if normalizado is not evento:
+                convertidas += 1
+            salida.write(json.dumps(normalizado, ensure_ascii=False) + "\n")
+    return convertidas
+
+
+def leer_lineas_crudas(ruta):
+    """Lee un segmento sin normalizar, para poder contar las conversiones"""
+    with open(ruta, 'r', encoding='utf-8') as f:
+        for linea in f:
+            linea = linea.strip()
+            if not linea:
+                continue
+            try:
+                yield json.loads(linea)
+            except json.JSONDecodeError:
+                continue
+
+
+def migrar_legado(archivo_legado=registro_eventos.ARCHIVO_LEGADO,
+                  archivo=registro_eventos.ARCHIVO_EVENTOS):
+    """Convierte el arreglo JSON original en el primer segmento JSONL"""
+    if not os.path.exists(archivo_legado):
+        return 0
+    destino = registro_eventos.ruta_segmento(0, archivo)
+    if os.path.exists(destino):
+        print(f"Ya existe {destino}; no se migra {archivo_legado}")
+        return 0
+    temporal = destino + ".tmp"
+    convertidas = migrar_lineas(archivo_legado, temporal, iterar_arreglo_json(archivo_legado))
+    os.replace(temporal, destino)
+    os.replace(archivo_legado, archivo_legado + ".migrado")
+    return convertidas
+
+
+def migrar_segmento(ruta):
+    """Reescribe un segmento JSONL con el esquema tipado"""
+    temporal = ruta + ".tmp"
+    convertidas = migrar_lineas(ruta, temporal, leer_lineas_crudas(ruta))
+    if convertidas:
+        os.replace(temporal, ruta)
+    else:
+        os.remove(temporal)
+    return convertidas
+
+
+def migrar(archivo=registro_eventos.ARCHIVO_EVENTOS,
+           archivo_legado=registro_eventos.ARCHIVO_LEGADO):
+    """Migra legado y segmentos; devuelve el total de búsquedas convertidas"""
+    total = 0
+    # El bloqueo evita que otro proceso rote o escriba mientras se reescribe
+    with registro_eventos.bloqueo_archivo(archivo):
+        total += migrar_legado(archivo_legado, archivo)
+        for ruta in registro_eventos.segmentos_rotados(archivo):
+            total += migrar_segmento(ruta)
+        if os.path.exists(archivo):
+            total += migrar_segmento(archivo)
+
+    if registro_eventos.BACKEND == "sqlite":
+        import almacen_sqlite
+        with closing(almacen_sqlite.conectar()) as conexion:
+            with conexion:
+                almacen_sqlite.migrar_busquedas(conexion)
+    return total
+
+
+if __name__ == "__main__":
+    print(f"Búsquedas convertidas: {migrar()}")
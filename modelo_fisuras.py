@@ -0,0 +1,435 @@
+# modelo_fisuras.py
+# Clasificador de fisuras (arrufo / puntual) compartido por la interfaz y las
+# herramientas de línea de comandos.
+#
+# clasificar_lote() recibe una lista de descripciones, las ordena por largo
+# en tokens y arma lotes de largos parecidos; cada lote se rellena solo hasta
+# su secuencia más larga, así que las descripciones cortas no pagan el costo
+# de las largas. Los resultados se devuelven en el orden de entrada.
+#
+# Ninguna descripción se trunca: el texto se tokeniza entero y se corta en
+# ventanas de hasta MAX_LONGITUD tokens (contando los especiales) que se
+# solapan SOLAPAMIENTO tokens. Las ventanas empiezan siempre en las mismas
+# posiciones, así que al agregar texto al final solo cambian la última
+# ventana y las nuevas. clasificar() guarda los logits de cada ventana
+# durante la sesión: en el ciclo de mejora de la interfaz cada refinamiento
+# solo pasa por el modelo las ventanas que tocan el texto agregado. La
+# predicción promedia los logits de todas las ventanas, ponderados por su
+# largo.
+#
+# El motor de inferencia se elige con FISURAS_BACKEND: "torch" (por defecto),
+# "onnx" (grafo optimizado) u "onnx-int8" (pesos cuantizados a int8), estos
+# dos generados con exportar_onnx.py. Con ONNX Runtime no se importa torch.
+#
+# Con torch, si el modelo está guardado como safetensors, los pesos no se
+# copian: los tensores apuntan a un mapeo en memoria del archivo (copia al
+# escribir, y nadie escribe). Las páginas son las de la caché de archivos
+# del sistema, compartidas por todas las ventanas y procesos que abren el
+# mismo modelo, y con la caché caliente la carga casi no lee del disco.
+# FISURAS_MMAP=0 vuelve a from_pretrained (pesos copiados en cada proceso).
+import collections
+import contextlib
+import csv
+import json
+import math
+import mmap
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+
+RUTA_MODELO = "./fisuras_classifier"
+
+# Modelos exportados por exportar_onnx.py; fuera de RUTA_MODELO para no cambiar su versión
+RUTA_ONNX = "./fisuras_classifier_onnx"
+
+BACKENDS = {
+    "torch": None,
+    "onnx": "modelo.optimizado.onnx",
+    "onnx-int8": "modelo.int8.onnx",
+}
+BACKEND = os.environ.get("FISURAS_BACKEND", "torch")
+
+CARGA_MAPEADA = os.environ.get("FISURAS_MMAP", "1") != "0"
+ARCHIVO_SAFETENSORS = "model.safetensors"
+ARCHIVO_INDICE_SAFETENSORS = "model.safetensors.index.json"
+
+# Largo máximo en tokens que acepta el modelo
+MAX_LONGITUD = 128
+
+# Índice de cada clase en la salida del modelo
+CLASES = ("arrufo", "puntual")
+
+TAMANO_LOTE = 32
+
+# Tokens compartidos por ventanas consecutivas de una descripción larga
+SOLAPAMIENTO = 32
+
+# Ventanas codificadas que se recuerdan por sesión
+MAX_VENTANAS_CACHE = 4096
+
+# Descripción usada para la primera pasada del modelo al precalentarlo
+TEXTO_CALENTAMIENTO = "Fisura vertical de 15cm en la columna del lado izquierdo"
+
+
+def obtener_version_modelo(modelo_path=RUTA_MODELO):
+    """Identifica la versión del modelo por la fecha de sus archivos"""
+    fechas = [
+        os.path.getmtime(os.path.join(modelo_path, nombre))
+        for nombre in os.listdir(modelo_path)
+    ]
+    marca = datetime.fromtimestamp(max(fechas)).strftime("%Y%m%d%H%M%S") if fechas else "0"
+    return f"{os.path.basename(os.path.normpath(modelo_path))}@{marca}"
+
+
+def resultado_desde_probabilidades(prob_arrufo, prob_puntual):
+    """Devuelve (clase, probabilidad, probabilidades) como clasificar_fisura"""
+    if prob_arrufo > prob_puntual:
+        return "arrufo", prob_arrufo, {"arrufo": prob_arrufo, "puntual": prob_puntual}
+    return "puntual", prob_puntual, {"arrufo": prob_arrufo, "puntual": prob_puntual}
+
+
+def leer_csv_fisuras(ruta):
+    """Recorre (etiqueta, texto) de un CSV como fisuras_base_limpia.csv (label,text)"""
+    with open(ruta, 'r', encoding='utf-8', newline='') as f:
+        for fila in csv.DictReader(f):
+            # El texto viene entre comillas triples: el CSV deja un par de comillas extra
+            texto = (fila.get('text') or '').strip().strip('"').strip()
+            yield (fila.get('label') or '').strip() or None, texto
+
+
+class ClasificadorFisuras:
+    """Tokenizador y modelo cargados una vez, con clasificación individual y por lotes"""
+
+    def __init__(self, ruta=RUTA_MODELO, backend=BACKEND, ruta_onnx=RUTA_ONNX, hilos=None):
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend desconocido: {backend} (opciones: {', '.join(BACKENDS)})")
+        self.ruta = ruta
+        self.backend = backend
+        self.ruta_onnx = ruta_onnx
+        # Hilos de cómputo del motor; None deja el valor por defecto
+        self.hilos = hilos
+        self.tokenizer = None
+        self.model = None
+        self.version = None
+        # Una sola carga aunque la pidan varios hilos a la vez
+        self.bloqueo_carga = threading.Lock()
+        self.listo = threading.Event()
+        self.error = None
+        # Segundos de importación/carga y de la primera pasada
+        self.tiempos = {}
+        # True si los pesos quedaron mapeados desde safetensors (sin copia)
+        self.mapeado = False
+        # Logits por ventana de tokens, para no volver a codificar lo ya visto
+        self.ventanas = collections.OrderedDict()
+        self.bloqueo_ventanas = threading.Lock()
+        self.conteo_ventanas = {"codificadas": 0, "reutilizadas": 0}
+
+    @property
+    def cargado(self):
+        return self.model is not None
+
+    def cargar(self):
+        """Carga el modelo; devuelve False si no está disponible
+
+        Si otro hilo ya lo está cargando, espera a que termine en lugar de
+        empezar una segunda carga.
+        """
+        if self.cargado:
+            return True
+        with self.bloqueo_carga:
+            if self.cargado:
+                return True
+            if self.error is not None:
+                return False
+            inicio = time.perf_counter()
+            cargado = self._cargar()
+            self.tiempos["carga"] = time.perf_counter() - inicio
+            return cargado
+
+    def version_en_disco(self):
+        """Versión que tendrá el modelo, sin cargarlo; None si no está"""
+        if self.version:
+            return self.version
+        try:
+            version = obtener_version_modelo(self.ruta)
+        except OSError:
+            return None
+        # Las predicciones de ONNX difieren levemente: se registran y guardan en caché aparte
+        return version if self.backend == "torch" else f"{version}+{self.backend}"
+
+    def _cargar(self):
+        try:
+            # Importar aquí para evitar cargarlos al inicio
+            from transformers import AutoTokenizer
+
+            if not os.path.exists(self.ruta):
+                self.error = f"Modelo no encontrado en: {self.ruta}"
+                print(self.error)
+                return False
+            self.tokenizer = AutoTokenizer.from_pretrained(self.ruta)
+            if self.backend == "torch":
+                import torch
+                from transformers import AutoModelForSequenceClassification
+
+                if self.hilos:
+                    torch.set_num_threads(self.hilos)
+                self.model = None
+                if CARGA_MAPEADA and self._archivos_safetensors():
+                    try:
+                        self.model = self._modelo_mapeado()
+                        self.mapeado = True
+                    except Exception as e:
+                        print(f"Carga mapeada no disponible, se copian los pesos: {e}")
+                if self.model is None:
+                    self.model = AutoModelForSequenceClassification.from_pretrained(self.ruta)
+                self.model.eval()
+            else:
+                self.model = self._sesion_onnx()
+            self.version = self.version_en_disco()
+            return True
+        except Exception as e:
+            self.error = f"Error cargando modelo: {e}"
+            print(self.error)
+            return False
+
+    def _archivos_safetensors(self):
+        """Archivos safetensors del modelo (varios si está partido); vacío si no hay"""
+        indice = os.path.join(self.ruta, ARCHIVO_INDICE_SAFETENSORS)
+        if os.path.exists(indice):
+            with open(indice, 'r', encoding='utf-8') as f:
+                return sorted({os.path.join(self.ruta, nombre) for nombre in json.load(f)["weight_map"].values()})
+        unico = os.path.join(self.ruta, ARCHIVO_SAFETENSORS)
+        return [unico] if os.path.exists(unico) else []
+
+    def _modelo_mapeado(self):
+        """Modelo torch cuyos pesos son vistas de los safetensors mapeados en memoria"""
+        import torch
+        from transformers import AutoConfig, AutoModelForSequenceClassification
+        try:
+            from transformers.modeling_utils import no_init_weights
+        except ImportError:
+            no_init_weights = contextlib.nullcontext
+
+        tipos = {"F64": torch.float64, "F32": torch.float32, "F16": torch.float16, "BF16": torch.bfloat16,
+                 "I64": torch.int64, "I32": torch.int32, "I16": torch.int16, "I8": torch.int8,
+                 "U8": torch.uint8, "BOOL": torch.bool}
+        pesos = {}
+        for ruta in self._archivos_safetensors():
+            with open(ruta, 'rb') as f:
+                # Formato: largo del encabezado (u64), encabezado JSON y los datos
+                largo = struct.unpack("<Q", f.read(8))[0]
+                encabezado = json.loads(f.read(largo))
+                # ACCESS_COPY: una escritura accidental queda en el proceso y no llega al archivo
+                mapa = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+            for nombre, datos in encabezado.items():
+                if nombre == "__metadata__":
+                    continue
+                tipo = tipos[datos["dtype"]]
+                desde, hasta = datos["data_offsets"]
+                elementos = (hasta - desde) // tipo.itemsize
+                if not elementos:
+                    pesos[nombre] = torch.empty(datos["shape"], dtype=tipo)
+                    continue
+                # frombuffer no copia: el tensor conserva una referencia al mapa
+                pesos[nombre] = torch.frombuffer(mapa, dtype=tipo, count=elementos,
+                                                 offset=8 + largo + desde).view(datos["shape"])
+
+        configuracion = AutoConfig.from_pretrained(self.ruta)
+        # Sin inicializar pesos al azar que se reemplazan enseguida
+        with no_init_weights():
+            modelo = AutoModelForSequenceClassification.from_config(configuracion)
+        # assign=True usa los tensores mapeados en lugar de copiarlos en los del modelo
+        modelo.load_state_dict(pesos, strict=False, assign=True)
+        modelo.tie_weights()
+        mapeados = {tensor.data_ptr() for tensor in pesos.values()}
+        faltantes = [nombre for nombre, parametro in modelo.named_parameters()
+                     if parametro.data_ptr() not in mapeados]
+        if faltantes:
+            raise ValueError(f"pesos sin cargar: {', '.join(faltantes[:5])}")
+        return modelo
+
+    def _sesion_onnx(self):
+        import onnxruntime
+
+        ruta = os.path.join(self.ruta_onnx, BACKENDS[self.backend])
+        if not os.path.exists(ruta):
+            raise FileNotFoundError(f"{ruta} no existe; generarlo con 'python exportar_onnx.py'")
+        from exportar_onnx import exportacion_vigente
+        if not exportacion_vigente(self.ruta, self.ruta_onnx):
+            print(f"Aviso: {ruta} no corresponde a la versión actual de {self.ruta}; volver a exportar")
+        opciones = onnxruntime.SessionOptions()
+        opciones.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.hilos:
+            opciones.intra_op_num_threads = self.hilos
+        return onnxruntime.InferenceSession(ruta, opciones, providers=["CPUExecutionProvider"])
+
+    def _logits(self, input_ids):
+        """Rellena un lote de input_ids hasta el más largo y devuelve [[logit_arrufo, logit_puntual], ...]"""
+        if self.backend == "torch":
+            import torch
+
+            inputs = self.tokenizer.pad({"input_ids": input_ids}, padding="longest", return_tensors="pt")
+            with torch.no_grad():
+                return self.model(**inputs).logits.tolist()
+
+        import numpy as np
+
+        inputs = self.tokenizer.pad({"input_ids": input_ids}, padding="longest", return_tensors="np")
+        entradas = {}
+        for entrada in self.model.get_inputs():
+            # token_type_ids no lo devuelve pad(); con una sola oración son ceros
+            valor = inputs.get(entrada.name)
+            if valor is None:
+                valor = np.zeros_like(inputs["input_ids"])
+            entradas[entrada.name] = valor.astype(np.int64)
+        return self.model.run(None, entradas)[0].tolist()
+
+    def _ventanas(self, ids):
+        """Corta los tokens de un texto (sin especiales) en ventanas de posición fija"""
+        largo = MAX_LONGITUD - self.tokenizer.num_special_tokens_to_add()
+        paso = largo - SOLAPAMIENTO
+        ventanas = [tuple(ids[:largo])]
+        inicio = paso
+        while inicio + SOLAPAMIENTO < len(ids):
+            ventanas.append(tuple(ids[inicio:inicio + largo]))
+            inicio += paso
+        return ventanas
+
+    def _con_especiales(self, ventana):
+        return self.tokenizer.build_inputs_with_special_tokens(list(ventana))
+
+    def _agrupar(self, ventanas, logits):
+        """Promedia los logits de las ventanas de un texto; devuelve el resultado de la clase"""
+        pesos = [max(1, len(ventana)) for ventana in ventanas]
+        total = sum(pesos)
+        promedio = [sum(peso * valores[clase] for peso, valores in zip(pesos, logits)) / total
+                    for clase in range(len(CLASES))]
+        maximo = max(promedio)
+        exponenciales = [math.exp(valor - maximo) for valor in promedio]
+        prob_arrufo, prob_puntual = (valor / sum(exponenciales) for valor in exponenciales)
+        return resultado_desde_probabilidades(prob_arrufo, prob_puntual)
+
+    def calentar(self):
+        """Carga el modelo y hace una primera pasada; devuelve True si quedó listo"""
+        try:
+            if not self.cargar():
+                return False
+            inicio = time.perf_counter()
+            self.clasificar(TEXTO_CALENTAMIENTO)
+            self.tiempos["calentamiento"] = time.perf_counter() - inicio
+            return True
+        finally:
+            self.listo.set()
+
+    def calentar_en_segundo_plano(self, al_terminar=None):
+        """Precalienta el modelo en un hilo; al_terminar(ok) se llama al finalizar"""
+        def ejecutar():
+            ok = self.calentar()
+            if al_terminar:
+                al_terminar(ok)
+
+        hilo = threading.Thread(target=ejecutar, daemon=True)
+        hilo.start()
+        return hilo
+
+    def clasificar(self, texto):
+        """Clasifica una descripción; devuelve (clase, probabilidad, probabilidades)"""
+        if not texto or not texto.strip():
+            return None, None, None
+        if not self.cargar():
+            return None, None, None
+        try:
+            ventanas = self._ventanas(self.tokenizer(texto, add_special_tokens=False)["input_ids"])
+            with self.bloqueo_ventanas:
+                nuevas = [ventana for ventana in dict.fromkeys(ventanas) if ventana not in self.ventanas]
+            # Solo pasan por el modelo las ventanas que no se codificaron antes
+            logits_nuevos = self._logits([self._con_especiales(ventana) for ventana in nuevas]) if nuevas else []
+            with self.bloqueo_ventanas:
+                for ventana, logits in zip(nuevas, logits_nuevos):
+                    self.ventanas[ventana] = logits
+                self.conteo_ventanas["codificadas"] += len(nuevas)
+                self.conteo_ventanas["reutilizadas"] += len(ventanas) - len(nuevas)
+                logits = []
+                for ventana in ventanas:
+                    self.ventanas.move_to_end(ventana)
+                    logits.append(self.ventanas[ventana])
+                while len(self.ventanas) > MAX_VENTANAS_CACHE:
+                    self.ventanas.popitem(last=False)
+            return self._agrupar(ventanas, logits)
+        except Exception as e:
+            print(f"Error en clasificación: {e}")
+            return None, None, None
+
+    def _lotes_por_largo(self, codificados, tamano_lote):
+        """Agrupa los índices en lotes de largo parecido, del más corto al más largo"""
+        orden = sorted(range(len(codificados)), key=lambda indice: len(codificados[indice]))
+        for inicio in range(0, len(orden), tamano_lote):
+            yield orden[inicio:inicio + tamano_lote]
+
+    def _ventanas_de_textos(self, textos):
+        """Ventanas de cada texto y, aplanadas, el texto al que pertenece cada una y sus input_ids"""
+        # Tokenizado sin relleno ni especiales para cortar cada texto en ventanas
+        ids = self.tokenizer(list(textos), add_special_tokens=False)["input_ids"]
+        ventanas_por_texto = [self._ventanas(ids_texto) for ids_texto in ids]
+        duenos = [posicion for posicion, ventanas in enumerate(ventanas_por_texto) for _ in ventanas]
+        codificados = [self._con_especiales(ventana) for ventanas in ventanas_por_texto for ventana in ventanas]
+        return ventanas_por_texto, duenos, codificados
+
+    def clasificar_lote(self, textos, tamano_lote=TAMANO_LOTE):
+        """Clasifica varias descripciones; devuelve una tupla por texto en el orden de entrada"""
+        resultados = [(None, None, None)] * len(textos)
+        validos = [indice for indice, texto in enumerate(textos) if texto and texto.strip()]
+        if not validos or not self.cargar():
+            return resultados
+        try:
+            ventanas_por_texto, duenos, codificados = self._ventanas_de_textos(textos[indice] for indice in validos)
+            logits = [None] * len(codificados)
+            for lote in self._lotes_por_largo(codificados, tamano_lote):
+                # El relleno llega solo hasta la ventana más larga del lote
+                for indice, valores in zip(lote, self._logits([codificados[i] for i in lote])):
+                    logits[indice] = valores
+            por_texto = collections.defaultdict(list)
+            for dueno, valores in zip(duenos, logits):
+                por_texto[dueno].append(valores)
+            for posicion, ventanas in enumerate(ventanas_por_texto):
+                resultados[validos[posicion]] = self._agrupar(ventanas, por_texto[posicion])
+        except Exception as e:
+            print(f"Error en clasificación por lotes: {e}")
+        return resultados
+
+    def embeddings(self, textos, tamano_lote=TAMANO_LOTE):
+        """Vector de oración de cada texto (promedio de la última capa, norma 1) como matriz float32
+
+        Las descripciones largas promedian sus ventanas. Solo con el backend
+        torch: los modelos ONNX exportados solo devuelven los logits.
+        """
+        if self.backend != "torch":
+            raise RuntimeError("Los embeddings necesitan FISURAS_BACKEND=torch")
+        if not self.cargar():
+            raise RuntimeError(self.error)
+        import numpy as np
+        import torch
+
+        ventanas_por_texto, duenos, codificados = self._ventanas_de_textos(textos)
+        vectores = [None] * len(codificados)
+        with torch.no_grad():
+            for lote in self._lotes_por_largo(codificados, tamano_lote):
+                inputs = self.tokenizer.pad({"input_ids": [codificados[i] for i in lote]},
+                                            padding="longest", return_tensors="pt")
+                ocultos = self.model.base_model(input_ids=inputs["input_ids"],
+                                                attention_mask=inputs["attention_mask"]).last_hidden_state
+                mascara = inputs["attention_mask"].unsqueeze(-1).to(ocultos.dtype)
+                promedios = ((ocultos * mascara).sum(dim=1) / mascara.sum(dim=1)).numpy()
+                for indice, vector in zip(lote, promedios):
+                    vectores[indice] = vector
+
+        resultado = np.zeros((len(ventanas_por_texto), len(vectores[0]) if vectores else 0), dtype=np.float32)
+        pesos = np.zeros(len(ventanas_por_texto), dtype=np.float32)
+        for dueno, codificado, vector in zip(duenos, codificados, vectores):
+            resultado[dueno] += len(codificado) * vector
+            pesos[dueno] += len(codificado)
+        resultado /= np.maximum(pesos, 1)[:, None]
+        resultado /= np.maximum(np.linalg.norm(resultado, axis=1, keepdims=True), 1e-12)
+        return resultado
@@ -0,0 +1,227 @@
+# modelo_logs.py
+# Cursores de lectura incremental del log de eventos (JSONL o SQLite).
+# La primera carga lee todo el historial; las siguientes solo leen los bytes
+# agregados al segmento activo desde el último offset. Si el archivo fue
+# rotado se termina de leer el segmento renombrado y se continúa con el nuevo;
+# si fue truncado o cambió de forma inesperada se recarga todo.
+import itertools
+import json
+import os
+
+import registro_eventos
+import retencion_logs
+
+
+def _identidad(ruta):
+    """Devuelve [dispositivo, inodo, tamaño, mtime] de un archivo o None"""
+    try:
+        info = os.stat(ruta)
+    except FileNotFoundError:
+        return None
+    return [info.st_dev, info.st_ino, info.st_size, info.st_mtime_ns]
+
+
+def _leer_desde(ruta, offset):
+    """Lee las líneas completas a partir de offset; devuelve (eventos, nuevo_offset)"""
+    try:
+        with open(ruta, 'rb') as f:
+            f.seek(offset)
+            datos = f.read()
+    except FileNotFoundError:
+        return [], offset
+
+    # Una línea sin salto final todavía se está escribiendo; se lee la próxima vez
+    fin = datos.rfind(b"\n") + 1
+    eventos = []
+    for linea in datos[:fin].splitlines():
+        if not linea.strip():
+            continue
+        try:
+            eventos.append(registro_eventos.normalizar_busqueda(json.loads(linea)))
+        except json.JSONDecodeError:
+            continue
+    return eventos, offset + fin
+
+
+class CursorLogs:
+    """Posición de lectura dentro del log que sobrevive rotaciones"""
+
+    def __init__(self, archivo=registro_eventos.ARCHIVO_EVENTOS,
+                 archivo_legado=registro_eventos.ARCHIVO_LEGADO, incluir_archivo=False):
+        self.archivo = archivo
+        self.archivo_legado = archivo_legado
+        # Si es True, una lectura completa incluye también las particiones compactadas
+        self.incluir_archivo = incluir_archivo
+        self.offset = 0
+        self.inodo = None
+        self.rotados = []
+        self.legado = None
+        self.cargado = False
+
+    def estado(self):
+        """Devuelve la posición como diccionario serializable"""
+        return {
+            "offset": self.offset,
+            "inodo": self.inodo,
+            "rotados": [os.path.basename(ruta) for ruta in self.rotados],
+            "legado": self.legado,
+        }
+
+    def restaurar(self, estado):
+        """Continúa desde una posición guardada con estado()"""
+        directorio = os.path.dirname(self.archivo)
+        self.offset = estado["offset"]
+        self.inodo = estado["inodo"]
+        self.rotados = [os.path.join(directorio or ".", nombre) for nombre in estado["rotados"]]
+        self.legado = estado["legado"]
+        self.cargado = True
+
+    def leer_todo(self):
+        """Recorre todo el historial y deja el cursor al final
+
+        Las particiones archivadas y los segmentos rotados se leen en streaming
+        a medida que se consume el resultado. El bloqueo del log se mantiene
+        hasta terminar de recorrerlo (o descartar el iterador): una
+        compactación o retención no puede borrar segmentos a mitad de camino.
+        """
+        with registro_eventos.bloqueo_archivo(self.archivo):
+            yield from self._leer_todo()
+
+    def _leer_todo(self):
+        # Se llama con el bloqueo del log tomado y se debe consumir sin soltarlo
+        self.legado = _identidad(self.archivo_legado)
+        self.rotados = registro_eventos.segmentos_rotados(self.archivo)
+        identidad = _identidad(self.archivo)
+        self.inodo = identidad[:2] if identidad else None
+        del_activo, self.offset = _leer_desde(self.archivo, 0)
+        self.cargado = True
+
+        partes = [retencion_logs.leer_archivo()] if self.incluir_archivo else []
+        partes.append(registro_eventos.leer_legado(self.archivo_legado))
+        partes.extend(registro_eventos.leer_segmento(ruta) for ruta in self.rotados)
+        partes.append(del_activo)
+        return itertools.chain.from_iterable(partes)
+
+    def ir_al_final(self):
+        """Deja el cursor al final del log sin leer el historial"""
+        with registro_eventos.bloqueo_archivo(self.archivo):
+            self.legado = _identidad(self.archivo_legado)
+            self.rotados = registro_eventos.segmentos_rotados(self.archivo)
+            identidad = _identidad(self.archivo)
+            self.inodo = identidad[:2] if identidad else None
+            self.offset = identidad[2] if identidad else 0
+            self.cargado = True
+
+    def pendientes(self):
+        """Eventos sin leer, o None si hay que releer todo; se llama con el bloqueo del log tomado"""
+        return self._leer_nuevos()
+
+    def reubicar(self, segmento, offset):
+        """Continúa desde offset dentro del segmento que reescribió la compactación
+
+        La posición queda como si el segmento activo que se venía leyendo se
+        hubiera rotado a `segmento`: la próxima lectura sigue desde offset y
+        después lee lo que se haya escrito en el nuevo segmento activo.
+        """
+        identidad = _identidad(segmento)
+        self.rotados = []
+        self.inodo = identidad[:2] if identidad else None
+        self.offset = offset if identidad else 0
+        self.legado = None
+        self.cargado = True
+
+    def leer_nuevos(self):
+        """Devuelve (eventos, recargado); si recargado es True es un iterador de todos los eventos"""
+        if not self.cargado or _identidad(self.archivo_legado) != self.legado:
+            return self.leer_todo(), True
+        # El bloqueo impide que un escritor rote el segmento entre el stat y la lectura
+        with registro_eventos.bloqueo_archivo(self.archivo):
+            nuevos = self._leer_nuevos()
+        if nuevos is None:
+            # La relectura completa toma de nuevo el bloqueo mientras se recorre
+            return self.leer_todo(), True
+        return nuevos, False
+
+    def _leer_nuevos(self):
+        """Eventos agregados desde la última lectura, o None si hay que releer todo"""
+        identidad = _identidad(self.archivo)
+        rotados = registro_eventos.segmentos_rotados(self.archivo)
+
+        if rotados == self.rotados:
+            if identidad is None:
+                if self.inodo is None:
+                    return []
+                # El segmento activo desapareció sin rotarse
+                return None
+            if self.inodo is not None and identidad[:2] != self.inodo:
+                return None
+            if identidad[2] < self.offset:
+                # Truncado
+                return None
+            self.inodo = identidad[:2]
+            nuevos, self.offset = _leer_desde(self.archivo, self.offset)
+            return nuevos
+
+        # Rotación: los segmentos conocidos deben seguir ahí y el primero
+        # nuevo debe ser el archivo que veníamos leyendo
+        agregados = rotados[len(self.rotados):]
+        if rotados[:len(self.rotados)] != self.rotados or not agregados:
+            return None
+        renombrado = _identidad(agregados[0])
+        if self.inodo is not None and (renombrado is None or renombrado[:2] != self.inodo):
+            return None
+
+        nuevos, _ = _leer_desde(agregados[0], self.offset if self.inodo is not None else 0)
+        for ruta in agregados[1:]:
+            nuevos.extend(registro_eventos.leer_segmento(ruta))
+        identidad = _identidad(self.archivo)
+        self.inodo = identidad[:2] if identidad else None
+        del_activo, self.offset = _leer_desde(self.archivo, 0)
+        nuevos.extend(del_activo)
+        self.rotados = rotados
+        return nuevos
+
+
+class CursorSqlite:
+    """Posición de lectura en la base SQLite: el id del último evento leído"""
+
+    TAMANO_LOTE = 5000
+
+    def __init__(self):
+        self.ultimo_id = 0
+        self.cargado = False
+
+    def estado(self):
+        return {"ultimo_id": self.ultimo_id}
+
+    def restaurar(self, estado):
+        self.ultimo_id = estado["ultimo_id"]
+        self.cargado = True
+
+    def _leer_lotes(self):
+        # El id avanza a medida que se consume cada lote
+        import almacen_sqlite
+        while True:
+            eventos, self.ultimo_id = almacen_sqlite.eventos_posteriores(self.ultimo_id, self.TAMANO_LOTE)
+            yield from eventos
+            if len(eventos) < self.TAMANO_LOTE:
+                return
+
+    def leer_todo(self):
+        self.ultimo_id = 0
+        self.cargado = True
+        return self._leer_lotes()
+
+    def leer_nuevos(self):
+        """Devuelve (eventos, recargado) con la misma forma que CursorLogs.leer_nuevos"""
+        if not self.cargado:
+            return self.leer_todo(), True
+        return self._leer_lotes(), False
+
+
+def crear_cursor(archivo=registro_eventos.ARCHIVO_EVENTOS,
+                 archivo_legado=registro_eventos.ARCHIVO_LEGADO, incluir_archivo=False):
+    """Cursor de lectura incremental para el backend configurado"""
+    if registro_eventos.BACKEND == "sqlite":
+        return CursorSqlite()
+    return CursorLogs(archivo, archivo_legado, incluir_archivo)
@@ -0,0 +1,272 @@
+# modelo_rapido.py
+# Clasificador liviano arrufo / puntual para la primera etapa de la cascada.
+#
+# Cada descripción se convierte en n-gramas de palabras (1 y 2) y de
+# caracteres (3 a 5, dentro de cada palabra) que se mapean con un hash a
+# DIMENSION columnas; los conteos pasan por 1 + log y se normalizan (L2). Una
+# regresión logística sobre esa matriz dispersa se entrena con NumPy, y la
+# inferencia es un producto vectorizado sin importar torch.
+#
+# El umbral se calibra sobre una partición de validación: es la confianza
+# mínima desde la que las respuestas del modelo rápido alcanzan la exactitud
+# OBJETIVO_EXACTITUD. Por debajo del umbral la interfaz escala al
+# transformer (ver cargar_cascada). También escala todo lo que no llega a
+# CONFIANZA_MINIMA: con esas respuestas la interfaz entra en el ciclo de
+# mejora, y ahí las probabilidades del modelo rápido no están calibradas.
+#
+# Particiones estratificadas con semilla fija (ver dividir): entrenamiento,
+# validación (calibración) y prueba (reporte_cascada.py). Las descripciones
+# repetidas quedan todas en la misma partición.
+#
+# Uso: python modelo_rapido.py [--csv RUTA] [--destino RUTA] [--objetivo 0.99]
+import argparse
+import math
+import os
+import random
+import re
+import time
+import unicodedata
+import zlib
+from datetime import datetime
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from cache_predicciones import normalizar_texto
+from modelo_fisuras import leer_csv_fisuras, resultado_desde_probabilidades
+
+ARCHIVO_MODELO = "modelo_rapido.npz"
+ARCHIVO_CSV = "fisuras_base_limpia.csv"
+
+DIMENSION = 2 ** 18
+NGRAMAS_CARACTERES = (3, 5)
+
+# Proporciones de validación y prueba; el resto es entrenamiento
+PROPORCION_VALIDACION = 0.15
+PROPORCION_PRUEBA = 0.15
+SEMILLA = 13
+
+OBJETIVO_EXACTITUD = 0.99
+
+# Confianza desde la que la interfaz da una clasificación por buena (si no,
+# pide más detalles); el modelo rápido no responde por debajo de ella
+CONFIANZA_MINIMA = 0.90
+
+# Con FISURAS_CASCADA=0 todas las descripciones van al transformer
+CASCADA_ACTIVA = os.environ.get("FISURAS_CASCADA", "1") != "0"
+
+_PALABRA = re.compile(r"\w+")
+
+
+def _rasgos(texto):
+    """n-gramas de palabras y de caracteres de una descripción"""
+    palabras = _PALABRA.findall(unicodedata.normalize("NFC", texto).casefold())
+    rasgos = [f"p:{palabra}" for palabra in palabras]
+    rasgos.extend(f"p:{a} {b}" for a, b in zip(palabras, palabras[1:]))
+    minimo, maximo = NGRAMAS_CARACTERES
+    for palabra in palabras:
+        marcada = f" {palabra} "
+        for n in range(minimo, maximo + 1):
+            rasgos.extend(f"c:{marcada[i:i + n]}" for i in range(len(marcada) - n + 1))
+    return rasgos
+
+
+def vectorizar(textos, dimension=DIMENSION):
+    """Matriz dispersa (filas, columnas, valores) con una fila por texto"""
+    filas, columnas, valores = [], [], []
+    for fila, texto in enumerate(textos):
+        conteos = {}
+        for rasgo in _rasgos(texto):
+            # crc32 y no hash(): debe dar lo mismo entre procesos
+            columna = zlib.crc32(rasgo.encode("utf-8")) % dimension
+            conteos[columna] = conteos.get(columna, 0) + 1
+        if not conteos:
+            continue
+        pesos = [1.0 + math.log(conteo) for conteo in conteos.values()]
+        norma = math.sqrt(sum(peso * peso for peso in pesos))
+        filas.extend([fila] * len(conteos))
+        columnas.extend(conteos)
+        valores.extend(peso / norma for peso in pesos)
+    return (np.asarray(filas, dtype=np.int64), np.asarray(columnas, dtype=np.int64),
+            np.asarray(valores, dtype=np.float32), len(textos))
+
+
+def _puntajes(matriz, pesos, sesgo):
+    filas, columnas, valores, cantidad = matriz
+    return np.bincount(filas, weights=pesos[columnas] * valores, minlength=cantidad) + sesgo
+
+
+def _sigmoide(puntajes):
+    return 1.0 / (1.0 + np.exp(-np.clip(puntajes, -30, 30)))
+
+
+def entrenar(textos, etiquetas, dimension=DIMENSION, epocas=200, tasa=0.5, regularizacion=1e-5):
+    """Regresión logística por descenso de gradiente (Adam) sobre toda la partición
+
+    etiquetas: 1 = arrufo, 0 = puntual. Devuelve (pesos, sesgo).
+    """
+    matriz = vectorizar(textos, dimension)
+    filas, columnas, valores, cantidad = matriz
+    y = np.asarray(etiquetas, dtype=np.float64)
+    pesos = np.zeros(dimension)
+    sesgo = 0.0
+    momento, varianza = np.zeros(dimension), np.zeros(dimension)
+    momento_sesgo = varianza_sesgo = 0.0
+    beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+    for epoca in range(1, epocas + 1):
+        error = _sigmoide(_puntajes(matriz, pesos, sesgo)) - y
+        gradiente = np.bincount(columnas, weights=error[filas] * valores, minlength=dimension) / cantidad
+        gradiente += regularizacion * pesos
+        gradiente_sesgo = error.mean()
+
+        momento = beta1 * momento + (1 - beta1) * gradiente
+        varianza = beta2 * varianza + (1 - beta2) * gradiente ** 2
+        momento_sesgo = beta1 * momento_sesgo + (1 - beta1) * gradiente_sesgo
+        varianza_sesgo = beta2 * varianza_sesgo + (1 - beta2) * gradiente_sesgo ** 2
+        correccion1, correccion2 = 1 - beta1 ** epoca, 1 - beta2 ** epoca
+        pesos -= tasa * (momento / correccion1) / (np.sqrt(varianza / correccion2) + epsilon)
+        sesgo -= tasa * (momento_sesgo / correccion1) / (np.sqrt(varianza_sesgo / correccion2) + epsilon)
+    return pesos, sesgo
+
+
+def calibrar_umbral(probabilidades, etiquetas, objetivo=OBJETIVO_EXACTITUD):
+    """Confianza mínima desde la que las respuestas alcanzan la exactitud objetivo
+
+    Se recorren las predicciones de la más a la menos confiada; el umbral es
+    la confianza de la última desde la que la exactitud acumulada sigue
+    siendo >= objetivo. Si ni la más confiada alcanza, el umbral es 1.0 (todo
+    escala al transformer).
+    """
+    confianza = np.maximum(probabilidades, 1 - probabilidades)
+    aciertos = (probabilidades > 0.5) == np.asarray(etiquetas, dtype=bool)
+    orden = np.argsort(-confianza, kind="stable")
+    exactitud = np.cumsum(aciertos[orden]) / np.arange(1, len(orden) + 1)
+    validos = np.nonzero(exactitud >= objetivo)[0]
+    if not len(validos):
+        return 1.0
+    return float(confianza[orden][validos[-1]])
+
+
+def dividir(filas, semilla=SEMILLA):
+    """Particiones estratificadas (entrenamiento, validación, prueba) de (etiqueta, texto)
+
+    Se reparten textos distintos y no filas: todas las copias de una
+    descripción (normalizada) van a la misma partición, así la prueba no
+    contiene textos vistos al entrenar. Cada texto se estratifica por la
+    etiqueta de su primera aparición.
+    """
+    generador = random.Random(semilla)
+    grupos = {}
+    for fila in filas:
+        grupos.setdefault(normalizar_texto(fila[1]), []).append(fila)
+    particiones = ([], [], [])
+    for clase in sorted({grupo[0][0] for grupo in grupos.values()}):
+        de_clase = [grupo for grupo in grupos.values() if grupo[0][0] == clase]
+        generador.shuffle(de_clase)
+        n_prueba = round(len(de_clase) * PROPORCION_PRUEBA)
+        n_validacion = round(len(de_clase) * PROPORCION_VALIDACION)
+        for grupo in de_clase[:n_prueba]:
+            particiones[2].extend(grupo)
+        for grupo in de_clase[n_prueba:n_prueba + n_validacion]:
+            particiones[1].extend(grupo)
+        for grupo in de_clase[n_prueba + n_validacion:]:
+            particiones[0].extend(grupo)
+    for particion in particiones:
+        generador.shuffle(particion)
+    return particiones
+
+
+def leer_particiones(ruta_csv=ARCHIVO_CSV):
+    filas = [(etiqueta, texto) for etiqueta, texto in leer_csv_fisuras(ruta_csv)
+             if etiqueta in ("arrufo", "puntual") and texto]
+    return dividir(filas)
+
+
+class ModeloRapido:
+    """Pesos del modelo rápido y su umbral calibrado"""
+
+    def __init__(self, pesos, sesgo, umbral, dimension=DIMENSION, version=None):
+        self.pesos = pesos
+        self.sesgo = sesgo
+        self.umbral = umbral
+        self.dimension = dimension
+        self.version = version
+
+    @property
+    def umbral_efectivo(self):
+        """Confianza mínima para responder sin el transformer"""
+        return max(self.umbral, CONFIANZA_MINIMA)
+
+    @classmethod
+    def cargar(cls, ruta=ARCHIVO_MODELO):
+        with np.load(ruta) as datos:
+            marca = datetime.fromtimestamp(os.path.getmtime(ruta)).strftime("%Y%m%d%H%M%S")
+            return cls(datos["pesos"], float(datos["sesgo"]), float(datos["umbral"]),
+                       int(datos["dimension"]), version=f"rapido@{marca}")
+
+    def guardar(self, ruta=ARCHIVO_MODELO):
+        temporal = ruta + ".tmp.npz"
+        np.savez_compressed(temporal, pesos=self.pesos.astype(np.float32), sesgo=self.sesgo,
+                            umbral=self.umbral, dimension=self.dimension)
+        os.replace(temporal, ruta)
+
+    def probabilidades(self, textos):
+        """Probabilidad de arrufo de cada texto"""
+        return _sigmoide(_puntajes(vectorizar(textos, self.dimension), self.pesos, self.sesgo))
+
+    def clasificar(self, texto):
+        prob_arrufo = float(self.probabilidades([texto])[0])
+        return resultado_desde_probabilidades(prob_arrufo, 1.0 - prob_arrufo)
+
+    def clasificar_confiado(self, texto):
+        """Resultado del modelo rápido si su confianza alcanza el umbral efectivo; si no, None"""
+        resultado = self.clasificar(texto)
+        return resultado if resultado[1] >= self.umbral_efectivo else None
+
+
+def cargar_cascada(ruta=ARCHIVO_MODELO):
+    """Modelo rápido para la cascada, o None si está desactivada, falta NumPy o no se entrenó"""
+    if not CASCADA_ACTIVA or np is None or not os.path.exists(ruta):
+        return None
+    try:
+        return ModeloRapido.cargar(ruta)
+    except Exception as e:
+        print(f"Error cargando modelo rápido: {e}")
+        return None
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Entrena y calibra el modelo rápido de la cascada")
+    parser.add_argument("--csv", default=ARCHIVO_CSV)
+    parser.add_argument("--destino", default=ARCHIVO_MODELO)
+    parser.add_argument("--objetivo", type=float, default=OBJETIVO_EXACTITUD,
+                        help="exactitud mínima de las respuestas que no escalan")
+    parser.add_argument("--epocas", type=int, default=200)
+    argumentos = parser.parse_args()
+    if np is None:
+        raise SystemExit("Se necesita 'pip install numpy'")
+
+    entrenamiento, validacion, prueba = leer_particiones(argumentos.csv)
+    print(f"Particiones: {len(entrenamiento)} entrenamiento, {len(validacion)} validación, {len(prueba)} prueba")
+    inicio = time.perf_counter()
+    pesos, sesgo = entrenar([texto for _, texto in entrenamiento],
+                            [etiqueta == "arrufo" for etiqueta, _ in entrenamiento], epocas=argumentos.epocas)
+    print(f"Entrenado en {time.perf_counter() - inicio:.1f} s")
+
+    modelo = ModeloRapido(pesos, sesgo, 1.0)
+    etiquetas_validacion = [etiqueta == "arrufo" for etiqueta, _ in validacion]
+    modelo.umbral = calibrar_umbral(modelo.probabilidades([texto for _, texto in validacion]),
+                                    etiquetas_validacion, argumentos.objetivo)
+    modelo.guardar(argumentos.destino)
+
+    probabilidades = modelo.probabilidades([texto for _, texto in prueba])
+    etiquetas = np.asarray([etiqueta == "arrufo" for etiqueta, _ in prueba])
+    confiadas = np.maximum(probabilidades, 1 - probabilidades) >= modelo.umbral_efectivo
+    aciertos = (probabilidades > 0.5) == etiquetas
+    print(f"Umbral calibrado: {modelo.umbral:.4f} (objetivo {argumentos.objetivo:.2%} en validación), "
+          f"efectivo {modelo.umbral_efectivo:.4f}")
+    print(f"Prueba: exactitud {aciertos.mean():.4f}, respondidas sin escalar {confiadas.mean():.1%} "
+          f"con exactitud {aciertos[confiadas].mean() if confiadas.any() else float('nan'):.4f}")
+    print(f"Modelo guardado en {argumentos.destino}")
@@ -1,8 +1,17 @@
 import flet as ft
-import json
 import os
+import threading
 from datetime import datetime
-from collections import Counter
+import registro_eventos
+import almacen_sqlite
+import retencion_logs
+import consultas_logs
+import reporte_pdf
+import exportar_logs
+import vigilancia_logs
+from agregados_logs import AgregadosLogs
+from modelo_logs import CursorLogs
+from vista_virtual import Columna, HistorialVirtual
 
 def main(page: ft.Page):
     page.title = "Panel de Administrador"
@@ -10,405 +19,422 @@ def main(page: ft.Page):
     page.padding = 0
     page.bgcolor = ft.Colors.GREY_50
     
-    # Variables para los contenedores de datos
-    tabla_accesos = ft.DataTable(
-        columns=[
-            ft.DataColumn(ft.Text("Usuario", weight=ft.FontWeight.BOLD)),
-            ft.DataColumn(ft.Text("Tipo", weight=ft.FontWeight.BOLD)),
-            ft.DataColumn(ft.Text("Fecha", weight=ft.FontWeight.BOLD)),
-            ft.DataColumn(ft.Text("Hora", weight=ft.FontWeight.BOLD)),
-            ft.DataColumn(ft.Text("Detalles", weight=ft.FontWeight.BOLD)),
+    # Contenedores para estadísticas
+    total_accesos = ft.Text("0", size=32, weight=ft.FontWeight.BOLD, color=ft.Colors.BLUE_700)
+    total_busquedas = ft.Text("0", size=32, weight=ft.FontWeight.BOLD, color=ft.Colors.GREEN_700)
+    usuarios_activos = ft.Text("0", size=32, weight=ft.FontWeight.BOLD, color=ft.Colors.ORANGE_700)
+    
+    # Con SISTEMA_LOGS_BACKEND=sqlite las vistas se resuelven con consultas indexadas
+    usar_sqlite = registro_eventos.BACKEND == "sqlite"
+    
+    # Contadores persistidos junto al log para las tarjetas y el reporte
+    agregados = AgregadosLogs()
+    
+    # Gráfico de actividad a partir de las series por hora/día de `agregados`
+    SERIES_GRAFICO = {
+        "accesos": ("Accesos", ft.Colors.BLUE_600),
+        "fallidos": ("Accesos fallidos", ft.Colors.RED_400),
+        "busquedas": ("Búsquedas", ft.Colors.GREEN_600),
+        "arrufo": ("Arrufo", ft.Colors.ORANGE_600),
+        "puntual": ("Puntual", ft.Colors.PURPLE_400),
+    }
+    selector_granularidad = ft.Dropdown(
+        width=170,
+        dense=True,
+        value="dia",
+        options=[
+            ft.dropdown.Option("dia", "Últimos 30 días"),
+            ft.dropdown.Option("hora", "Últimas 48 horas"),
         ],
-        rows=[],
-        border=ft.border.all(1, ft.Colors.GREY_300),
-        border_radius=8,
-        vertical_lines=ft.BorderSide(1, ft.Colors.GREY_300),
-        horizontal_lines=ft.BorderSide(1, ft.Colors.GREY_300),
-        heading_row_color=ft.Colors.BLUE_50,
+        on_change=lambda e: (actualizar_grafico(), page.update()),
+    )
+    grafico_actividad = ft.LineChart(
+        data_series=[],
+        min_x=0,
+        min_y=0,
+        left_axis=ft.ChartAxis(labels_size=40),
+        bottom_axis=ft.ChartAxis(labels=[], labels_size=28),
+        horizontal_grid_lines=ft.ChartGridLines(color=ft.Colors.GREY_200, width=1),
+        tooltip_bgcolor=ft.Colors.with_opacity(0.9, ft.Colors.WHITE),
+        height=220,
+        expand=True,
+    )
+    leyenda_actividad = ft.Row(
+        controls=[
+            ft.Row(
+                controls=[ft.Container(width=12, height=12, bgcolor=color, border_radius=6),
+                          ft.Text(nombre, size=12)],
+                spacing=4,
+            )
+            for nombre, color in SERIES_GRAFICO.values()
+        ],
+        spacing=15,
+        wrap=True,
     )
     
-    tabla_busquedas = ft.DataTable(
-        columns=[
-            ft.DataColumn(ft.Text("Usuario", weight=ft.FontWeight.BOLD)),
-            ft.DataColumn(ft.Text("Descripción Búsqueda", weight=ft.FontWeight.BOLD)),
-            ft.DataColumn(ft.Text("Resultado", weight=ft.FontWeight.BOLD)),
-            ft.DataColumn(ft.Text("Fecha", weight=ft.FontWeight.BOLD)),
-            ft.DataColumn(ft.Text("Hora", weight=ft.FontWeight.BOLD)),
+    # Filtros de las tablas de historial
+    TIPOS_ACCESO = ['login_admin', 'login_usuario', 'login_fallido']
+    filtros = {"usuario": None, "desde": None, "hasta": None, "tipo_acceso": None}
+    
+    # Modo en vivo: un cursor propio (o el último id en SQLite) detecta los
+    # eventos nuevos y el vigilante limita los refrescos a uno por segundo
+    cursor_vivo = CursorLogs()
+    vivo = {"ultimo_id": 0}
+    bloqueo_vista = threading.Lock()
+    vigilante = vigilancia_logs.VigilanteLogs(lambda: aplicar_cambios())
+    interruptor_vivo = ft.Switch(label="En vivo", value=True,
+                                 on_change=lambda e: cambiar_modo_vivo(e))
+    
+    # Reporte PDF en segundo plano: progreso y cancelación
+    reporte = {"trabajo": None}
+    casilla_apendice = ft.Checkbox(label="Apéndice con todas las búsquedas", value=False)
+    casilla_cambios = ft.Checkbox(label="Solo cambios desde el último reporte", value=False)
+    barra_reporte = ft.ProgressBar(width=160, visible=False)
+    texto_reporte = ft.Text("", size=12, color=ft.Colors.GREY_600, visible=False)
+    boton_cancelar_reporte = ft.TextButton("Cancelar", visible=False,
+                                           on_click=lambda e: cancelar_reporte(e))
+    # Exportación del historial (CSV, Parquet o Arrow) con el rango de fechas filtrado
+    selector_formato = ft.Dropdown(
+        label="Formato",
+        width=120,
+        dense=True,
+        value="csv",
+        options=[ft.dropdown.Option(formato, formato.upper()) for formato in exportar_logs.FORMATOS],
+    )
+    texto_exportacion = ft.Text("", size=12, color=ft.Colors.GREY_600)
+    boton_exportar = ft.OutlinedButton("📤 Exportar", on_click=lambda e: exportar_historial(e))
+    
+    boton_reporte = ft.ElevatedButton(
+        "📄 Generar Reporte PDF",
+        on_click=lambda e: generar_reporte(e),
+        style=ft.ButtonStyle(
+            color=ft.Colors.WHITE,
+            bgcolor=ft.Colors.GREEN_600,
+        ),
+    )
+    
+    # Controles de filtros
+    campo_usuario = ft.TextField(label="Usuario", width=160, dense=True)
+    campo_desde = ft.TextField(label="Desde (AAAA-MM-DD)", width=180, dense=True)
+    campo_hasta = ft.TextField(label="Hasta (AAAA-MM-DD)", width=180, dense=True)
+    selector_tipo = ft.Dropdown(
+        label="Tipo de acceso",
+        width=180,
+        dense=True,
+        value="todos",
+        options=[
+            ft.dropdown.Option("todos", "Todos"),
+            ft.dropdown.Option("login_usuario", "Login Usuario"),
+            ft.dropdown.Option("login_admin", "Login Admin"),
+            ft.dropdown.Option("login_fallido", "Login Fallido"),
         ],
-        rows=[],
-        border=ft.border.all(1, ft.Colors.GREY_300),
-        border_radius=8,
-        vertical_lines=ft.BorderSide(1, ft.Colors.GREY_300),
-        horizontal_lines=ft.BorderSide(1, ft.Colors.GREY_300),
-        heading_row_color=ft.Colors.GREEN_50,
     )
     
-    # Contenedores para estadísticas
-    total_accesos = ft.Text("0", size=32, weight=ft.FontWeight.BOLD, color=ft.Colors.BLUE_700)
-    total_busquedas = ft.Text("0", size=32, weight=ft.FontWeight.BOLD, color=ft.Colors.GREEN_700)
-    usuarios_activos = ft.Text("0", size=32, weight=ft.FontWeight.BOLD, color=ft.Colors.ORANGE_700)
+    def consultar_historial(tipos, antes_de, limite):
+        """Bloque de eventos de una tabla con los filtros aplicados"""
+        return consultas_logs.consultar(
+            tipos=tipos,
+            usuario=filtros["usuario"],
+            desde=filtros["desde"],
+            hasta=filtros["hasta"],
+            antes_de=antes_de,
+            limite=limite,
+        )
+    
+    def aplicar_filtros(e):
+        """Aplica los filtros y vuelve a la primera página de ambas tablas"""
+        fechas = {}
+        for nombre, campo in (("desde", campo_desde), ("hasta", campo_hasta)):
+            valor = (campo.value or "").strip()
+            if valor:
+                try:
+                    datetime.strptime(valor, "%Y-%m-%d")
+                except ValueError:
+                    page.open(
+                        ft.SnackBar(
+                            content=ft.Text("Las fechas deben tener el formato AAAA-MM-DD"),
+                            bgcolor=ft.Colors.RED_600,
+                            duration=3000
+                        )
+                    )
+                    return
+            fechas[nombre] = valor or None
+        
+        filtros["usuario"] = (campo_usuario.value or "").strip() or None
+        filtros["desde"] = fechas["desde"]
+        filtros["hasta"] = fechas["hasta"]
+        filtros["tipo_acceso"] = None if selector_tipo.value == "todos" else selector_tipo.value
+        with bloqueo_vista:
+            actualizar_tabla_accesos()
+            actualizar_tabla_busquedas()
+            actualizar_grafico()
+        page.update()
+    
+    def limpiar_filtros(e):
+        """Quita todos los filtros"""
+        campo_usuario.value = ""
+        campo_desde.value = ""
+        campo_hasta.value = ""
+        selector_tipo.value = "todos"
+        aplicar_filtros(e)
     
-    def cargar_logs():
-        """Carga los logs del sistema"""
+    def actualizar_logs():
+        """Lee solo los eventos agregados desde la última actualización"""
         try:
-            archivo_log = "sistema_logs.json"
-            if os.path.exists(archivo_log):
-                with open(archivo_log, 'r', encoding='utf-8') as f:
-                    return json.load(f)
-            return []
+            agregados.actualizar()
         except Exception as e:
-            print(f"Error al cargar logs: {e}")
-            return []
+            print(f"Error al actualizar agregados: {e}")
     
     def actualizar_estadisticas():
         """Actualiza las estadísticas del panel"""
-        logs = cargar_logs()
-        
-        # Contar diferentes tipos de eventos
-        accesos = [log for log in logs if log['tipo'] in ['login_admin', 'login_usuario']]
-        busquedas = [log for log in logs if log['tipo'] == 'busqueda']
-        usuarios_unicos = set([log['usuario'] for log in logs if log['tipo'] in ['login_admin', 'login_usuario']])
-        
-        total_accesos.value = str(len(accesos))
-        total_busquedas.value = str(len(busquedas))
-        usuarios_activos.value = str(len(usuarios_unicos))
+        if usar_sqlite:
+            total_accesos.value = str(almacen_sqlite.contar_eventos(['login_admin', 'login_usuario']))
+            total_busquedas.value = str(almacen_sqlite.contar_eventos(['busqueda']))
+            usuarios_activos.value = str(almacen_sqlite.contar_usuarios(['login_admin', 'login_usuario']))
+        else:
+            # Los contadores se mantienen incrementalmente en `agregados`
+            total_accesos.value = str(agregados.total_accesos)
+            total_busquedas.value = str(agregados.total_busquedas)
+            usuarios_activos.value = str(agregados.usuarios_activos)
+        actualizar_grafico()
+    
+    def actualizar_grafico():
+        """Dibuja la serie de actividad desde los intervalos preagregados"""
+        por_hora = selector_granularidad.value == "hora"
+        serie = agregados.series.serie(
+            granularidad="hora" if por_hora else "dia",
+            usuario=filtros["usuario"],
+            ultimos=48 if por_hora else 30,
+        )
+        maximo = 0
+        grafico_actividad.data_series = []
+        for metrica, (_, color) in SERIES_GRAFICO.items():
+            puntos = [ft.LineChartDataPoint(x, conteos.get(metrica, 0))
+                      for x, (_, conteos) in enumerate(serie)]
+            maximo = max([maximo] + [punto.y for punto in puntos])
+            grafico_actividad.data_series.append(
+                ft.LineChartData(data_points=puntos, color=color, stroke_width=2, curved=True)
+            )
+        # Etiquetas espaciadas para que no se encimen
+        paso = max(1, len(serie) // 8)
+        grafico_actividad.bottom_axis.labels = [
+            ft.ChartAxisLabel(
+                value=x,
+                label=ft.Text(clave[11:13] + "h" if por_hora else clave[5:], size=10, color=ft.Colors.GREY_600),
+            )
+            for x, (clave, _) in enumerate(serie) if x % paso == 0
+        ]
+        grafico_actividad.max_x = max(1, len(serie) - 1)
+        grafico_actividad.max_y = max(5, maximo * 1.1)
+    
+    def tipos_accesos():
+        return [filtros["tipo_acceso"]] if filtros["tipo_acceso"] else TIPOS_ACCESO
     
     def actualizar_tabla_accesos():
         """Actualiza la tabla de accesos"""
-        logs = cargar_logs()
-        accesos = [log for log in logs if log['tipo'] in ['login_admin', 'login_usuario', 'login_fallido']]
-        
-        # Ordenar por fecha más reciente
-        accesos.sort(key=lambda x: x['timestamp'], reverse=True)
-        
-        tabla_accesos.rows.clear()
-        for log in accesos[:50]:  # Mostrar últimos 50 accesos
-            color_tipo = ft.Colors.GREEN_100 if log['tipo'] == 'login_usuario' else \
-                        ft.Colors.BLUE_100 if log['tipo'] == 'login_admin' else ft.Colors.RED_100
-            
-            tabla_accesos.rows.append(
-                ft.DataRow(
-                    cells=[
-                        ft.DataCell(ft.Text(log['usuario'])),
-                        ft.DataCell(ft.Container(
-                            content=ft.Text(
-                                log['tipo'].replace('_', ' ').title(),
-                                color=ft.Colors.WHITE,
-                                size=11
-                            ),
-                            bgcolor=color_tipo,
-                            padding=5,
-                            border_radius=5
-                        )),
-                        ft.DataCell(ft.Text(log['fecha'])),
-                        ft.DataCell(ft.Text(log['hora'])),
-                        ft.DataCell(ft.Text(log.get('detalles', '-'), max_lines=2)),
-                    ]
-                )
-            )
+        historial_accesos.reiniciar()
+    
+    def celdas_acceso(log):
+        """Valores de la fila de la tabla de accesos para un evento"""
+        color_tipo = ft.Colors.GREEN_100 if log['tipo'] == 'login_usuario' else \
+                    ft.Colors.BLUE_100 if log['tipo'] == 'login_admin' else ft.Colors.RED_100
+        return (
+            log['usuario'],
+            (log['tipo'].replace('_', ' ').title(), color_tipo),
+            log['fecha'],
+            log['hora'],
+            log.get('detalles') or '-',
+        )
     
     def actualizar_tabla_busquedas():
         """Actualiza la tabla de búsquedas"""
-        logs = cargar_logs()
-        busquedas = [log for log in logs if log['tipo'] == 'busqueda']
+        historial_busquedas.reiniciar()
+    
+    def celdas_busqueda(log):
+        """Valores de la fila de la tabla de búsquedas para un evento"""
+        descripcion = log.get('descripcion') or 'N/A'
+        resultado = log.get('resultado') or 'N/A'
         
-        # Ordenar por fecha más reciente
-        busquedas.sort(key=lambda x: x['timestamp'], reverse=True)
+        # Limitar longitud de descripción
+        if len(descripcion) > 50:
+            descripcion = descripcion[:50] + "..."
         
-        tabla_busquedas.rows.clear()
-        for log in busquedas[:50]:  # Mostrar últimas 50 búsquedas
-            detalles = json.loads(log.get('detalles', '{}'))
-            descripcion = detalles.get('descripcion', 'N/A')
-            resultado = detalles.get('resultado', 'N/A')
-            
-            # Limitar longitud de descripción
-            if len(descripcion) > 50:
-                descripcion = descripcion[:50] + "..."
-            
-            tabla_busquedas.rows.append(
-                ft.DataRow(
-                    cells=[
-                        ft.DataCell(ft.Text(log['usuario'])),
-                        ft.DataCell(ft.Text(descripcion)),
-                        ft.DataCell(ft.Container(
-                            content=ft.Text(
-                                resultado.upper(),
-                                color=ft.Colors.WHITE,
-                                size=11,
-                                weight=ft.FontWeight.BOLD
-                            ),
-                            bgcolor=ft.Colors.RED_400 if resultado.lower() == 'arrufo' else ft.Colors.BLUE_400,
-                            padding=5,
-                            border_radius=5
-                        )),
-                        ft.DataCell(ft.Text(log['fecha'])),
-                        ft.DataCell(ft.Text(log['hora'])),
-                    ]
-                )
-            )
+        color = ft.Colors.RED_400 if resultado.lower() == 'arrufo' else ft.Colors.BLUE_400
+        return (log['usuario'], descripcion, (resultado.upper(), color), log['fecha'], log['hora'])
+    
+    # Historiales virtualizados: solo existen las filas visibles y se cargan
+    # bloques de eventos a medida que se avanza hacia los más antiguos
+    historial_accesos = HistorialVirtual(
+        columnas=[
+            Columna("Usuario", 140),
+            Columna("Tipo", 130, insignia=True),
+            Columna("Fecha", 100),
+            Columna("Hora", 80),
+            Columna("Detalles"),
+        ],
+        celdas=celdas_acceso,
+        cargar=lambda antes_de, limite: consultar_historial(tipos_accesos(), antes_de, limite),
+        color_encabezado=ft.Colors.BLUE_50,
+    )
+    
+    historial_busquedas = HistorialVirtual(
+        columnas=[
+            Columna("Usuario", 140),
+            Columna("Descripción Búsqueda"),
+            Columna("Resultado", 110, insignia=True),
+            Columna("Fecha", 100),
+            Columna("Hora", 80),
+        ],
+        celdas=celdas_busqueda,
+        cargar=lambda antes_de, limite: consultar_historial(['busqueda'], antes_de, limite),
+        color_encabezado=ft.Colors.GREEN_50,
+    )
+    
+    def cumple_filtros(log, tipos):
+        """Indica si un evento nuevo debe aparecer en una tabla con los filtros aplicados"""
+        if log.get('tipo') not in tipos:
+            return False
+        if filtros["usuario"] and log.get('usuario') != filtros["usuario"]:
+            return False
+        timestamp = log.get('timestamp', '')
+        if filtros["desde"] and timestamp < filtros["desde"]:
+            return False
+        if filtros["hasta"] and timestamp[:10] > filtros["hasta"]:
+            return False
+        return True
+    
+    def leer_eventos_nuevos():
+        """Eventos escritos desde la última revisión; devuelve (eventos, recargado)"""
+        if usar_sqlite:
+            eventos, vivo["ultimo_id"] = almacen_sqlite.eventos_posteriores(vivo["ultimo_id"])
+            return eventos, False
+        eventos, recargado = cursor_vivo.leer_nuevos()
+        if recargado:
+            # Si el log se reescribió (compactación, migración) se rehacen las
+            # tablas; el cursor se lleva al final sin recorrer el historial
+            cursor_vivo.ir_al_final()
+            return [], True
+        return eventos, False
+    
+    def aplicar_cambios():
+        """Lleva a la vista solo las filas y contadores afectados por eventos nuevos"""
+        with bloqueo_vista:
+            eventos, recargado = leer_eventos_nuevos()
+            if not eventos and not recargado:
+                return
+            actualizar_logs()
+            actualizar_estadisticas()
+            if recargado:
+                actualizar_tabla_accesos()
+                actualizar_tabla_busquedas()
+            else:
+                eventos.sort(key=lambda log: log.get('timestamp', ''))
+                historial_accesos.agregar_nuevos(
+                    [log for log in eventos if cumple_filtros(log, tipos_accesos())])
+                historial_busquedas.agregar_nuevos(
+                    [log for log in eventos if cumple_filtros(log, ['busqueda'])])
+            page.update()
+    
+    def cambiar_modo_vivo(e):
+        """Activa o desactiva la actualización automática"""
+        if interruptor_vivo.value:
+            vigilante.iniciar()
+        else:
+            vigilante.detener()
     
     def generar_reporte(e):
-        """Genera un reporte completo en formato PDF"""
+        """Lanza la generación del reporte PDF en un proceso aparte"""
+        if reporte["trabajo"] is not None:
+            return
+        nombre_archivo = f"reporte_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
+        if casilla_cambios.value and reporte_pdf.ultimo_reporte() is None:
+            mostrar_mensaje("No hay un reporte anterior; se genera el reporte completo", ft.Colors.GREY_700)
+        trabajo = reporte_pdf.TrabajoReporte(nombre_archivo, casilla_apendice.value, casilla_cambios.value)
         try:
-            from reportlab.lib.pagesizes import letter, A4
-            from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-            from reportlab.lib.units import inch
-            from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
-            from reportlab.lib import colors
-            from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
-            
-            logs = cargar_logs()
-            
-            # Análisis de datos
-            accesos = [log for log in logs if log['tipo'] in ['login_admin', 'login_usuario']]
-            busquedas = [log for log in logs if log['tipo'] == 'busqueda']
-            usuarios_unicos = set([log['usuario'] for log in accesos])
-            
-            # Contar búsquedas por usuario
-            busquedas_por_usuario = Counter([log['usuario'] for log in busquedas])
-            
-            # Contar tipos de resultados
-            resultados = []
-            for busqueda in busquedas:
-                try:
-                    detalles = json.loads(busqueda.get('detalles', '{}'))
-                    resultado = detalles.get('resultado', 'desconocido')
-                    resultados.append(resultado)
-                except:
-                    pass
-            
-            contador_resultados = Counter(resultados)
-            
-            # Crear PDF
-            nombre_archivo = f"reporte_{datetime.now().strftime('%Y%m%d_%H%M%S')}.pdf"
-            doc = SimpleDocTemplate(nombre_archivo, pagesize=letter)
-            story = []
-            styles = getSampleStyleSheet()
-            
-            # Estilos personalizados
-            titulo_style = ParagraphStyle(
-                'CustomTitle',
-                parent=styles['Heading1'],
-                fontSize=24,
-                textColor=colors.HexColor('#1E40AF'),
-                spaceAfter=30,
-                alignment=TA_CENTER,
-                fontName='Helvetica-Bold'
-            )
-            
-            subtitulo_style = ParagraphStyle(
-                'CustomSubtitle',
-                parent=styles['Heading2'],
-                fontSize=16,
-                textColor=colors.HexColor('#1E40AF'),
-                spaceAfter=12,
-                spaceBefore=12,
-                fontName='Helvetica-Bold'
-            )
-            
-            fecha_style = ParagraphStyle(
-                'DateStyle',
-                parent=styles['Normal'],
-                fontSize=10,
-                textColor=colors.gray,
-                alignment=TA_CENTER,
-                spaceAfter=20
-            )
-            
-            # Título
-            titulo = Paragraph("REPORTE DEL SISTEMA DE ANÁLISIS DE FISURAS", titulo_style)
-            story.append(titulo)
-            
-            # Fecha
-            fecha_reporte = datetime.now().strftime("%d de %B de %Y - %H:%M:%S")
-            fecha_texto = Paragraph(f"Generado el: {fecha_reporte}", fecha_style)
-            story.append(fecha_texto)
-            story.append(Spacer(1, 0.3*inch))
-            
-            # ESTADÍSTICAS GENERALES
-            story.append(Paragraph("📊 ESTADÍSTICAS GENERALES", subtitulo_style))
-            
-            data_stats = [
-                ['Métrica', 'Valor'],
-                ['Total de Accesos al Sistema', str(len(accesos))],
-                ['Total de Búsquedas Realizadas', str(len(busquedas))],
-                ['Usuarios Activos', str(len(usuarios_unicos))]
-            ]
-            
-            tabla_stats = Table(data_stats, colWidths=[4*inch, 2*inch])
-            tabla_stats.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3B82F6')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 10),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F3F4F6')])
-            ]))
-            story.append(tabla_stats)
-            story.append(Spacer(1, 0.3*inch))
-            
-            # ACTIVIDAD POR USUARIO
-            story.append(Paragraph("👥 ACTIVIDAD POR USUARIO", subtitulo_style))
-            
-            data_usuarios = [['Usuario', 'Accesos', 'Búsquedas']]
-            for usuario in sorted(usuarios_unicos):
-                num_accesos = len([log for log in accesos if log['usuario'] == usuario])
-                num_busquedas = busquedas_por_usuario.get(usuario, 0)
-                data_usuarios.append([usuario, str(num_accesos), str(num_busquedas)])
-            
-            tabla_usuarios = Table(data_usuarios, colWidths=[3*inch, 1.5*inch, 1.5*inch])
-            tabla_usuarios.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#10B981')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 10),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F3F4F6')])
-            ]))
-            story.append(tabla_usuarios)
-            story.append(Spacer(1, 0.3*inch))
-            
-            # ANÁLISIS DE RESULTADOS
-            story.append(Paragraph("🔍 ANÁLISIS DE RESULTADOS", subtitulo_style))
-            story.append(Paragraph("Distribución de Clasificaciones:", styles['Normal']))
-            story.append(Spacer(1, 0.1*inch))
-            
-            data_resultados = [['Tipo', 'Cantidad', 'Porcentaje']]
-            for tipo, cantidad in contador_resultados.most_common():
-                porcentaje = (cantidad / len(resultados) * 100) if resultados else 0
-                data_resultados.append([
-                    tipo.upper(),
-                    str(cantidad),
-                    f"{porcentaje:.1f}%"
-                ])
-            
-            tabla_resultados = Table(data_resultados, colWidths=[2.5*inch, 1.5*inch, 2*inch])
-            tabla_resultados.setStyle(TableStyle([
-                ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#F59E0B')),
-                ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                ('FONTSIZE', (0, 0), (-1, 0), 12),
-                ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                ('FONTSIZE', (0, 1), (-1, -1), 10),
-                ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F3F4F6')])
-            ]))
-            story.append(tabla_resultados)
-            story.append(PageBreak())
-            
-            # ÚLTIMAS BÚSQUEDAS
-            story.append(Paragraph("📝 ÚLTIMAS BÚSQUEDAS REALIZADAS", subtitulo_style))
-            story.append(Spacer(1, 0.2*inch))
-            
-            data_busquedas = [['#', 'Usuario', 'Fecha/Hora', 'Resultado']]
-            for i, busqueda in enumerate(busquedas[-10:], 1):
-                try:
-                    detalles = json.loads(busqueda.get('detalles', '{}'))
-                    resultado = detalles.get('resultado', 'N/A')
-                    fecha_hora = f"{busqueda['fecha']}\n{busqueda['hora']}"
-                    
-                    data_busquedas.append([
-                        str(i),
-                        busqueda['usuario'],
-                        fecha_hora,
-                        resultado.upper()
-                    ])
-                except:
-                    pass
-            
-            if len(data_busquedas) > 1:
-                tabla_busquedas = Table(data_busquedas, colWidths=[0.5*inch, 1.5*inch, 2*inch, 1.5*inch])
-                tabla_busquedas.setStyle(TableStyle([
-                    ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#8B5CF6')),
-                    ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-                    ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
-                    ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
-                    ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-                    ('FONTSIZE', (0, 0), (-1, 0), 12),
-                    ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-                    ('GRID', (0, 0), (-1, -1), 1, colors.black),
-                    ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
-                    ('FONTSIZE', (0, 1), (-1, -1), 9),
-                    ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F3F4F6')])
-                ]))
-                story.append(tabla_busquedas)
-            
-            # Detalles de búsquedas
-            story.append(Spacer(1, 0.3*inch))
-            story.append(Paragraph("Detalles de las Búsquedas:", styles['Heading3']))
-            story.append(Spacer(1, 0.1*inch))
-            
-            for i, busqueda in enumerate(busquedas[-10:], 1):
-                try:
-                    detalles = json.loads(busqueda.get('detalles', '{}'))
-                    descripcion = detalles.get('descripcion', 'N/A')
-                    resultado = detalles.get('resultado', 'N/A')
-                    probabilidad = detalles.get('probabilidad', 'N/A')
-                    
-                    texto = f"<b>{i}. {busqueda['usuario']}</b> - {busqueda['fecha']} {busqueda['hora']}<br/>"
-                    texto += f"<i>Descripción:</i> {descripcion}<br/>"
-                    texto += f"<i>Resultado:</i> {resultado.upper()} ({probabilidad})"
-                    
-                    story.append(Paragraph(texto, styles['Normal']))
-                    story.append(Spacer(1, 0.15*inch))
-                except:
-                    pass
-            
-            # Pie de página
-            story.append(Spacer(1, 0.5*inch))
-            footer = Paragraph(
-                "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━<br/>"
-                "<b>Sistema de Análisis de Fisuras</b> - Reporte Generado Automáticamente",
-                fecha_style
-            )
-            story.append(footer)
-            
-            # Construir PDF
-            doc.build(story)
-            
-            # Mostrar mensaje de éxito
-            page.open(
-                ft.SnackBar(
-                    content=ft.Text(f"✓ Reporte PDF generado: {nombre_archivo}"),
-                    bgcolor=ft.Colors.GREEN_600,
-                    duration=3000
-                )
-            )
-            
-        except ImportError:
-            # Si reportlab no está instalado
-            page.open(
-                ft.SnackBar(
-                    content=ft.Text("Error: Instala reportlab con 'pip install reportlab'"),
-                    bgcolor=ft.Colors.RED_600,
-                    duration=5000
-                )
-            )
+            trabajo.iniciar()
         except Exception as e:
-            page.open(
-                ft.SnackBar(
-                    content=ft.Text(f"Error al generar reporte PDF: {e}"),
-                    bgcolor=ft.Colors.RED_600,
-                    duration=3000
-                )
+            mostrar_mensaje(f"Error al generar reporte PDF: {e}", ft.Colors.RED_600)
+            return
+        reporte["trabajo"] = trabajo
+        mostrar_progreso_reporte(True)
+        page.update()
+        threading.Thread(target=seguir_reporte, args=(trabajo,), daemon=True).start()
+    
+    def seguir_reporte(trabajo):
+        """Refleja en el panel el avance del proceso del reporte"""
+        for mensaje in trabajo.mensajes():
+            if mensaje[0] == "progreso":
+                _, fraccion, texto = mensaje
+                barra_reporte.value = fraccion
+                texto_reporte.value = texto
+                page.update()
+            elif mensaje[0] == "listo":
+                mostrar_mensaje(f"✓ Reporte PDF generado: {mensaje[1]}", ft.Colors.GREEN_600)
+            elif mensaje[0] == "cancelado":
+                mostrar_mensaje("Reporte cancelado", ft.Colors.GREY_700)
+            else:
+                mostrar_mensaje(f"Error al generar reporte PDF: {mensaje[1]}", ft.Colors.RED_600, 5000)
+        reporte["trabajo"] = None
+        mostrar_progreso_reporte(False)
+        page.update()
+    
+    def cancelar_reporte(e):
+        """Pide al proceso del reporte que se detenga"""
+        if reporte["trabajo"] is not None:
+            reporte["trabajo"].cancelar()
+            texto_reporte.value = "Cancelando..."
+            page.update()
+    
+    def mostrar_progreso_reporte(visible):
+        boton_reporte.disabled = visible
+        barra_reporte.value = 0 if visible else None
+        texto_reporte.value = "Iniciando..." if visible else ""
+        for control in (barra_reporte, texto_reporte, boton_cancelar_reporte):
+            control.visible = visible
+    
+    def exportar_historial(e):
+        """Exporta en segundo plano los eventos del rango de fechas filtrado"""
+        formato = selector_formato.value
+        os.makedirs("exportaciones", exist_ok=True)
+        nombre = f"eventos_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+        destino = os.path.join("exportaciones", nombre + (".csv" if formato == "csv" else ""))
+        boton_exportar.disabled = True
+        texto_exportacion.value = "Exportando..."
+        page.update()
+        
+        def al_avanzar(total):
+            texto_exportacion.value = f"Exportando... {total} eventos"
+            page.update()
+        
+        def ejecutar():
+            try:
+                total = exportar_logs.exportar(destino, formato, filtros["desde"], filtros["hasta"],
+                                               al_avanzar=al_avanzar)
+                mostrar_mensaje(f"✓ {total} eventos exportados a {destino}", ft.Colors.GREEN_600)
+            except Exception as e:
+                mostrar_mensaje(f"Error al exportar: {e}", ft.Colors.RED_600, 5000)
+            boton_exportar.disabled = False
+            texto_exportacion.value = ""
+            page.update()
+        
+        threading.Thread(target=ejecutar, daemon=True).start()
+    
+    def mostrar_mensaje(texto, color, duracion=3000):
+        page.open(
+            ft.SnackBar(
+                content=ft.Text(texto),
+                bgcolor=color,
+                duration=duracion
             )
+        )
     
     def actualizar_todo(e):
         """Actualiza todas las tablas y estadísticas"""
-        actualizar_estadisticas()
-        actualizar_tabla_accesos()
-        actualizar_tabla_busquedas()
+        with bloqueo_vista:
+            actualizar_logs()
+            actualizar_estadisticas()
+            actualizar_tabla_accesos()
+            actualizar_tabla_busquedas()
         page.update()
     
     def cerrar_sesion(e):
@@ -446,6 +472,7 @@ def main(page: ft.Page):
                                     spacing=0
                                 ),
                                 ft.Container(expand=True),
+                                interruptor_vivo,
                                 ft.ElevatedButton(
                                     "🔄 Actualizar",
                                     on_click=actualizar_todo,
@@ -454,13 +481,12 @@ def main(page: ft.Page):
                                         bgcolor=ft.Colors.BLUE_600,
                                     ),
                                 ),
-                                ft.ElevatedButton(
-                                    "📄 Generar Reporte PDF",
-                                    on_click=generar_reporte,
-                                    style=ft.ButtonStyle(
-                                        color=ft.Colors.WHITE,
-                                        bgcolor=ft.Colors.GREEN_600,
-                                    ),
+                                ft.Column(
+                                    controls=[
+                                        ft.Row(controls=[boton_reporte, casilla_apendice, casilla_cambios]),
+                                        ft.Row(controls=[barra_reporte, texto_reporte, boton_cancelar_reporte]),
+                                    ],
+                                    spacing=2,
                                 ),
                                 ft.ElevatedButton(
                                     "🚪 Cerrar Sesión",
@@ -536,22 +562,74 @@ def main(page: ft.Page):
                         padding=20,
                     ),
                     
+                    # Actividad en el tiempo
+                    ft.Container(
+                        content=ft.Container(
+                            content=ft.Column(
+                                controls=[
+                                    ft.Row(
+                                        controls=[
+                                            ft.Text("📈 Actividad", size=20, weight=ft.FontWeight.BOLD),
+                                            ft.Container(expand=True),
+                                            selector_granularidad,
+                                        ],
+                                    ),
+                                    grafico_actividad,
+                                    leyenda_actividad,
+                                ],
+                                spacing=10
+                            ),
+                            bgcolor=ft.Colors.WHITE,
+                            padding=20,
+                            border_radius=10,
+                        ),
+                        padding=ft.padding.symmetric(horizontal=20),
+                    ),
+                    
                     # Tablas
                     ft.Container(
                         content=ft.Column(
                             controls=[
+                                # Filtros
+                                ft.Container(
+                                    content=ft.Row(
+                                        controls=[
+                                            campo_usuario,
+                                            campo_desde,
+                                            campo_hasta,
+                                            selector_tipo,
+                                            ft.ElevatedButton(
+                                                "🔎 Filtrar",
+                                                on_click=aplicar_filtros,
+                                                style=ft.ButtonStyle(
+                                                    color=ft.Colors.WHITE,
+                                                    bgcolor=ft.Colors.BLUE_600,
+                                                ),
+                                            ),
+                                            ft.TextButton("Limpiar", on_click=limpiar_filtros),
+                                            ft.Container(expand=True),
+                                            selector_formato,
+                                            boton_exportar,
+                                            texto_exportacion,
+                                        ],
+                                        spacing=10,
+                                        wrap=True,
+                                    ),
+                                    bgcolor=ft.Colors.WHITE,
+                                    padding=20,
+                                    border_radius=10,
+                                ),
+                                
                                 # Tabla de Accesos
                                 ft.Container(
                                     content=ft.Column(
                                         controls=[
-                                            ft.Text("📊 Historial de Accesos", size=20, weight=ft.FontWeight.BOLD),
-                                            ft.Container(
-                                                content=ft.Column(
-                                                    controls=[tabla_accesos],
-                                                    scroll=ft.ScrollMode.AUTO,
-                                                ),
-                                                height=250,
+                                            ft.Row(
+                                                controls=[
+                                                    ft.Text("📊 Historial de Accesos", size=20, weight=ft.FontWeight.BOLD),
+                                                ],
                                             ),
+                                            historial_accesos.control,
                                         ],
                                         spacing=10
                                     ),
@@ -564,14 +642,12 @@ def main(page: ft.Page):
                                 ft.Container(
                                     content=ft.Column(
                                         controls=[
-                                            ft.Text("🔍 Historial de Búsquedas", size=20, weight=ft.FontWeight.BOLD),
-                                            ft.Container(
-                                                content=ft.Column(
-                                                    controls=[tabla_busquedas],
-                                                    scroll=ft.ScrollMode.AUTO,
-                                                ),
-                                                height=250,
+                                            ft.Row(
+                                                controls=[
+                                                    ft.Text("🔍 Historial de Búsquedas", size=20, weight=ft.FontWeight.BOLD),
+                                                ],
                                             ),
+                                            historial_busquedas.control,
                                         ],
                                         spacing=10
                                     ),
@@ -593,13 +669,29 @@ def main(page: ft.Page):
             expand=True,
         )
     
-    # Cargar datos iniciales
+    # Compactar particiones frías antes de la primera carga
+    if not usar_sqlite:
+        try:
+            retencion_logs.compactar_si_necesario()
+        except Exception as e:
+            print(f"Error al compactar logs: {e}")
+    
+    # Cargar datos iniciales; el modo en vivo parte desde el final del log
+    try:
+        if usar_sqlite:
+            vivo["ultimo_id"] = almacen_sqlite.ultimo_id()
+        else:
+            cursor_vivo.ir_al_final()
+    except Exception as e:
+        print(f"Error al iniciar el modo en vivo: {e}")
+    actualizar_logs()
     actualizar_estadisticas()
     actualizar_tabla_accesos()
     actualizar_tabla_busquedas()
     
     # Agregar al page
     page.add(create_main_content())
+    vigilante.iniciar()
 
 if __name__ == "__main__":
     ft.app(target=main)
\ No newline at end of file
@@ -0,0 +1,147 @@
+# paridad_onnx.py
+# Compara los backends de modelo_fisuras (torch, onnx, onnx-int8) sobre
+# fisuras_base_limpia.csv: exactitud, deriva de probabilidades respecto de
+# torch, predicciones que cambian de clase, latencia de una descripción
+# (p50/p95, como en la interfaz), filas por segundo por lotes y memoria
+# residente (RSS) después de cargar y máxima.
+#
+# Cada backend corre en un proceso nuevo para que la memoria de uno no se
+# sume a la del otro.
+#
+# Uso: python paridad_onnx.py [--csv RUTA] [--filas N] [--latencia N]
+#                             [--backends torch onnx onnx-int8]
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+try:
+    import resource
+except ImportError:
+    # Windows: sin getrusage no hay RSS máximo
+    resource = None
+
+from modelo_fisuras import BACKENDS, ClasificadorFisuras, leer_csv_fisuras
+
+ARCHIVO_CSV = "fisuras_base_limpia.csv"
+
+
+def rss_actual_mb():
+    """Memoria residente actual del proceso (Linux); None si no se puede leer"""
+    try:
+        with open("/proc/self/statm", 'r') as f:
+            paginas = int(f.read().split()[1])
+        return paginas * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        return None
+
+
+def rss_maximo_mb():
+    if resource is None:
+        return None
+    maximo = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux informa KB y macOS bytes
+    return maximo / 1024 / (1024 if sys.platform == "darwin" else 1)
+
+
+def medir_backend(backend, ruta_csv, filas, muestras_latencia, salida):
+    """Se ejecuta en el proceso hijo; guarda en salida las probabilidades y las medidas"""
+    textos = [texto for _, texto in leer_csv_fisuras(ruta_csv)][:filas or None]
+    rss_inicial = rss_actual_mb()
+    inicio = time.perf_counter()
+    clasificador = ClasificadorFisuras(backend=backend)
+    if not clasificador.cargar():
+        raise SystemExit(f"No se pudo cargar el backend {backend}: {clasificador.error}")
+    carga = time.perf_counter() - inicio
+    rss_cargado = rss_actual_mb()
+    clasificador.clasificar(textos[0])
+
+    latencias = []
+    for texto in textos[:muestras_latencia]:
+        t0 = time.perf_counter()
+        clasificador.clasificar(texto)
+        latencias.append((time.perf_counter() - t0) * 1000)
+
+    t0 = time.perf_counter()
+    resultados = clasificador.clasificar_lote(textos)
+    tiempo_lote = time.perf_counter() - t0
+
+    cuantiles = statistics.quantiles(latencias, n=20) if len(latencias) > 1 else latencias * 19
+    with open(salida, 'w', encoding='utf-8') as f:
+        json.dump({
+            "version": clasificador.version,
+            "carga_s": carga,
+            "latencia_p50_ms": statistics.median(latencias),
+            "latencia_p95_ms": cuantiles[18],
+            "filas_por_segundo": len(textos) / tiempo_lote,
+            "rss_cargado_mb": rss_cargado - rss_inicial if rss_cargado and rss_inicial else None,
+            "rss_maximo_mb": rss_maximo_mb(),
+            "prob_arrufo": [probabilidades["arrufo"] if probabilidades else None
+                            for _, _, probabilidades in resultados],
+        }, f)
+
+
+def medir(backend, argumentos):
+    with tempfile.TemporaryDirectory() as directorio:
+        salida = os.path.join(directorio, "medidas.json")
+        subprocess.run([sys.executable, __file__, "--hijo", backend, salida, "--csv", argumentos.csv,
+                        "--filas", str(argumentos.filas), "--latencia", str(argumentos.latencia)],
+                       check=True)
+        with open(salida, 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+
+def comparar(referencia, medidas, etiquetas):
+    """Exactitud y deriva frente a la referencia (torch)"""
+    aciertos = cambios = 0
+    diferencias = []
+    for prob_ref, prob, etiqueta in zip(referencia["prob_arrufo"], medidas["prob_arrufo"], etiquetas):
+        if prob is None:
+            continue
+        clase = "arrufo" if prob > 0.5 else "puntual"
+        aciertos += clase == etiqueta
+        if prob_ref is not None:
+            diferencias.append(abs(prob - prob_ref))
+            cambios += clase != ("arrufo" if prob_ref > 0.5 else "puntual")
+    return {
+        "exactitud": aciertos / len(etiquetas) if etiquetas else 0.0,
+        "deriva_media": statistics.fmean(diferencias) if diferencias else 0.0,
+        "deriva_maxima": max(diferencias, default=0.0),
+        "cambios_de_clase": cambios,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Paridad y rendimiento de los backends torch/ONNX")
+    parser.add_argument("--hijo", nargs=2, metavar=("BACKEND", "SALIDA"), help=argparse.SUPPRESS)
+    parser.add_argument("--csv", default=ARCHIVO_CSV)
+    parser.add_argument("--filas", type=int, default=0, help="0 = todo el archivo")
+    parser.add_argument("--latencia", type=int, default=200, help="descripciones para medir latencia")
+    parser.add_argument("--backends", nargs="+", choices=list(BACKENDS), default=list(BACKENDS))
+    argumentos = parser.parse_args()
+
+    if argumentos.hijo:
+        medir_backend(argumentos.hijo[0], argumentos.csv, argumentos.filas, argumentos.latencia,
+                      argumentos.hijo[1])
+        sys.exit(0)
+
+    etiquetas = [etiqueta for etiqueta, _ in leer_csv_fisuras(argumentos.csv)][:argumentos.filas or None]
+    todas = {backend: medir(backend, argumentos) for backend in argumentos.backends}
+    referencia = todas.get("torch") or next(iter(todas.values()))
+
+    print(f"{'backend':>10} {'exactitud':>10} {'deriva media':>13} {'deriva máx.':>12} {'cambios':>8} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'filas/s':>9} {'carga s':>8} {'RSS modelo MB':>14} {'RSS máx. MB':>12}")
+    for backend, medidas in todas.items():
+        paridad = comparar(referencia, medidas, etiquetas)
+        rss_modelo = medidas["rss_cargado_mb"]
+        rss_maximo = medidas["rss_maximo_mb"]
+        print(f"{backend:>10} {paridad['exactitud']:>10.4f} {paridad['deriva_media']:>13.5f} "
+              f"{paridad['deriva_maxima']:>12.5f} {paridad['cambios_de_clase']:>8} "
+              f"{medidas['latencia_p50_ms']:>8.2f} {medidas['latencia_p95_ms']:>8.2f} "
+              f"{medidas['filas_por_segundo']:>9.1f} {medidas['carga_s']:>8.2f} "
+              f"{rss_modelo if rss_modelo is not None else float('nan'):>14.1f} "
+              f"{rss_maximo if rss_maximo is not None else float('nan'):>12.1f}")
@@ -0,0 +1,339 @@
+# registro_eventos.py
+# Registro de eventos del sistema en formato JSONL (una línea por evento).
+# Cada evento se agrega al final del segmento activo sin releer ni reescribir
+# el historial; cuando el segmento supera TAMANO_MAXIMO_SEGMENTO se rota.
+#
+# Cada proceso (login, análisis, panel) encola sus eventos en un hilo escritor
+# que los escribe en grupo bajo un bloqueo de archivo compartido entre procesos.
+import atexit
+import json
+import os
+import queue
+import re
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+import vigilancia_logs
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+# Archivo JSON original (arreglo completo); se sigue leyendo como fuente legada
+ARCHIVO_LEGADO = "sistema_logs.json"
+
+# Segmento activo donde se agregan los eventos nuevos
+ARCHIVO_EVENTOS = "sistema_logs.jsonl"
+
+# Tamaño a partir del cual el segmento activo se rota (bytes)
+TAMANO_MAXIMO_SEGMENTO = 5 * 1024 * 1024
+
+# Backend de almacenamiento: "jsonl" (por defecto) o "sqlite"
+BACKEND = os.environ.get("SISTEMA_LOGS_BACKEND", "jsonl").lower()
+
+# Máximo de eventos por escritura en grupo y espera para juntar un grupo (s)
+TAMANO_MAXIMO_GRUPO = 500
+ESPERA_GRUPO = 0.05
+
+
+def crear_evento(usuario, tipo_evento, detalles=""):
+    """Crea el diccionario de un evento con fecha, hora y timestamp"""
+    ahora = datetime.now()
+    return {
+        "usuario": usuario,
+        "tipo": tipo_evento,
+        "detalles": detalles,
+        "fecha": ahora.strftime("%Y-%m-%d"),
+        "hora": ahora.strftime("%H:%M:%S"),
+        "timestamp": ahora.isoformat()
+    }
+
+
+def crear_busqueda(usuario, descripcion, resultado, prob_arrufo, prob_puntual, version_modelo=None):
+    """Crea un evento de búsqueda con sus campos tipados"""
+    evento = crear_evento(usuario, "busqueda")
+    evento.update({
+        "descripcion": descripcion,
+        "resultado": resultado,
+        "prob_arrufo": float(prob_arrufo) if prob_arrufo is not None else None,
+        "prob_puntual": float(prob_puntual) if prob_puntual is not None else None,
+        "version_modelo": version_modelo,
+    })
+    return evento
+
+
+def _porcentaje_a_float(valor):
+    """Convierte '85.00%' en 0.85; devuelve None si no es un porcentaje"""
+    try:
+        return float(str(valor).strip().rstrip('%')) / 100
+    except ValueError:
+        return None
+
+
+def normalizar_busqueda(evento):
+    """Convierte una búsqueda con detalles JSON (formato anterior) a campos tipados"""
+    if evento.get('tipo') != 'busqueda' or 'resultado' in evento:
+        return evento
+    try:
+        detalles = json.loads(evento.get('detalles') or '{}')
+    except (TypeError, ValueError):
+        detalles = {}
+
+    resultado = detalles.get('resultado', 'desconocido')
+    probabilidad = _porcentaje_a_float(detalles.get('probabilidad', 'N/A'))
+    # El formato anterior solo guardaba la probabilidad de la clase elegida;
+    # con dos clases la otra es su complemento
+    prob_arrufo = prob_puntual = None
+    if probabilidad is not None:
+        if resultado == 'arrufo':
+            prob_arrufo, prob_puntual = probabilidad, 1 - probabilidad
+        elif resultado == 'puntual':
+            prob_arrufo, prob_puntual = 1 - probabilidad, probabilidad
+
+    convertido = dict(evento)
+    convertido.update({
+        "detalles": "",
+        "descripcion": detalles.get('descripcion', 'N/A'),
+        "resultado": resultado,
+        "prob_arrufo": prob_arrufo,
+        "prob_puntual": prob_puntual,
+        "version_modelo": None,
+    })
+    return convertido
+
+
+def probabilidad_busqueda(evento):
+    """Probabilidad de la clase resultante de una búsqueda, o None"""
+    if evento.get('resultado') == 'arrufo':
+        return evento.get('prob_arrufo')
+    if evento.get('resultado') == 'puntual':
+        return evento.get('prob_puntual')
+    return None
+
+
+def serializar_eventos(eventos):
+    """Convierte una lista de eventos en líneas JSONL"""
+    return "".join(json.dumps(evento, ensure_ascii=False) + "\n" for evento in eventos)
+
+
+def ruta_segmento(numero, archivo=ARCHIVO_EVENTOS):
+    """Devuelve la ruta del segmento rotado con el número indicado"""
+    base, extension = os.path.splitext(archivo)
+    return f"{base}.{numero:06d}{extension}"
+
+
+def segmentos_rotados(archivo=ARCHIVO_EVENTOS):
+    """Lista los segmentos rotados en orden cronológico"""
+    directorio = os.path.dirname(archivo) or "."
+    base, extension = os.path.splitext(os.path.basename(archivo))
+    patron = re.compile(re.escape(base) + r"\.(\d{6})" + re.escape(extension) + "$")
+
+    segmentos = []
+    try:
+        nombres = os.listdir(directorio)
+    except FileNotFoundError:
+        return []
+    for nombre in nombres:
+        coincidencia = patron.match(nombre)
+        if coincidencia:
+            segmentos.append((int(coincidencia.group(1)), os.path.join(directorio, nombre)))
+    segmentos.sort()
+    return [ruta for _, ruta in segmentos]
+
+
+def rotar_segmento(archivo=ARCHIVO_EVENTOS):
+    """Renombra el segmento activo como el siguiente segmento rotado"""
+    if not os.path.exists(archivo):
+        return None
+    rotados = segmentos_rotados(archivo)
+    if rotados:
+        ultimo = os.path.basename(rotados[-1])
+        numero = int(ultimo.rsplit(".", 2)[-2]) + 1
+    else:
+        numero = 1
+    destino = ruta_segmento(numero, archivo)
+    os.replace(archivo, destino)
+    return destino
+
+
+def rotar_si_necesario(archivo=ARCHIVO_EVENTOS, tamano_maximo=None):
+    """Rota el segmento activo si ya superó el tamaño máximo"""
+    if tamano_maximo is None:
+        tamano_maximo = TAMANO_MAXIMO_SEGMENTO
+    try:
+        if os.path.getsize(archivo) >= tamano_maximo:
+            return rotar_segmento(archivo)
+    except FileNotFoundError:
+        pass
+    return None
+
+
+@contextmanager
+def bloqueo_archivo(archivo=ARCHIVO_EVENTOS):
+    """Bloqueo exclusivo entre procesos sobre <archivo>.lock"""
+    with open(archivo + ".lock", 'a+b') as candado:
+        if fcntl:
+            fcntl.flock(candado.fileno(), fcntl.LOCK_EX)
+        else:
+            candado.seek(0)
+            msvcrt.locking(candado.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(candado.fileno(), fcntl.LOCK_UN)
+            else:
+                candado.seek(0)
+                msvcrt.locking(candado.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def escribir_eventos(eventos, archivo=ARCHIVO_EVENTOS):
+    """Agrega eventos al final del segmento activo en una sola escritura"""
+    if not eventos:
+        return
+    if BACKEND == "sqlite":
+        import almacen_sqlite
+        almacen_sqlite.insertar_eventos(eventos)
+    else:
+        datos = serializar_eventos(eventos).encode('utf-8')
+        # La rotación y la escritura ocurren bajo el mismo bloqueo para que
+        # ningún proceso escriba en un segmento que otro acaba de renombrar
+        with bloqueo_archivo(archivo):
+            rotar_si_necesario(archivo)
+            with open(archivo, 'ab') as f:
+                f.write(datos)
+                f.flush()
+    # Un aviso por grupo escrito, no por evento
+    vigilancia_logs.notificar_cambio()
+
+
+class EscritorEventos:
+    """Hilo que junta los eventos encolados y los escribe en grupo"""
+
+    def __init__(self, archivo=ARCHIVO_EVENTOS):
+        self.archivo = archivo
+        self.cola = queue.Queue()
+        self.hilo = threading.Thread(target=self._ejecutar, name="escritor-eventos", daemon=True)
+        self.hilo.start()
+
+    def encolar(self, evento):
+        self.cola.put(evento)
+
+    def vaciar(self, timeout=None):
+        """Espera a que todos los eventos encolados estén escritos"""
+        listo = threading.Event()
+        self.cola.put(listo)
+        return listo.wait(timeout)
+
+    def _ejecutar(self):
+        while True:
+            grupo = []
+            avisos = []
+            elemento = self.cola.get()
+            try:
+                # Tras el primer evento se espera un momento para juntar más
+                while True:
+                    if isinstance(elemento, threading.Event):
+                        avisos.append(elemento)
+                    else:
+                        grupo.append(elemento)
+                    if len(grupo) >= TAMANO_MAXIMO_GRUPO:
+                        break
+                    try:
+                        elemento = self.cola.get(timeout=ESPERA_GRUPO if grupo and not avisos else 0)
+                    except queue.Empty:
+                        break
+                escribir_eventos(grupo, self.archivo)
+            except Exception as e:
+                print(f"Error al escribir eventos: {e}")
+            finally:
+                for aviso in avisos:
+                    aviso.set()
+
+
+_escritor = None
+_candado_escritor = threading.Lock()
+
+
+def obtener_escritor():
+    """Devuelve el escritor de eventos del proceso, creándolo si hace falta"""
+    global _escritor
+    with _candado_escritor:
+        if _escritor is None:
+            _escritor = EscritorEventos()
+            atexit.register(vaciar, 5)
+        return _escritor
+
+
+def vaciar(timeout=None):
+    """Escribe los eventos pendientes del proceso antes de continuar"""
+    if _escritor is not None:
+        return _escritor.vaciar(timeout)
+    return True
+
+
+def registrar_evento(usuario, tipo_evento, detalles="", archivo=ARCHIVO_EVENTOS):
+    """Registra un evento del sistema; la escritura ocurre en segundo plano"""
+    return encolar_evento(crear_evento(usuario, tipo_evento, detalles), archivo)
+
+
+def registrar_busqueda(usuario, descripcion, resultado, probabilidades, version_modelo=None,
+                       archivo=ARCHIVO_EVENTOS):
+    """Registra una búsqueda con la clase y las probabilidades de ambas clases"""
+    probabilidades = probabilidades or {}
+    evento = crear_busqueda(usuario, descripcion, resultado, probabilidades.get('arrufo'),
+                            probabilidades.get('puntual'), version_modelo)
+    return encolar_evento(evento, archivo)
+
+
+def encolar_evento(evento, archivo=ARCHIVO_EVENTOS):
+    """Entrega un evento ya creado al escritor en segundo plano"""
+    if archivo == ARCHIVO_EVENTOS:
+        obtener_escritor().encolar(evento)
+    else:
+        escribir_eventos([evento], archivo)
+    return evento
+
+
+def leer_legado(archivo_legado=ARCHIVO_LEGADO):
+    """Lee los eventos del archivo JSON original si existe"""
+    if not archivo_legado or not os.path.exists(archivo_legado):
+        return []
+    try:
+        with open(archivo_legado, 'r', encoding='utf-8') as f:
+            logs = json.load(f)
+        return [normalizar_busqueda(evento) for evento in logs] if isinstance(logs, list) else []
+    except Exception as e:
+        print(f"Error al leer log legado: {e}")
+        return []
+
+
+def leer_segmento(ruta):
+    """Lee los eventos de un segmento JSONL, ignorando líneas incompletas"""
+    try:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            for linea in f:
+                linea = linea.strip()
+                if not linea:
+                    continue
+                try:
+                    evento = json.loads(linea)
+                except json.JSONDecodeError:
+                    # Línea truncada por una escritura interrumpida
+                    continue
+                yield normalizar_busqueda(evento)
+    except FileNotFoundError:
+        return
+
+
+def leer_eventos(archivo=ARCHIVO_EVENTOS, archivo_legado=ARCHIVO_LEGADO):
+    """Recorre todos los eventos: archivo compactado, legado, segmentos rotados y activo"""
+    import retencion_logs
+    yield from retencion_logs.leer_archivo()
+    yield from leer_legado(archivo_legado)
+    for ruta in segmentos_rotados(archivo):
+        yield from leer_segmento(ruta)
+    yield from leer_segmento(archivo)
@@ -0,0 +1,73 @@
+# reporte_cascada.py
+# Evalúa la cascada modelo rápido -> transformer sobre la partición de
+# prueba de fisuras_base_limpia.csv (la misma que deja afuera
+# modelo_rapido.py al entrenar y calibrar). Escala igual que la interfaz:
+# por debajo del umbral efectivo (el calibrado, y nunca menos que
+# CONFIANZA_MINIMA).
+#
+# Cada descripción se clasifica de a una, como en la interfaz, con los dos
+# modelos. La latencia de la cascada es la del modelo rápido más la del
+# transformer cuando la confianza no alcanza el umbral. Informa la tasa de
+# escalamiento, la latencia de punta a punta (media, p50 y p95) y la
+# exactitud de la cascada frente al transformer solo.
+#
+# Uso: python reporte_cascada.py [--csv RUTA] [--modelo-rapido RUTA] [--umbral U]
+import argparse
+import statistics
+import time
+
+from modelo_fisuras import ClasificadorFisuras
+from modelo_rapido import ARCHIVO_CSV, ARCHIVO_MODELO, ModeloRapido, leer_particiones
+
+
+def resumen_latencias(latencias):
+    cuantiles = statistics.quantiles(latencias, n=20)
+    return statistics.fmean(latencias), statistics.median(latencias), cuantiles[18]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Tasa de escalamiento, latencia y exactitud de la cascada")
+    parser.add_argument("--csv", default=ARCHIVO_CSV)
+    parser.add_argument("--modelo-rapido", default=ARCHIVO_MODELO)
+    parser.add_argument("--umbral", type=float, help="reemplaza el umbral calibrado")
+    argumentos = parser.parse_args()
+
+    _, _, prueba = leer_particiones(argumentos.csv)
+    rapido = ModeloRapido.cargar(argumentos.modelo_rapido)
+    if argumentos.umbral is not None:
+        rapido.umbral = argumentos.umbral
+    transformer = ClasificadorFisuras()
+    if not transformer.calentar():
+        raise SystemExit(transformer.error)
+
+    aciertos_transformer = aciertos_cascada = escaladas = 0
+    latencias_transformer, latencias_cascada = [], []
+    for etiqueta, texto in prueba:
+        t0 = time.perf_counter()
+        resultado_rapido = rapido.clasificar(texto)
+        tiempo_rapido = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        resultado_transformer = transformer.clasificar(texto)
+        tiempo_transformer = time.perf_counter() - t0
+
+        escala = resultado_rapido[1] < rapido.umbral_efectivo
+        escaladas += escala
+        resultado_cascada = resultado_transformer if escala else resultado_rapido
+        aciertos_transformer += resultado_transformer[0] == etiqueta
+        aciertos_cascada += resultado_cascada[0] == etiqueta
+        latencias_transformer.append(tiempo_transformer * 1000)
+        latencias_cascada.append((tiempo_rapido + (tiempo_transformer if escala else 0.0)) * 1000)
+
+    total = len(prueba)
+    exactitud_transformer = aciertos_transformer / total
+    exactitud_cascada = aciertos_cascada / total
+    print(f"Partición de prueba: {total} descripciones, umbral efectivo {rapido.umbral_efectivo:.4f}")
+    print(f"Escaladas al transformer: {escaladas} ({escaladas / total:.1%})")
+    print(f"{'camino':>12} {'exactitud':>10} {'media ms':>9} {'p50 ms':>8} {'p95 ms':>8}")
+    for nombre, exactitud, latencias in (("transformer", exactitud_transformer, latencias_transformer),
+                                         ("cascada", exactitud_cascada, latencias_cascada)):
+        media, p50, p95 = resumen_latencias(latencias)
+        print(f"{nombre:>12} {exactitud:>10.4f} {media:>9.2f} {p50:>8.2f} {p95:>8.2f}")
+    print(f"Diferencia de exactitud (cascada - transformer): {exactitud_cascada - exactitud_transformer:+.4f}")
+    print(f"Aceleración media: {statistics.fmean(latencias_transformer) / statistics.fmean(latencias_cascada):.1f}x")
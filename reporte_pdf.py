@@ -0,0 +1,606 @@
+# reporte_pdf.py
+# Generación del reporte PDF del panel de administrador en un proceso aparte.
+#
+# El panel lanza un TrabajoReporte y sigue respondiendo; el proceso envía su
+# avance por una cola y revisa un evento de cancelación entre etapas.
+#
+# Todo el estado del reporte es incremental: los contadores salen de
+# AgregadosLogs y las filas del apéndice se agregan a ARCHIVO_APENDICE, ambos
+# guardados con la posición del log que cubren, así que cada reporte solo lee
+# los eventos nuevos. El apéndice se vuelca al PDF página por página sin
+# tenerlo completo en memoria. Al terminar se guarda una instantánea de los
+# contadores y del apéndice en ARCHIVO_REPORTES; un reporte "solo cambios"
+# es la diferencia contra esa instantánea.
+import json
+import multiprocessing
+import os
+import queue
+import time
+from collections import Counter
+from datetime import datetime
+
+import consultas_logs
+import registro_eventos
+from agregados_logs import AgregadosLogs, ContadoresLogs
+from modelo_logs import crear_cursor
+
+try:
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
+    from reportlab.lib.units import inch
+    from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak, Flowable
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER
+except ImportError:
+    colors = None
+    Flowable = object
+
+# Búsquedas ya formateadas para el apéndice, agregadas de forma incremental
+ARCHIVO_APENDICE = "sistema_logs.apendice.jsonl"
+
+# Contadores y posición del apéndice del último reporte generado
+ARCHIVO_REPORTES = "sistema_logs.reportes.json"
+
+# Intervalo mínimo entre mensajes de progreso (s)
+INTERVALO_PROGRESO = 0.2
+
+# Alto de cada fila del apéndice y de su encabezado (puntos)
+ALTO_FILA_APENDICE = 12
+ALTO_ENCABEZADO_APENDICE = 16
+
+
+class Cancelado(Exception):
+    """El administrador canceló el reporte"""
+
+
+class Progreso:
+    """Envía el avance a la cola sin saturarla"""
+
+    def __init__(self, cola, cancelar):
+        self.cola = cola
+        self.cancelar = cancelar
+        self.ultimo = 0.0
+
+    def __call__(self, fraccion, texto, forzar=False):
+        if self.cancelar.is_set():
+            raise Cancelado()
+        ahora = time.monotonic()
+        if forzar or ahora - self.ultimo >= INTERVALO_PROGRESO:
+            self.ultimo = ahora
+            self.cola.put(("progreso", fraccion, texto))
+
+
+def datos_reporte(contadores, desde=None, series=None):
+    """Contadores, actividad diaria y últimas búsquedas del reporte (desde: solo lo posterior)"""
+    return {
+        "actividad": series.serie('dia', ultimos=30, desde=desde) if series else [],
+        "total_accesos": contadores.total_accesos,
+        "total_busquedas": contadores.total_busquedas,
+        "accesos_por_usuario": Counter(contadores.accesos_por_usuario),
+        "busquedas_por_usuario": Counter(contadores.busquedas_por_usuario),
+        "resultados": Counter(contadores.resultados),
+        "confianza_media": {tipo: contadores.confianza_promedio(tipo) for tipo in contadores.resultados},
+        # Últimas 10 búsquedas recorriendo el log desde el final
+        "ultimas_busquedas": list(reversed(consultas_logs.consultar(tipos=['busqueda'], desde=desde, limite=10))),
+    }
+
+
+def _leer_json(ruta):
+    try:
+        with open(ruta, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Error al leer {ruta}: {e}")
+        return None
+
+
+def _guardar_json(ruta, datos):
+    temporal = f"{ruta}.{os.getpid()}.tmp"
+    with open(temporal, 'w', encoding='utf-8') as f:
+        json.dump(datos, f, ensure_ascii=False)
+    os.replace(temporal, ruta)
+
+
+def _fila_apendice(busqueda):
+    probabilidad = registro_eventos.probabilidad_busqueda(busqueda)
+    return [
+        busqueda.get('usuario', ''),
+        f"{busqueda.get('fecha', '')} {busqueda.get('hora', '')}",
+        (busqueda.get('resultado') or 'N/A').upper(),
+        f"{probabilidad:.1%}" if probabilidad is not None else "N/A",
+        busqueda.get('descripcion') or 'N/A',
+    ]
+
+
+def actualizar_apendice(total_busquedas, progreso, ruta=ARCHIVO_APENDICE):
+    """Agrega al archivo del apéndice las búsquedas nuevas
+
+    Devuelve {"filas", "offset", "generacion"}: cantidad de filas, tamaño en
+    bytes y un número que cambia cada vez que el archivo se rehace desde cero.
+    """
+    ruta_estado = os.path.splitext(ruta)[0] + ".json"
+    with registro_eventos.bloqueo_archivo(ruta):
+        estado = _leer_json(ruta_estado) or {}
+        cursor = crear_cursor(incluir_archivo=True)
+        if estado.get("backend") == registro_eventos.BACKEND and os.path.exists(ruta):
+            cursor.restaurar(estado["posicion"])
+        nuevos, recargado = cursor.leer_nuevos()
+        if recargado:
+            estado = {"filas": 0, "generacion": estado.get("generacion", 0) + 1}
+        
+        filas = estado["filas"]
+        with open(ruta, 'w' if recargado else 'a', encoding='utf-8') as f:
+            for evento in nuevos:
+                if evento.get('tipo') != 'busqueda':
+                    continue
+                f.write(json.dumps(_fila_apendice(evento), ensure_ascii=False) + "\n")
+                filas += 1
+                if filas % 1000 == 0:
+                    progreso(0.5 * filas / max(total_busquedas, 1), f"Leyendo búsquedas ({filas})")
+            offset = f.tell()
+        
+        estado.update(filas=filas, offset=offset, backend=registro_eventos.BACKEND,
+                      posicion=cursor.estado())
+        _guardar_json(ruta_estado, estado)
+    return {"filas": filas, "offset": offset, "generacion": estado["generacion"]}
+
+
+def _offset_de_fila(ruta, fila):
+    """Offset en bytes del inicio de una fila del apéndice"""
+    with open(ruta, 'rb') as f:
+        for _ in range(fila):
+            if not f.readline():
+                break
+        return f.tell()
+
+
+def _dibujar_filas(canvas, filas, numero, ancho):
+    """Dibuja una página del apéndice a partir de la fila `numero`"""
+    columnas = [0, 30, 120, 210, 270, 320]
+    canvas.setFont('Helvetica-Bold', 8)
+    y = -ALTO_ENCABEZADO_APENDICE + 4
+    for x, titulo in zip(columnas, ('#', 'Usuario', 'Fecha/Hora', 'Resultado', 'Prob.', 'Descripción')):
+        canvas.drawString(x, y, titulo)
+    canvas.setFont('Helvetica', 7)
+    # Caracteres de descripción que entran en el ancho restante
+    maximo = max(10, int((ancho - columnas[-1]) / 3.4))
+    for desplazamiento, fila in enumerate(filas):
+        y = -ALTO_ENCABEZADO_APENDICE - (desplazamiento + 1) * ALTO_FILA_APENDICE + 3
+        usuario, fecha_hora, resultado, probabilidad, descripcion = fila
+        if len(descripcion) > maximo:
+            descripcion = descripcion[:maximo - 3] + "..."
+        valores = (str(numero + desplazamiento), usuario[:18], fecha_hora, resultado, probabilidad, descripcion)
+        for x, valor in zip(columnas, valores):
+            canvas.drawString(x, y, valor)
+
+
+class PaginaApendice(Flowable):
+    """Una página ya leída del apéndice"""
+
+    def __init__(self, filas, numero):
+        Flowable.__init__(self)
+        self.filas = filas
+        self.numero = numero
+
+    def wrap(self, ancho, alto):
+        self.ancho = ancho
+        return ancho, ALTO_ENCABEZADO_APENDICE + len(self.filas) * ALTO_FILA_APENDICE
+
+    def draw(self):
+        # El origen de draw() es la esquina inferior; se dibuja desde arriba
+        self.canv.translate(0, ALTO_ENCABEZADO_APENDICE + len(self.filas) * ALTO_FILA_APENDICE)
+        _dibujar_filas(self.canv, self.filas, self.numero, self.ancho)
+
+
+class ApendiceBusquedas(Flowable):
+    """Resto del apéndice: al partirse lee del archivo del apéndice solo las filas de una página"""
+
+    def __init__(self, ruta, offset, restantes, numero, total, progreso):
+        Flowable.__init__(self)
+        self.ruta = ruta
+        self.offset = offset
+        self.restantes = restantes
+        self.numero = numero
+        self.total = total
+        self.progreso = progreso
+
+    def _leer(self, cantidad):
+        with open(self.ruta, 'r', encoding='utf-8') as f:
+            f.seek(self.offset)
+            filas = []
+            for _ in range(cantidad):
+                linea = f.readline()
+                if not linea:
+                    break
+                filas.append(json.loads(linea))
+            return filas, f.tell()
+
+    def wrap(self, ancho, alto):
+        self.ancho = ancho
+        return ancho, ALTO_ENCABEZADO_APENDICE + self.restantes * ALTO_FILA_APENDICE
+
+    def split(self, ancho, alto):
+        cantidad = int((alto - ALTO_ENCABEZADO_APENDICE) // ALTO_FILA_APENDICE)
+        if cantidad <= 0:
+            return []
+        escritas = self.total - self.restantes
+        self.progreso(0.5 + 0.5 * escritas / max(self.total, 1),
+                      f"Escribiendo apéndice ({escritas}/{self.total})")
+        filas, offset = self._leer(cantidad)
+        resto = ApendiceBusquedas(self.ruta, offset, self.restantes - len(filas),
+                                  self.numero + len(filas), self.total, self.progreso)
+        return [PaginaApendice(filas, self.numero), resto]
+
+    def draw(self):
+        # Solo se dibuja entero cuando lo que queda entra en una página
+        filas, _ = self._leer(self.restantes)
+        self.canv.translate(0, ALTO_ENCABEZADO_APENDICE + len(filas) * ALTO_FILA_APENDICE)
+        _dibujar_filas(self.canv, filas, self.numero, self.ancho)
+
+
+def construir_historia(datos, apendice=None, periodo=None):
+    """Flowables del reporte a partir de los datos agregados
+
+    periodo: fecha del reporte anterior cuando el reporte es solo de cambios.
+    """
+    total_accesos_reporte = datos["total_accesos"]
+    total_busquedas_reporte = datos["total_busquedas"]
+    accesos_por_usuario = datos["accesos_por_usuario"]
+    busquedas_por_usuario = datos["busquedas_por_usuario"]
+    contador_resultados = datos["resultados"]
+    confianza_media = datos["confianza_media"]
+    ultimas_busquedas = datos["ultimas_busquedas"]
+    
+    usuarios_unicos = set(accesos_por_usuario)
+    total_resultados = sum(contador_resultados.values())
+
+    story = []
+    styles = getSampleStyleSheet()
+
+    # Estilos personalizados
+    titulo_style = ParagraphStyle(
+        'CustomTitle',
+        parent=styles['Heading1'],
+        fontSize=24,
+        textColor=colors.HexColor('#1E40AF'),
+        spaceAfter=30,
+        alignment=TA_CENTER,
+        fontName='Helvetica-Bold'
+    )
+
+    subtitulo_style = ParagraphStyle(
+        'CustomSubtitle',
+        parent=styles['Heading2'],
+        fontSize=16,
+        textColor=colors.HexColor('#1E40AF'),
+        spaceAfter=12,
+        spaceBefore=12,
+        fontName='Helvetica-Bold'
+    )
+
+    fecha_style = ParagraphStyle(
+        'DateStyle',
+        parent=styles['Normal'],
+        fontSize=10,
+        textColor=colors.gray,
+        alignment=TA_CENTER,
+        spaceAfter=20
+    )
+
+    # Título
+    titulo = Paragraph("REPORTE DEL SISTEMA DE ANÁLISIS DE FISURAS", titulo_style)
+    story.append(titulo)
+
+    # Fecha
+    fecha_reporte = datetime.now().strftime("%d de %B de %Y - %H:%M:%S")
+    fecha_texto = Paragraph(f"Generado el: {fecha_reporte}", fecha_style)
+    story.append(fecha_texto)
+    if periodo:
+        story.append(Paragraph(f"<b>Solo cambios desde el reporte del {periodo}</b>", fecha_style))
+    if datos.get("aviso"):
+        story.append(Paragraph(f"<b>{datos['aviso']}</b>", fecha_style))
+    story.append(Spacer(1, 0.3*inch))
+
+    # ESTADÍSTICAS GENERALES
+    story.append(Paragraph("📊 ESTADÍSTICAS GENERALES", subtitulo_style))
+
+    data_stats = [
+        ['Métrica', 'Valor'],
+        ['Total de Accesos al Sistema', str(total_accesos_reporte)],
+        ['Total de Búsquedas Realizadas', str(total_busquedas_reporte)],
+        ['Usuarios Activos', str(len(usuarios_unicos))]
+    ]
+
+    tabla_stats = Table(data_stats, colWidths=[4*inch, 2*inch])
+    tabla_stats.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#3B82F6')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'LEFT'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 10),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F3F4F6')])
+    ]))
+    story.append(tabla_stats)
+    story.append(Spacer(1, 0.3*inch))
+
+    # ACTIVIDAD POR USUARIO
+    story.append(Paragraph("👥 ACTIVIDAD POR USUARIO", subtitulo_style))
+
+    data_usuarios = [['Usuario', 'Accesos', 'Búsquedas']]
+    for usuario in sorted(usuarios_unicos):
+        num_accesos = accesos_por_usuario.get(usuario, 0)
+        num_busquedas = busquedas_por_usuario.get(usuario, 0)
+        data_usuarios.append([usuario, str(num_accesos), str(num_busquedas)])
+
+    tabla_usuarios = Table(data_usuarios, colWidths=[3*inch, 1.5*inch, 1.5*inch])
+    tabla_usuarios.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#10B981')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 10),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F3F4F6')])
+    ]))
+    story.append(tabla_usuarios)
+    story.append(Spacer(1, 0.3*inch))
+
+    # ANÁLISIS DE RESULTADOS
+    story.append(Paragraph("🔍 ANÁLISIS DE RESULTADOS", subtitulo_style))
+    story.append(Paragraph("Distribución de Clasificaciones:", styles['Normal']))
+    story.append(Spacer(1, 0.1*inch))
+
+    data_resultados = [['Tipo', 'Cantidad', 'Porcentaje', 'Confianza Media']]
+    for tipo, cantidad in contador_resultados.most_common():
+        porcentaje = (cantidad / total_resultados * 100) if total_resultados else 0
+        confianza = confianza_media.get(tipo)
+        data_resultados.append([
+            tipo.upper(),
+            str(cantidad),
+            f"{porcentaje:.1f}%",
+            f"{confianza:.1%}" if confianza is not None else "N/A"
+        ])
+
+    tabla_resultados = Table(data_resultados, colWidths=[2*inch, 1.2*inch, 1.3*inch, 1.5*inch])
+    tabla_resultados.setStyle(TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#F59E0B')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('FONTSIZE', (0, 0), (-1, 0), 12),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('GRID', (0, 0), (-1, -1), 1, colors.black),
+        ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+        ('FONTSIZE', (0, 1), (-1, -1), 10),
+        ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F3F4F6')])
+    ]))
+    story.append(tabla_resultados)
+    story.append(Spacer(1, 0.3*inch))
+    
+    # ACTIVIDAD DIARIA (desde los intervalos preagregados, solo días con actividad)
+    actividad = [(dia, conteos) for dia, conteos in datos["actividad"] if conteos]
+    if actividad:
+        story.append(Paragraph("📈 ACTIVIDAD DIARIA", subtitulo_style))
+        data_actividad = [['Día', 'Accesos', 'Fallidos', 'Búsquedas', 'Arrufo', 'Puntual']]
+        for dia, conteos in actividad:
+            data_actividad.append([dia] + [str(conteos.get(metrica, 0)) for metrica in
+                                           ('accesos', 'fallidos', 'busquedas', 'arrufo', 'puntual')])
+        tabla_actividad = Table(data_actividad, colWidths=[1.4*inch] + [0.95*inch] * 5, repeatRows=1)
+        tabla_actividad.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#0EA5E9')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 11),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 10),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F3F4F6')])
+        ]))
+        story.append(tabla_actividad)
+    story.append(PageBreak())
+
+    # ÚLTIMAS BÚSQUEDAS
+    story.append(Paragraph("📝 ÚLTIMAS BÚSQUEDAS REALIZADAS", subtitulo_style))
+    story.append(Spacer(1, 0.2*inch))
+
+    data_busquedas = [['#', 'Usuario', 'Fecha/Hora', 'Resultado']]
+    for i, busqueda in enumerate(ultimas_busquedas, 1):
+        try:
+            resultado = busqueda.get('resultado') or 'N/A'
+            fecha_hora = f"{busqueda['fecha']}\n{busqueda['hora']}"
+
+            data_busquedas.append([
+                str(i),
+                busqueda['usuario'],
+                fecha_hora,
+                resultado.upper()
+            ])
+        except:
+            pass
+
+    if len(data_busquedas) > 1:
+        tabla_busquedas = Table(data_busquedas, colWidths=[0.5*inch, 1.5*inch, 2*inch, 1.5*inch])
+        tabla_busquedas.setStyle(TableStyle([
+            ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#8B5CF6')),
+            ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+            ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+            ('VALIGN', (0, 0), (-1, -1), 'MIDDLE'),
+            ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+            ('FONTSIZE', (0, 0), (-1, 0), 12),
+            ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+            ('GRID', (0, 0), (-1, -1), 1, colors.black),
+            ('FONTNAME', (0, 1), (-1, -1), 'Helvetica'),
+            ('FONTSIZE', (0, 1), (-1, -1), 9),
+            ('ROWBACKGROUNDS', (0, 1), (-1, -1), [colors.white, colors.HexColor('#F3F4F6')])
+        ]))
+        story.append(tabla_busquedas)
+
+    # Detalles de búsquedas
+    story.append(Spacer(1, 0.3*inch))
+    story.append(Paragraph("Detalles de las Búsquedas:", styles['Heading3']))
+    story.append(Spacer(1, 0.1*inch))
+
+    for i, busqueda in enumerate(ultimas_busquedas, 1):
+        try:
+            descripcion = busqueda.get('descripcion') or 'N/A'
+            resultado = busqueda.get('resultado') or 'N/A'
+            probabilidad = registro_eventos.probabilidad_busqueda(busqueda)
+            probabilidad = f"{probabilidad:.2%}" if probabilidad is not None else "N/A"
+
+            texto = f"<b>{i}. {busqueda['usuario']}</b> - {busqueda['fecha']} {busqueda['hora']}<br/>"
+            texto += f"<i>Descripción:</i> {descripcion}<br/>"
+            texto += f"<i>Resultado:</i> {resultado.upper()} ({probabilidad})"
+
+            story.append(Paragraph(texto, styles['Normal']))
+            story.append(Spacer(1, 0.15*inch))
+        except:
+            pass
+
+    # Apéndice con todas las búsquedas (se arma página por página al construir el PDF)
+    if apendice is not None:
+        story.append(PageBreak())
+        titulo_apendice = "BÚSQUEDAS DESDE EL REPORTE ANTERIOR" if periodo else "TODAS LAS BÚSQUEDAS"
+        story.append(Paragraph(f"📚 APÉNDICE: {titulo_apendice}", subtitulo_style))
+        story.append(Spacer(1, 0.1*inch))
+        story.append(apendice)
+
+    # Pie de página
+    story.append(Spacer(1, 0.5*inch))
+    footer = Paragraph(
+        "━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━<br/>"
+        "<b>Sistema de Análisis de Fisuras</b> - Reporte Generado Automáticamente",
+        fecha_style
+    )
+    story.append(footer)
+    return story
+
+
+def ultimo_reporte(ruta=ARCHIVO_REPORTES):
+    """Instantánea del último reporte generado o None"""
+    return _leer_json(ruta)
+
+
+def generar_reporte(nombre_archivo, incluir_apendice, cola, cancelar, solo_cambios=False):
+    """Punto de entrada del proceso: genera el PDF e informa el resultado por la cola"""
+    if colors is None:
+        cola.put(("error", "Instala reportlab con 'pip install reportlab'"))
+        return
+    
+    progreso = Progreso(cola, cancelar)
+    temporal = nombre_archivo + ".tmp"
+    try:
+        progreso(0.0, "Calculando estadísticas", forzar=True)
+        generado = datetime.now()
+        agregados = AgregadosLogs()
+        agregados.actualizar()
+        # El apéndice se mantiene al día aunque este reporte no lo incluya,
+        # para que la instantánea guardada marque dónde empieza el próximo delta
+        apendice_estado = actualizar_apendice(agregados.total_busquedas, progreso)
+        
+        anterior = ultimo_reporte() if solo_cambios else None
+        aviso = None
+        if anterior is not None:
+            try:
+                contadores = agregados - ContadoresLogs(anterior["contadores"])
+            except ValueError as e:
+                # Retención o recálculo: no hay delta confiable, se informa todo
+                aviso = f"{e}; se muestra el reporte completo"
+                anterior = None
+        if anterior is not None:
+            datos = datos_reporte(contadores, desde=anterior["timestamp"], series=agregados.series)
+            periodo = datetime.fromisoformat(anterior["timestamp"]).strftime("%d/%m/%Y %H:%M:%S")
+            previo = anterior["apendice"]
+            numero = previo["filas"] + 1
+            if previo["generacion"] == apendice_estado["generacion"]:
+                offset = previo["offset"]
+            else:
+                # El apéndice se rehízo desde cero (compactación, migración)
+                offset = _offset_de_fila(ARCHIVO_APENDICE, previo["filas"])
+        else:
+            datos = datos_reporte(agregados, series=agregados.series)
+            datos["aviso"] = aviso
+            periodo = None
+            numero = 1
+            offset = 0
+        
+        apendice = None
+        if incluir_apendice:
+            restantes = max(0, apendice_estado["filas"] - (numero - 1))
+            apendice = ApendiceBusquedas(ARCHIVO_APENDICE, offset, restantes, numero, restantes, progreso)
+        
+        progreso(0.5 if incluir_apendice else 0.3, "Construyendo PDF", forzar=True)
+        doc = SimpleDocTemplate(temporal, pagesize=letter)
+        doc.build(construir_historia(datos, apendice, periodo))
+        os.replace(temporal, nombre_archivo)
+        
+        _guardar_json(ARCHIVO_REPORTES, {
+            "timestamp": generado.isoformat(),
+            "archivo": nombre_archivo,
+            "contadores": agregados.a_dict(),
+            "apendice": apendice_estado,
+        })
+        cola.put(("listo", nombre_archivo))
+    except Cancelado:
+        cola.put(("cancelado",))
+    except Exception as e:
+        cola.put(("error", str(e)))
+    finally:
+        if os.path.exists(temporal):
+            os.remove(temporal)
+
+
+class TrabajoReporte:
+    """Reporte PDF en curso en un proceso aparte"""
+
+    def __init__(self, nombre_archivo, incluir_apendice=False, solo_cambios=False):
+        # spawn: el proceso no hereda los hilos de la interfaz
+        contexto = multiprocessing.get_context("spawn")
+        self.nombre_archivo = nombre_archivo
+        self.cola = contexto.Queue()
+        self.cancelado = contexto.Event()
+        self.proceso = contexto.Process(
+            target=generar_reporte,
+            args=(nombre_archivo, incluir_apendice, self.cola, self.cancelado, solo_cambios),
+            name="reporte-pdf",
+            daemon=True,
+        )
+
+    def iniciar(self):
+        self.proceso.start()
+
+    def cancelar(self):
+        self.cancelado.set()
+
+    def mensajes(self, intervalo=0.2):
+        """Recorre los mensajes del proceso hasta el resultado final
+
+        Mensajes: ("progreso", fraccion, texto), ("listo", archivo),
+        ("cancelado",) o ("error", mensaje).
+        """
+        while True:
+            try:
+                mensaje = self.cola.get(timeout=intervalo)
+            except queue.Empty:
+                if self.proceso.is_alive():
+                    continue
+                try:
+                    mensaje = self.cola.get_nowait()
+                except queue.Empty:
+                    yield ("error", f"El proceso del reporte terminó con código {self.proceso.exitcode}")
+                    return
+            yield mensaje
+            if mensaje[0] != "progreso":
+                self.proceso.join(5)
+                return
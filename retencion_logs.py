@@ -0,0 +1,303 @@
+# retencion_logs.py
+# Retención y compactación del log de eventos.
+#
+# Los eventos se agrupan en particiones por mes (o por día). La partición
+# actual es la "caliente" y sigue en los segmentos JSONL; las particiones
+# anteriores se compactan en sistema_logs_archivo/<particion>.jsonl.gz
+# (o .jsonl.zst si está instalado zstandard). En los archivos compactados
+# los usuarios y tipos se guardan una sola vez en la cabecera y cada evento
+# los referencia por índice; fecha y hora se reconstruyen del timestamp.
+#
+# La compactación no cambia los eventos, solo dónde están: las posiciones de
+# lectura guardadas (agregados del panel y apéndice del reporte) se mueven al
+# segmento reescrito para que no relean todo el historial. La retención sí
+# elimina eventos, y los resta de los agregados guardados.
+#
+# Uso: python retencion_logs.py [--dia] [--retener N]
+import gzip
+import io
+import json
+import os
+import sys
+from datetime import datetime
+
+import registro_eventos
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+DIRECTORIO_ARCHIVO = "sistema_logs_archivo"
+
+# "mes" o "dia"
+GRANULARIDAD = os.environ.get("SISTEMA_LOGS_PARTICION", "mes")
+
+EXTENSIONES = (".jsonl.zst", ".jsonl.gz")
+
+
+def rutas_posiciones(archivo=registro_eventos.ARCHIVO_EVENTOS):
+    """Archivos JSON con una posición de lectura del log en la clave "posicion"
+
+    Son los de agregados_logs.ruta_agregados y el estado de reporte_pdf.ARCHIVO_APENDICE.
+    """
+    base = os.path.splitext(archivo)[0]
+    return [base + ".agregados.json", base + ".apendice.json"]
+
+
+def clave_particion(timestamp, granularidad=None):
+    """Devuelve la partición de un timestamp ISO: 'AAAA-MM' o 'AAAA-MM-DD'"""
+    granularidad = granularidad or GRANULARIDAD
+    return timestamp[:10] if granularidad == "dia" else timestamp[:7]
+
+
+def particion_actual(granularidad=None):
+    return clave_particion(datetime.now().isoformat(), granularidad)
+
+
+def inicio_particion(clave):
+    """Primer instante de una partición como datetime"""
+    return datetime.fromisoformat(clave if len(clave) == 10 else clave + "-01")
+
+
+def particiones(directorio=DIRECTORIO_ARCHIVO):
+    """Lista (clave, ruta) de las particiones archivadas en orden cronológico"""
+    try:
+        nombres = os.listdir(directorio)
+    except FileNotFoundError:
+        return []
+    encontradas = {}
+    for nombre in nombres:
+        for extension in EXTENSIONES:
+            if nombre.endswith(extension):
+                encontradas[nombre[:-len(extension)]] = os.path.join(directorio, nombre)
+    return sorted(encontradas.items())
+
+
+def _abrir_lectura(ruta):
+    if ruta.endswith(".zst"):
+        if zstandard is None:
+            raise RuntimeError(f"Se necesita 'pip install zstandard' para leer {ruta}")
+        lector = zstandard.ZstdDecompressor().stream_reader(open(ruta, 'rb'), closefd=True)
+        return io.TextIOWrapper(lector, encoding='utf-8')
+    return gzip.open(ruta, 'rt', encoding='utf-8')
+
+
+def _abrir_escritura(ruta):
+    if ruta.endswith(".zst"):
+        escritor = zstandard.ZstdCompressor(level=10).stream_writer(open(ruta, 'wb'), closefd=True)
+        return io.TextIOWrapper(escritor, encoding='utf-8')
+    return gzip.open(ruta, 'wt', encoding='utf-8', compresslevel=6)
+
+
+def leer_particion(ruta):
+    """Recorre en streaming los eventos de una partición compactada"""
+    with _abrir_lectura(ruta) as f:
+        cabecera = json.loads(f.readline())
+        usuarios = cabecera["usuarios"]
+        tipos = cabecera["tipos"]
+        for linea in f:
+            if not linea.strip():
+                continue
+            compacto = json.loads(linea)
+            timestamp = compacto["timestamp"]
+            evento = {
+                "usuario": usuarios[compacto.pop("u")],
+                "tipo": tipos[compacto.pop("t")],
+                "fecha": timestamp[:10],
+                "hora": timestamp[11:19],
+            }
+            evento.update(compacto)
+            yield evento
+
+
+def escribir_particion(ruta, eventos):
+    """Escribe una partición compactada con usuarios y tipos internados"""
+    usuarios = {}
+    tipos = {}
+    for evento in eventos:
+        usuarios.setdefault(evento.get("usuario"), len(usuarios))
+        tipos.setdefault(evento.get("tipo"), len(tipos))
+
+    temporal = ruta + ".tmp"
+    with _abrir_escritura(temporal) as f:
+        f.write(json.dumps({
+            "formato": "eventos-internados",
+            "version": 1,
+            "usuarios": list(usuarios),
+            "tipos": list(tipos),
+        }, ensure_ascii=False) + "\n")
+        for evento in eventos:
+            compacto = {"u": usuarios[evento.get("usuario")], "t": tipos[evento.get("tipo")]}
+            for campo, valor in evento.items():
+                if campo not in ("usuario", "tipo", "fecha", "hora"):
+                    compacto[campo] = valor
+            f.write(json.dumps(compacto, ensure_ascii=False) + "\n")
+    os.replace(temporal, ruta)
+
+
+def leer_archivo(desde=None, hasta=None, directorio=DIRECTORIO_ARCHIVO):
+    """Recorre los eventos archivados de las particiones entre desde y hasta (claves)"""
+    for clave, ruta in particiones(directorio):
+        if desde and clave < desde[:len(clave)]:
+            continue
+        if hasta and clave > hasta[:len(clave)]:
+            continue
+        yield from leer_particion(ruta)
+
+
+def _ruta_nueva(directorio, clave):
+    extension = EXTENSIONES[0] if zstandard is not None else EXTENSIONES[1]
+    return os.path.join(directorio, clave + extension)
+
+
+def _leer_posiciones(rutas, archivo):
+    """Posiciones guardadas y sus eventos sin leer: {ruta: (datos, cursor, pendientes)}
+
+    Quedan afuera las que igual se van a releer (otro backend, legado sin migrar
+    o una posición que ya no es válida).
+    """
+    from modelo_logs import CursorLogs
+
+    posiciones = {}
+    for ruta in rutas:
+        try:
+            with open(ruta, 'r', encoding='utf-8') as f:
+                datos = json.load(f)
+            if datos.get("backend", "jsonl") != "jsonl" or "posicion" not in datos:
+                continue
+            cursor = CursorLogs(archivo)
+            cursor.restaurar(datos["posicion"])
+            if cursor.legado is not None:
+                continue
+            pendientes = cursor.pendientes()
+            if pendientes is not None:
+                posiciones[ruta] = (datos, cursor, pendientes)
+        except FileNotFoundError:
+            continue
+        except Exception as e:
+            print(f"Error al leer la posición de {ruta}: {e}")
+    return posiciones
+
+
+def _reubicar_posiciones(posiciones, calientes, largo, segmento, actual, granularidad):
+    """Mueve cada posición al mismo evento dentro del segmento reescrito"""
+    for ruta, (datos, cursor, pendientes) in posiciones.items():
+        # Lo pendiente es lo último que se escribió; si algo pasó al archivo
+        # comprimido la posición ya no tiene equivalente y se relee todo
+        if any(clave_particion(evento.get("timestamp", ""), granularidad) < actual for evento in pendientes):
+            continue
+        sin_leer = registro_eventos.serializar_eventos(calientes[len(calientes) - len(pendientes):])
+        cursor.reubicar(segmento, largo - len(sin_leer.encode('utf-8')))
+        datos["posicion"] = cursor.estado()
+        try:
+            temporal = f"{ruta}.{os.getpid()}.tmp"
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump(datos, f, ensure_ascii=False)
+            os.replace(temporal, ruta)
+        except Exception as e:
+            print(f"Error al actualizar la posición de {ruta}: {e}")
+
+
+def compactar(archivo=registro_eventos.ARCHIVO_EVENTOS, directorio=DIRECTORIO_ARCHIVO,
+              granularidad=None, posiciones=None):
+    """Mueve los eventos de particiones frías al archivo comprimido"""
+    actual = particion_actual(granularidad)
+    os.makedirs(directorio, exist_ok=True)
+    movidos = 0
+
+    with registro_eventos.bloqueo_archivo(archivo):
+        if os.path.exists(registro_eventos.ARCHIVO_LEGADO):
+            import migrar_logs
+            migrar_logs.migrar_legado(registro_eventos.ARCHIVO_LEGADO, archivo)
+            guardadas = {}
+        else:
+            # Antes de mover nada: cuántos eventos le faltan leer a cada posición
+            guardadas = _leer_posiciones(rutas_posiciones(archivo) if posiciones is None else posiciones,
+                                         archivo)
+
+        # El segmento activo se rota para que la partición caliente empiece vacía
+        if os.path.exists(archivo) and os.path.getsize(archivo) > 0:
+            registro_eventos.rotar_segmento(archivo)
+
+        segmentos = registro_eventos.segmentos_rotados(archivo)
+        frios = {}
+        calientes = []
+        for ruta in segmentos:
+            for evento in registro_eventos.leer_segmento(ruta):
+                clave = clave_particion(evento.get("timestamp", ""), granularidad)
+                if clave < actual:
+                    frios.setdefault(clave, []).append(evento)
+                else:
+                    calientes.append(evento)
+
+        existentes = dict(particiones(directorio))
+        for clave, eventos in frios.items():
+            if clave in existentes:
+                eventos = list(leer_particion(existentes[clave])) + eventos
+            eventos.sort(key=lambda evento: evento.get("timestamp", ""))
+            destino = existentes.get(clave) or _ruta_nueva(directorio, clave)
+            escribir_particion(destino, eventos)
+            movidos += len(frios[clave])
+
+        # Los eventos calientes quedan en un único segmento rotado
+        segmento = registro_eventos.ruta_segmento(1, archivo)
+        contenido = registro_eventos.serializar_eventos(calientes).encode('utf-8')
+        if calientes:
+            temporal = segmento + ".tmp"
+            with open(temporal, 'wb') as f:
+                f.write(contenido)
+        for ruta in segmentos:
+            os.remove(ruta)
+        if calientes:
+            os.replace(temporal, segmento)
+        _reubicar_posiciones(guardadas, calientes, len(contenido), segmento, actual, granularidad)
+
+    return movidos
+
+
+def compactar_si_necesario(archivo=registro_eventos.ARCHIVO_EVENTOS, granularidad=None):
+    """Compacta solo si algún segmento se escribió por última vez antes de la partición actual"""
+    limite = inicio_particion(particion_actual(granularidad)).timestamp()
+    segmentos = registro_eventos.segmentos_rotados(archivo)
+    if os.path.exists(archivo) and os.path.getsize(archivo) > 0:
+        segmentos.append(archivo)
+    if os.path.exists(registro_eventos.ARCHIVO_LEGADO):
+        segmentos.append(registro_eventos.ARCHIVO_LEGADO)
+    if any(os.path.getmtime(ruta) < limite for ruta in segmentos):
+        return compactar(archivo, granularidad=granularidad)
+    return 0
+
+
+def aplicar_retencion(maximo_particiones, directorio=DIRECTORIO_ARCHIVO,
+                      archivo=registro_eventos.ARCHIVO_EVENTOS):
+    """Elimina las particiones archivadas más antiguas que excedan el máximo
+
+    Los eventos eliminados se restan de los agregados guardados, que los
+    incluían, para que los contadores del panel coincidan con lo que queda.
+    """
+    import agregados_logs
+
+    with registro_eventos.bloqueo_archivo(archivo):
+        archivadas = particiones(directorio)
+        eliminadas = archivadas[:max(0, len(archivadas) - maximo_particiones)]
+        agregados = agregados_logs.AgregadosLogs(archivo)
+        guardados = bool(eliminadas) and agregados.cargar()
+        for _, ruta in eliminadas:
+            if guardados:
+                agregados.descontar(leer_particion(ruta))
+            os.remove(ruta)
+        if guardados:
+            try:
+                agregados.guardar()
+            except Exception as e:
+                print(f"Error al guardar agregados: {e}")
+    return [clave for clave, _ in eliminadas]
+
+
+if __name__ == "__main__":
+    granularidad = "dia" if "--dia" in sys.argv else None
+    print(f"Eventos archivados: {compactar(granularidad=granularidad)}")
+    if "--retener" in sys.argv:
+        maximo = int(sys.argv[sys.argv.index("--retener") + 1])
+        print(f"Particiones eliminadas: {aplicar_retencion(maximo)}")
@@ -0,0 +1,224 @@
+# servicio_inferencia.py
+# Servicio local de inferencia compartido por todas las ventanas de análisis.
+#
+# Cada inicio de sesión abre un intérprete nuevo de Ecuador_interfaz_mejorado.py;
+# sin el servicio, cada uno carga su propia copia del modelo. El servicio
+# carga el modelo una sola vez y atiende por HTTP en 127.0.0.1:PUERTO_SERVICIO
+# (variable de entorno FISURAS_PUERTO):
+#
+#   GET  /estado           {"cargado", "version", "backend", "error"}
+#   POST /clasificar       {"texto": "..."}     -> {"resultado": [clase, probabilidad, probabilidades], "version"}
+#   POST /clasificar_lote  {"textos": [...]}    -> {"resultados": [...], "version"}
+#   POST /embeddings       {"textos": [...]}    -> {"vectores": [[...], ...], "version"}
+#
+# El servidor empieza a escuchar antes de cargar el modelo: una ventana que
+# lo encuentra mientras carga espera la respuesta en lugar de cargar otra
+# copia. Las pasadas del modelo se hacen de a una (varias a la vez solo
+# competirían por los mismos núcleos); un lote grande se procesa por partes
+# de TEXTOS_POR_TURNO y suelta el modelo entre una y otra, para que las
+# ventanas interactivas no esperen a que termine.
+#
+# Solo se aceptan POST con Content-Type application/json y sin encabezado
+# Origin: una página web abierta en el navegador no puede usar el servicio
+# (sus POST "simples" no son JSON y siempre llevan Origin).
+#
+# Uso: python servicio_inferencia.py [--puerto N]
+# Con FISURAS_SERVICIO=auto, el inicio de sesión lo arranca si no está corriendo.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from modelo_fisuras import TAMANO_LOTE, ClasificadorFisuras
+
+PUERTO_SERVICIO = int(os.environ.get("FISURAS_PUERTO", "47814"))
+
+# Tamaño máximo de una petición (un lote grande de descripciones)
+MAX_CUERPO = 16 * 1024 * 1024
+
+# Segundos de espera para saber si el servicio está corriendo
+ESPERA_ESTADO = 0.5
+
+# Segundos de espera de una clasificación; incluye la carga del modelo si recién arrancó
+ESPERA_CLASIFICACION = 300
+
+# Textos de un lote que se procesan antes de ceder el modelo a otras peticiones
+TEXTOS_POR_TURNO = TAMANO_LOTE
+
+
+class ManejadorInferencia(BaseHTTPRequestHandler):
+    """Atiende las peticiones con el clasificador del servidor"""
+
+    def _responder(self, codigo, datos):
+        cuerpo = json.dumps(datos, ensure_ascii=False).encode("utf-8")
+        self.send_response(codigo)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def _origen_externo(self):
+        """True si la petición viene de una página web; se responde 403"""
+        if self.headers.get("Origin") is None:
+            return False
+        self._responder(403, {"error": "solo se aceptan peticiones locales sin Origin"})
+        return True
+
+    def _por_turnos(self, funcion, textos, tamano_lote):
+        """Aplica funcion por partes, tomando el modelo solo durante cada una"""
+        resultados = []
+        for inicio in range(0, len(textos), TEXTOS_POR_TURNO):
+            with self.server.bloqueo_modelo:
+                resultados.extend(funcion(textos[inicio:inicio + TEXTOS_POR_TURNO], tamano_lote))
+        return resultados
+
+    def do_GET(self):
+        if self._origen_externo():
+            return
+        if self.path != "/estado":
+            self._responder(404, {"error": "ruta desconocida"})
+            return
+        clasificador = self.server.clasificador
+        self._responder(200, {
+            "cargado": clasificador.cargado,
+            "version": clasificador.version or clasificador.version_en_disco(),
+            "backend": clasificador.backend,
+            "error": clasificador.error,
+        })
+
+    def do_POST(self):
+        if self._origen_externo():
+            return
+        if self.path not in ("/clasificar", "/clasificar_lote", "/embeddings"):
+            self._responder(404, {"error": "ruta desconocida"})
+            return
+        tipo = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+        if tipo != "application/json":
+            self._responder(415, {"error": "se espera Content-Type: application/json"})
+            return
+        largo = int(self.headers.get("Content-Length") or 0)
+        if largo > MAX_CUERPO:
+            self._responder(413, {"error": "petición demasiado grande"})
+            return
+        try:
+            peticion = json.loads(self.rfile.read(largo) or b"{}")
+        except ValueError:
+            self._responder(400, {"error": "JSON inválido"})
+            return
+
+        clasificador = self.server.clasificador
+        if not clasificador.cargar():
+            self._responder(503, {"error": clasificador.error})
+            return
+        textos = peticion.get("textos") or []
+        tamano_lote = int(peticion.get("tamano_lote") or TAMANO_LOTE)
+        if self.path == "/clasificar":
+            with self.server.bloqueo_modelo:
+                respuesta = {"resultado": clasificador.clasificar(peticion.get("texto") or "")}
+        elif self.path == "/embeddings":
+            try:
+                vectores = self._por_turnos(lambda parte, lote: clasificador.embeddings(parte, lote).tolist(),
+                                            textos, tamano_lote)
+            except Exception as e:
+                self._responder(501, {"error": str(e)})
+                return
+            respuesta = {"vectores": vectores}
+        else:
+            respuesta = {"resultados": self._por_turnos(clasificador.clasificar_lote, textos, tamano_lote)}
+        respuesta["version"] = clasificador.version
+        self._responder(200, respuesta)
+
+    def log_message(self, formato, *argumentos):
+        # Sin una línea por petición en la consola
+        pass
+
+
+def servir(puerto=PUERTO_SERVICIO, clasificador=None):
+    """Atiende peticiones hasta que se interrumpa el proceso"""
+    servidor = ThreadingHTTPServer(("127.0.0.1", puerto), ManejadorInferencia)
+    servidor.daemon_threads = True
+    servidor.clasificador = clasificador or ClasificadorFisuras()
+    servidor.bloqueo_modelo = threading.Lock()
+    servidor.clasificador.calentar_en_segundo_plano(
+        al_terminar=lambda ok: print(f"Modelo {servidor.clasificador.version} listo" if ok
+                                     else servidor.clasificador.error))
+    print(f"Servicio de inferencia en http://127.0.0.1:{puerto}")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        servidor.server_close()
+
+
+def iniciar_en_segundo_plano(puerto=PUERTO_SERVICIO):
+    """Arranca el servicio en un proceso independiente si todavía no está corriendo"""
+    if ClienteInferencia(puerto).estado() is not None:
+        return False
+    archivo = os.path.join(os.path.dirname(os.path.abspath(__file__)), "servicio_inferencia.py")
+    opciones = {}
+    if sys.platform == "win32":
+        opciones["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        # Sobrevive al cierre de la ventana que lo lanzó
+        opciones["start_new_session"] = True
+    subprocess.Popen([sys.executable, archivo, "--puerto", str(puerto)], cwd=os.path.dirname(archivo),
+                     stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, **opciones)
+    return True
+
+
+class ClienteInferencia:
+    """Cliente del servicio; los errores de conexión se propagan como OSError"""
+
+    def __init__(self, puerto=PUERTO_SERVICIO):
+        self.url = f"http://127.0.0.1:{puerto}"
+        self.version = None
+
+    def _pedir(self, ruta, datos=None, espera=ESPERA_CLASIFICACION):
+        cuerpo = None if datos is None else json.dumps(datos, ensure_ascii=False).encode("utf-8")
+        peticion = urllib.request.Request(self.url + ruta, data=cuerpo,
+                                          headers={"Content-Type": "application/json"})
+        try:
+            with urllib.request.urlopen(peticion, timeout=espera) as respuesta:
+                return json.loads(respuesta.read())
+        except urllib.error.HTTPError as e:
+            # 503: el servicio no pudo cargar el modelo
+            raise OSError(f"El servicio de inferencia respondió {e.code}") from e
+
+    def estado(self):
+        """Estado del servicio, o None si no está corriendo"""
+        try:
+            estado = self._pedir("/estado", espera=ESPERA_ESTADO)
+        except (OSError, ValueError):
+            return None
+        self.version = estado.get("version")
+        return estado
+
+    def clasificar(self, texto):
+        """Igual que ClasificadorFisuras.clasificar, resuelto por el servicio"""
+        respuesta = self._pedir("/clasificar", {"texto": texto})
+        self.version = respuesta["version"]
+        return tuple(respuesta["resultado"])
+
+    def clasificar_lote(self, textos, tamano_lote=TAMANO_LOTE):
+        respuesta = self._pedir("/clasificar_lote", {"textos": list(textos), "tamano_lote": tamano_lote})
+        self.version = respuesta["version"]
+        return [tuple(resultado) for resultado in respuesta["resultados"]]
+
+    def embeddings(self, textos):
+        """Vectores de oración (listas de floats); OSError si el backend del servicio no los calcula"""
+        respuesta = self._pedir("/embeddings", {"textos": list(textos)})
+        self.version = respuesta["version"]
+        return respuesta["vectores"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Servicio local de inferencia del clasificador de fisuras")
+    parser.add_argument("--puerto", type=int, default=PUERTO_SERVICIO)
+    argumentos = parser.parse_args()
+    servir(argumentos.puerto)
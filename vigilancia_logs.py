@@ -0,0 +1,125 @@
+# vigilancia_logs.py
+# Aviso de cambios en el log para que el panel se actualice solo.
+#
+# Después de cada escritura en grupo, los procesos que registran eventos
+# envían un datagrama UDP vacío a 127.0.0.1:PUERTO_NOTIFICACION (sin esperar
+# respuesta ni fallar si nadie escucha). El panel escucha ese puerto y, si no
+# puede tomarlo (por ejemplo, otro panel abierto), revisa el log cada
+# INTERVALO_SONDEO segundos. En ambos casos los avisos se agrupan para no
+# refrescar la interfaz más de una vez por INTERVALO_MINIMO.
+import os
+import socket
+import threading
+import time
+
+PUERTO_NOTIFICACION = int(os.environ.get("SISTEMA_LOGS_PUERTO", "47813"))
+
+# Tiempo mínimo entre dos refrescos de la interfaz (s)
+INTERVALO_MINIMO = 1.0
+
+# Cada cuánto se revisa el log aunque no lleguen avisos (s)
+INTERVALO_SONDEO = 5.0
+
+_socket_aviso = None
+
+
+def notificar_cambio(puerto=PUERTO_NOTIFICACION):
+    """Avisa a un panel que escuche que hay eventos nuevos"""
+    global _socket_aviso
+    try:
+        if _socket_aviso is None:
+            _socket_aviso = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        _socket_aviso.sendto(b"", ("127.0.0.1", puerto))
+    except OSError:
+        # Nadie escuchando o red local no disponible: el panel sondea igual
+        pass
+
+
+class VigilanteLogs:
+    """Hilo que llama a `al_cambiar` cuando hay avisos de cambios, con límite de frecuencia"""
+
+    def __init__(self, al_cambiar, puerto=PUERTO_NOTIFICACION,
+                 intervalo_minimo=INTERVALO_MINIMO, intervalo_sondeo=INTERVALO_SONDEO):
+        self.al_cambiar = al_cambiar
+        self.puerto = puerto
+        self.intervalo_minimo = intervalo_minimo
+        self.intervalo_sondeo = intervalo_sondeo
+        self.detenido = threading.Event()
+        self.hilo = None
+        self.receptor = None
+
+    @property
+    def activo(self):
+        return self.hilo is not None and self.hilo.is_alive()
+
+    @property
+    def escuchando(self):
+        """True si recibe avisos; False si solo sondea"""
+        return self.receptor is not None
+
+    def iniciar(self):
+        if self.activo and not self.detenido.is_set():
+            return
+        if self.hilo is not None:
+            # Un hilo anterior detenido puede seguir en recv: se espera a que suelte el puerto
+            self.hilo.join(timeout=1.0)
+        # Evento y socket nuevos para cada hilo: el anterior sigue viendo los suyos detenidos
+        self.detenido = threading.Event()
+        try:
+            self.receptor = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.receptor.bind(("127.0.0.1", self.puerto))
+        except OSError as e:
+            print(f"Sin avisos de cambios (puerto {self.puerto}: {e}); se revisa el log periódicamente")
+            self.receptor = None
+        self.hilo = threading.Thread(target=self._ejecutar, args=(self.detenido, self.receptor),
+                                     name="vigilante-logs", daemon=True)
+        self.hilo.start()
+
+    def detener(self):
+        self.detenido.set()
+        if self.receptor is not None:
+            try:
+                # En Linux close() no despierta un recv bloqueado; shutdown() sí
+                self.receptor.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self.receptor.close()
+            self.receptor = None
+
+    def _esperar_aviso(self, receptor, detenido):
+        """Bloquea hasta un aviso o hasta el próximo sondeo"""
+        if receptor is None:
+            detenido.wait(self.intervalo_sondeo)
+            return
+        try:
+            receptor.settimeout(self.intervalo_sondeo)
+            receptor.recv(1)
+        except (socket.timeout, OSError):
+            pass
+
+    def _descartar_avisos(self, receptor):
+        # Los avisos que llegaron durante la espera se atienden con el mismo refresco
+        if receptor is None:
+            return
+        try:
+            receptor.setblocking(False)
+            while True:
+                receptor.recv(1)
+        except (BlockingIOError, OSError):
+            pass
+
+    def _ejecutar(self, detenido, receptor):
+        ultimo = 0.0
+        while not detenido.is_set():
+            self._esperar_aviso(receptor, detenido)
+            if detenido.is_set():
+                break
+            espera = ultimo + self.intervalo_minimo - time.monotonic()
+            if espera > 0 and detenido.wait(espera):
+                break
+            self._descartar_avisos(receptor)
+            ultimo = time.monotonic()
+            try:
+                self.al_cambiar()
+            except Exception as e:
+                print(f"Error al actualizar el panel: {e}")
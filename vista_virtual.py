@@ -0,0 +1,259 @@
+# vista_virtual.py
+# Tabla de historial virtualizada para el panel de administrador.
+#
+# En lugar de un DataTable con un control por evento, la vista mantiene un
+# grupo fijo de FILAS_VISIBLES filas y al desplazarse solo cambia el texto de
+# esas filas, así que cada actualización envía unas pocas propiedades sin
+# importar cuántos eventos haya. Los eventos se piden por bloques a medida
+# que el desplazamiento se acerca al final de lo ya cargado y de cada uno
+# solo se guardan los valores de sus celdas. En memoria quedan solo el
+# primer bloque y los BLOQUES_EN_MEMORIA bloques alrededor de la ventana
+# visible; de los demás se guarda el timestamp desde el que se piden, y se
+# vuelven a cargar si el usuario regresa a ellos.
+#
+# El primer bloque no se descarta: pedirlo de nuevo traería también los
+# eventos llegados después, que ya se muestran aparte. Esos eventos en vivo
+# se guardan en `recientes` mientras el usuario está desplazado; al volver
+# arriba la vista se reancla en los más recientes y `recientes` se vacía.
+import threading
+
+import flet as ft
+
+FILAS_VISIBLES = 12
+ALTO_FILA = 36
+TAMANO_BLOQUE = 500
+BLOQUES_EN_MEMORIA = 3
+
+
+class Columna:
+    """Columna de la vista: título, ancho fijo (None = ocupa el resto) y si se muestra como insignia"""
+
+    def __init__(self, titulo, ancho=None, insignia=False):
+        self.titulo = titulo
+        self.ancho = ancho
+        self.insignia = insignia
+
+
+class HistorialVirtual:
+    """Vista de historial que solo construye las filas visibles
+
+    `celdas(evento)` devuelve un valor por columna (texto, o (texto, color)
+    para las insignias) y `cargar(antes_de, limite)` devuelve eventos del más
+    nuevo al más viejo, como consultas_logs.consultar.
+    """
+
+    def __init__(self, columnas, celdas, cargar, color_encabezado=ft.Colors.BLUE_50,
+                 filas_visibles=FILAS_VISIBLES, tamano_bloque=TAMANO_BLOQUE):
+        self.columnas = columnas
+        self.celdas = celdas
+        self.cargar = cargar
+        self.filas_visibles = filas_visibles
+        self.tamano_bloque = tamano_bloque
+        self.inicio = 0
+        self._vaciar()
+        self.bloqueo = threading.RLock()
+
+        self.grupo = [self._crear_fila() for _ in range(filas_visibles)]
+        self.texto_posicion = ft.Text("Sin eventos", size=12, color=ft.Colors.GREY_600)
+        self.barra = ft.Slider(min=0, max=1, value=0, expand=True, on_change=self._al_mover_barra)
+        encabezado = ft.Container(
+            content=ft.Row(
+                controls=[self._celda(ft.Text(columna.titulo, weight=ft.FontWeight.BOLD), columna)
+                          for columna in columnas],
+                spacing=10,
+            ),
+            bgcolor=color_encabezado,
+            padding=ft.padding.symmetric(horizontal=10, vertical=8),
+        )
+        cuerpo = ft.GestureDetector(
+            content=ft.Column(controls=[fila for fila, _ in self.grupo], spacing=0),
+            on_scroll=self._al_desplazar,
+        )
+        self.control = ft.Column(
+            controls=[
+                ft.Container(
+                    content=ft.Column(controls=[encabezado, cuerpo], spacing=0),
+                    border=ft.border.all(1, ft.Colors.GREY_300),
+                    border_radius=8,
+                ),
+                ft.Row(
+                    controls=[
+                        ft.IconButton(icon=ft.Icons.KEYBOARD_ARROW_UP, tooltip="Más recientes",
+                                      on_click=lambda e: self.desplazar(-self.filas_visibles)),
+                        ft.IconButton(icon=ft.Icons.KEYBOARD_ARROW_DOWN, tooltip="Más antiguos",
+                                      on_click=lambda e: self.desplazar(self.filas_visibles)),
+                        self.barra,
+                        self.texto_posicion,
+                    ],
+                ),
+            ],
+            spacing=5,
+        )
+
+    def _celda(self, contenido, columna):
+        if columna.ancho is None:
+            return ft.Container(content=contenido, expand=True)
+        return ft.Container(content=contenido, width=columna.ancho)
+
+    def _crear_fila(self):
+        """Crea una fila reutilizable; devuelve (control, controles de texto por columna)"""
+        textos = []
+        celdas = []
+        for columna in self.columnas:
+            if columna.insignia:
+                texto = ft.Text("", color=ft.Colors.WHITE, size=11, weight=ft.FontWeight.BOLD)
+                contenido = ft.Container(content=texto, padding=5, border_radius=5)
+            else:
+                texto = ft.Text("", max_lines=1, overflow=ft.TextOverflow.ELLIPSIS)
+                contenido = texto
+            textos.append((texto, contenido))
+            celdas.append(self._celda(contenido, columna))
+        fila = ft.Container(
+            content=ft.Row(controls=celdas, spacing=10),
+            height=ALTO_FILA,
+            padding=ft.padding.symmetric(horizontal=10),
+            border=ft.border.only(bottom=ft.border.BorderSide(1, ft.Colors.GREY_200)),
+            visible=False,
+        )
+        return fila, textos
+
+    def _vaciar(self):
+        # Valores de celdas de los eventos agregados en vivo, del más nuevo al más viejo
+        self.recientes = []
+        # Valores de celdas por número de bloque del historial cargado
+        self.bloques = {}
+        # antes_de de cada bloque: timestamp del último evento del bloque anterior
+        self.cursores = [None]
+        self.cargadas = 0
+        self.agotado = False
+
+    def _reanclar(self):
+        """Con la vista arriba, vuelve a pedir el primer bloque para que incluya los eventos en vivo"""
+        if self.inicio or not self.recientes:
+            return
+        self._vaciar()
+        self._asegurar_cargadas(self.filas_visibles + 1)
+
+    def _pedir(self, numero):
+        """Eventos del bloque `numero`, del más nuevo al más viejo"""
+        try:
+            return self.cargar(self.cursores[numero], self.tamano_bloque)
+        except Exception as e:
+            print(f"Error al cargar historial: {e}")
+            return []
+
+    def _total(self):
+        return len(self.recientes) + self.cargadas
+
+    def _cargar_bloque(self):
+        """Pide el siguiente bloque de eventos más viejos"""
+        if self.agotado:
+            return
+        numero = len(self.cursores) - 1
+        eventos = self._pedir(numero)
+        self.agotado = len(eventos) < self.tamano_bloque
+        self.bloques[numero] = [self.celdas(evento) for evento in eventos]
+        self.cargadas += len(eventos)
+        if not self.agotado:
+            self.cursores.append(eventos[-1].get('timestamp', ''))
+
+    def _asegurar_cargadas(self, hasta):
+        while self._total() < hasta and not self.agotado:
+            self._cargar_bloque()
+            # Al saltar lejos con la barra, los bloques intermedios no se acumulan
+            self._descartar_lejanos(hasta - 1)
+
+    def _bloque(self, indice):
+        """(número de bloque, posición dentro de él) de una fila del historial"""
+        return divmod(max(0, indice - len(self.recientes)), self.tamano_bloque)
+
+    def _descartar_lejanos(self, indice):
+        """Libera los bloques que no están cerca de la fila `indice` (salvo el primero)"""
+        centro, _ = self._bloque(indice)
+        radio = BLOQUES_EN_MEMORIA // 2
+        for numero in [numero for numero in self.bloques if numero and abs(numero - centro) > radio]:
+            del self.bloques[numero]
+
+    def _fila(self, indice):
+        """Valores de celdas de la fila `indice`; None si ya no existe"""
+        if indice < len(self.recientes):
+            return self.recientes[indice]
+        numero, posicion = self._bloque(indice)
+        if numero not in self.bloques:
+            self.bloques[numero] = [self.celdas(evento) for evento in self._pedir(numero)]
+        bloque = self.bloques[numero]
+        return bloque[posicion] if posicion < len(bloque) else None
+
+    def _renderizar(self):
+        """Vuelca en el grupo de filas los eventos de la ventana actual"""
+        total = self._total()
+        for posicion, (fila, textos) in enumerate(self.grupo):
+            indice = self.inicio + posicion
+            valores = self._fila(indice) if indice < total else None
+            if valores is None:
+                fila.visible = False
+                continue
+            fila.visible = True
+            for (texto, contenido), valor in zip(textos, valores):
+                if isinstance(valor, tuple):
+                    texto.value, contenido.bgcolor = valor
+                else:
+                    texto.value = valor
+
+        self.barra.max = max(1, total - self.filas_visibles)
+        self.barra.value = min(self.inicio, self.barra.max)
+        self.barra.disabled = total <= self.filas_visibles
+        if total:
+            fin = min(total, self.inicio + self.filas_visibles)
+            mas = "" if self.agotado else "+"
+            self.texto_posicion.value = f"{self.inicio + 1}–{fin} de {total}{mas}"
+        else:
+            self.texto_posicion.value = "Sin eventos"
+
+    def _actualizar_control(self):
+        # Solo si la vista ya está en la página; si no, se envía al agregarla
+        if self.control.page is not None:
+            self.control.update()
+
+    def reiniciar(self):
+        """Descarta lo cargado y vuelve a los eventos más recientes (p. ej. al cambiar filtros)"""
+        with self.bloqueo:
+            self._vaciar()
+            self.inicio = 0
+            self._asegurar_cargadas(self.filas_visibles)
+            self._renderizar()
+
+    def ir_a(self, indice):
+        """Muestra la ventana que empieza en `indice`"""
+        with self.bloqueo:
+            # Una fila de más para saber si la barra puede seguir avanzando
+            self._asegurar_cargadas(int(indice) + self.filas_visibles + 1)
+            maximo = max(0, self._total() - self.filas_visibles)
+            self.inicio = max(0, min(int(indice), maximo))
+            self._reanclar()
+            self._renderizar()
+            self._descartar_lejanos(self.inicio)
+        self._actualizar_control()
+
+    def desplazar(self, filas):
+        self.ir_a(self.inicio + filas)
+
+    def agregar_nuevos(self, eventos):
+        """Agrega eventos nuevos (del más viejo al más nuevo) al inicio de la vista"""
+        if not eventos:
+            return
+        with self.bloqueo:
+            self.recientes[0:0] = [self.celdas(evento) for evento in reversed(eventos)]
+            # Si el usuario se desplazó, la ventana sigue mostrando los mismos eventos
+            if self.inicio:
+                self.inicio += len(eventos)
+            self._reanclar()
+            self._renderizar()
+
+    def _al_desplazar(self, e):
+        # La rueda del mouse mueve de a tres filas
+        paso = 3 if (e.scroll_delta_y or 0) > 0 else -3
+        self.desplazar(paso)
+
+    def _al_mover_barra(self, e):
+        self.ir_a(e.control.value)